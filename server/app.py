@@ -13,9 +13,15 @@ import os
 import logging
 import textwrap
 import re
+import sys
+import time
 from datetime import datetime
 from uuid import uuid4
 
+# 与 ChatCFD 流水线共用的模型路由（src/model_router.py，仅依赖标准库）
+sys.path.insert(0, os.getenv("CHATCFD_SRC_DIR") or str(Path(__file__).resolve().parent.parent / "src"))
+import model_router
+
 # ---------- 日志 ----------
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("cfd-orchestrator")
@@ -55,6 +61,9 @@ LLM_MODEL = os.getenv("LLM_MODEL", "")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
 LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
 LLM_FORCE_JSON = os.getenv("LLM_FORCE_JSON", "1")
+# 额外的 OpenAI 兼容后端（如本地 vLLM），JSON 列表：[{"name", "role": "chat"|"reasoner", "base_url", "model", "api_key"}]
+LLM_FALLBACK_BACKENDS = os.getenv("LLM_FALLBACK_BACKENDS", "[]")
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", "60"))
 
 # ---------- Profile 注册表（两套 Intent 并存） ----------
 PROFILE_REGISTRY: Dict[str, dict] = {
@@ -663,11 +672,11 @@ def build_user_prompt(user_request: str, template_obj: dict) -> str:
         json.dumps(template_obj, ensure_ascii=False, indent=2)
     )
 
-def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict]:
-    if not model_alias:
-        return None
-    presets = {
+def frontend_model_presets() -> Dict[str, dict]:
+    return {
         "deepseek-v1": {
+            "name": "deepseek-v1",
+            "role": model_router.CHAT,
             "base_url": os.getenv("DEEPSEEK_BASE_URL") or LLM_BASE_URL,
             "path": os.getenv("DEEPSEEK_COMPLETIONS_PATH") or LLM_COMPLETIONS_PATH,
             "model": os.getenv("DEEPSEEK_CHAT_MODEL") or LLM_MODEL,
@@ -676,6 +685,8 @@ def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict
             "supports_response_format": True,
         },
         "deepseek-r1": {
+            "name": "deepseek-r1",
+            "role": model_router.REASONER,
             "base_url": os.getenv("DEEPSEEK_BASE_URL") or LLM_BASE_URL,
             "path": os.getenv("DEEPSEEK_COMPLETIONS_PATH") or LLM_COMPLETIONS_PATH,
             "model": os.getenv("DEEPSEEK_REASONER_MODEL") or LLM_MODEL,
@@ -684,6 +695,8 @@ def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict
             "supports_response_format": True,
         },
         "deepseek-reasoner": {
+            "name": "deepseek-reasoner",
+            "role": model_router.REASONER,
             "base_url": os.getenv("DEEPSEEK_BASE_URL") or LLM_BASE_URL,
             "path": os.getenv("DEEPSEEK_COMPLETIONS_PATH") or LLM_COMPLETIONS_PATH,
             "model": os.getenv("DEEPSEEK_REASONER_MODEL") or LLM_MODEL,
@@ -692,6 +705,8 @@ def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict
             "supports_response_format": True,
         },
         "gpt-4o-mini": {
+            "name": "gpt-4o-mini",
+            "role": model_router.CHAT,
             "base_url": os.getenv("OPENAI_BASE_URL") or LLM_BASE_URL,
             "path": os.getenv("OPENAI_COMPLETIONS_PATH") or LLM_COMPLETIONS_PATH,
             "model": os.getenv("OPENAI_GPT4O_MINI_MODEL") or LLM_MODEL,
@@ -700,6 +715,8 @@ def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict
             "supports_response_format": True,
         },
         "ally-x1": {
+            "name": "ally-x1",
+            "role": model_router.CHAT,
             "base_url": os.getenv("ALLY_BASE_URL") or LLM_BASE_URL,
             "path": os.getenv("ALLY_COMPLETIONS_PATH") or LLM_COMPLETIONS_PATH,
             "model": os.getenv("ALLY_MODEL") or LLM_MODEL,
@@ -708,13 +725,86 @@ def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict
             "supports_response_format": True,
         },
     }
-    return presets.get(model_alias)
-    
+
+def get_override_for_frontend_model(model_alias: Optional[str]) -> Optional[dict]:
+    if not model_alias:
+        return None
+    return frontend_model_presets().get(model_alias)
+
+_LLM_ROUTER: Optional[model_router.ModelRouter] = None
+
+def _backend_key(cfg: dict) -> Tuple[str, str, str]:
+    return ((cfg.get("base_url") or "").rstrip("/"), cfg.get("path") or LLM_COMPLETIONS_PATH, cfg.get("model") or "")
+
+def get_llm_router() -> model_router.ModelRouter:
+    """预设模型与 LLM_FALLBACK_BACKENDS 组成的路由，同一端点同一模型只保留一个后端"""
+    global _LLM_ROUTER
+    if _LLM_ROUTER is None:
+        entries = list(frontend_model_presets().values())
+        try:
+            # 本地服务通常不校验 api_key，沿用 vLLM 的 "EMPTY" 约定
+            entries += [{**entry, "api_key": entry.get("api_key") or "EMPTY"} for entry in json.loads(LLM_FALLBACK_BACKENDS or "[]")]
+        except json.JSONDecodeError as e:
+            log.warning("LLM_FALLBACK_BACKENDS 不是合法 JSON，已忽略：%s", e)
+        backends, seen = [], set()
+        for entry in entries:
+            key = _backend_key(entry)
+            if not key[0] or not key[2] or not entry.get("api_key") or key in seen:
+                continue
+            seen.add(key)
+            backends.append(model_router.Backend.from_dict({**entry, "base_url": key[0], "path": key[1]}))
+        _LLM_ROUTER = model_router.ModelRouter(backends, cooldown=LLM_ROUTER_COOLDOWN)
+    return _LLM_ROUTER
+
+def _routed_candidates(override: Optional[dict]) -> Tuple[Optional[model_router.ModelRouter], List[dict]]:
+    """按健康度与延迟排序的候选后端；override 为前端所选模型，优先尝试"""
+    if not override or not override.get("role"):
+        return None, [override]
+    router = get_llm_router()
+    preferred = next((backend.name for backend in router.backends(override["role"])
+                      if _backend_key(backend.as_dict()) == _backend_key(override)), None)
+    candidates = [backend.as_dict() for backend in router.candidates(override["role"], preferred)]
+    if preferred is None:
+        # 所选模型未进入路由（如缺少配置），仍按原样优先尝试
+        candidates.insert(0, override)
+    return router, candidates
+
 async def call_llm_json_response(
     messages: list,
     override: Optional[dict] = None,
     force_json: Optional[bool] = None,
 ) -> dict:
+    router, candidates = _routed_candidates(override)
+    for index, candidate in enumerate(candidates):
+        start = time.monotonic()
+        try:
+            # 返回非 JSON 也算该后端失败，切换到下一个
+            result = _parse_json_content(await _post_chat_completion(messages, candidate, force_json))
+        except RuntimeError as e:
+            if router is not None and candidate.get("name"):
+                router.record(candidate["name"], time.monotonic() - start, False)
+            if index == len(candidates) - 1:
+                raise
+            log.warning("LLM 后端 %s 失败，切换到 %s：%s", candidate.get("name"), candidates[index + 1].get("name"), e)
+            continue
+        if router is not None and candidate.get("name"):
+            router.record(candidate["name"], time.monotonic() - start, True)
+        return result
+
+def _parse_json_content(content: str) -> dict:
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        start = content.find("{"); end = content.rfind("}")
+        if start >= 0 and end > start:
+            try:
+                return json.loads(content[start:end+1])
+            except json.JSONDecodeError:
+                pass
+        raise RuntimeError(f"模型返回非 JSON：{content[:200]}...")
+
+async def _post_chat_completion(messages: list, override: Optional[dict], force_json: Optional[bool]) -> str:
+    """向单个后端发送请求，返回模型输出文本"""
     base_url = (override.get("base_url") if override else LLM_BASE_URL).rstrip("/")
     path = (override.get("path") if override else LLM_COMPLETIONS_PATH)
     model = (override.get("model") if override else LLM_MODEL)
@@ -754,14 +844,7 @@ async def call_llm_json_response(
             raise RuntimeError(f"请求失败 @ {url} :: {re}")
 
         data = resp.json()
-        content = data["choices"][0]["message"]["content"]
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            start = content.find("{"); end = content.rfind("}")
-            if start >= 0 and end > start:
-                return json.loads(content[start:end+1])
-            raise RuntimeError(f"模型返回非 JSON：{content[:200]}...")
+        return data["choices"][0]["message"]["content"]
 
 async def call_llm_fill_intent(
     user_request: str,
@@ -969,6 +1052,10 @@ def build_multilayer_summary(
 def health():
     return {"ok": True, "service": "cfd-orchestrator-mini", "version": "0.5"}
 
+@app.get("/llm/backends")
+def llm_backends():
+    return {"backends": get_llm_router().stats()}
+
 @app.get("/intent/profiles")
 def list_profiles():
     """供前端渲染“求解器”下拉：返回可用 profile 列表（不兜底）。"""
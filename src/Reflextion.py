@@ -3,11 +3,10 @@ import os
 from datetime import datetime
 from qa_modules import QA_NoContext_deepseek_V3, QA_NoContext_deepseek_R1
 import config
+import reflection_store
+import prompt_context
 
 
-# Global reflection record storage
-reflection_history = [] # Elements are dict, key is error message, value is reflection
-
 def reflextion(running_error, correct_trajectory):
     """Reflect on the reasons for error correction failure and save experience data
     Args:
@@ -16,9 +15,23 @@ def reflextion(running_error, correct_trajectory):
     Returns:
         str: Reflection result
     """
-    global reflection_history
-    
+    job = config.current_job()
+    store = reflection_store.default_store()
+    solver = job.case_info.case_solver
+
     try:
+        # A reflection that already solved this error (in any earlier run) is reused without asking the model
+        reused = store.find_solved(running_error, solver) if store is not None else None
+        if reused is not None:
+            print(f"Reusing stored reflection {reused['id']} from case {reused['case_name']}")
+            job.reflection_history.append({
+                "running_error": running_error,
+                "reflection_result": reused["reflection_result"],
+                "store_id": reused["id"],
+            })
+            job.pending_reflection_ids = [reused["id"]]
+            return reused["reflection_result"]
+
         # Generate reflection prompt
         reflection_prompt = generate_reflection_prompt(running_error, correct_trajectory)
         
@@ -30,12 +43,17 @@ def reflextion(running_error, correct_trajectory):
         reflection_record = {
             "running_error": running_error,
             "reflection_result": reflection_result,
+            "store_id": None,
         }
-        reflection_history.append(reflection_record)
+        if store is not None:
+            files = sorted({file_name for trial in correct_trajectory for file_name in trial})
+            reflection_record["store_id"] = store.add(running_error, reflection_result, solver, files, job.case_name)
+            job.pending_reflection_ids = [reflection_record["store_id"]]
+        job.reflection_history.append(reflection_record)
         
         # # Save to file
         # save_reflection_to_file(reflection_record)
-        # print(f"Reflection completed, saved to file. Current reflection record count: {len(reflection_history)}")
+        # print(f"Reflection completed, saved to file. Current reflection record count: {len(job.reflection_history)}")
         
         return reflection_result
         
@@ -46,21 +64,21 @@ def reflextion(running_error, correct_trajectory):
 def generate_reflection_prompt(running_error, correct_trajectory):
     """Generate reflection prompt"""
     
-    # Build file comparison information
+    # Build file comparison information, modifications as compact diffs
     file_comparison = ""
     for idx, trial in enumerate(correct_trajectory):
-        file_comparison = f"### trial_{idx}:\n"
-        # for 
+        file_comparison += f"### trial_{idx}:\n"
         for file_name, file_change in trial.items():    
             if len(file_change) > 1:
                 file_comparison += f"\nModified file: {file_name} ===\n"
-                file_comparison += f"Original content:\n{file_change[0]}\n"
-                file_comparison += f"Modified content:\n{file_change[1]}\n"
+                file_comparison += f"Changes:\n{prompt_context.file_change_context(file_name, file_change[0], file_change[1])}\n"
             else:
                 file_comparison += f"\n=== New file: {file_name} ===\n"
-                file_comparison += f"Content:\n{file_change[0]}\n"
+                file_comparison += f"Content:\n{prompt_context.compact_foam_file(file_change[0])}\n"
+    file_comparison = prompt_context.truncate_to_tokens(file_comparison, config.run_cfg.prompt_token_budget)
 
-    reflection_prompt = f"""When running the {config.case_name} case using OpenFOAM, the following error occurred:
+    job = config.current_job()
+    reflection_prompt = f"""When running the {job.case_info.case_name} case using OpenFOAM, the following error occurred:
 <error_information>
 {running_error}
 </error_information>
@@ -73,7 +91,7 @@ You have attempted the following modifications to resolve the issue:
 However, the error still persists. Please reflect on the reasons for the task failure, identify the error file causing the error, point out the content that should be checked, consider previous oversights, and describe the actions to be taken next. Example: I tried A and B but forgot C. Next, I will take action D to solve the problem.
 The error could only be caused by incorrect content in the following files:
 <files_list>
-{config.case_info.file_structure}
+{job.case_info.file_structure}
 </files_list>
 
 Please state your reflection content after the title "Reflection:".
@@ -101,6 +119,9 @@ def construct_reflection_context(running_error, reflection_history):
     if context != []:
         if len(context) > 3:
             context = context[-3:]  # Keep at most 3
+        if len(context) < 3:
+            # Reflections of similar errors from earlier runs come before the other errors of this run
+            context.extend(stored_reflections(running_error, 3 - len(context), reflection_history))
         if len(context) < 3:
             context.extend(context_other[-(3-len(context)):])  # Fill up to 3
 
@@ -114,3 +135,24 @@ def construct_reflection_context(running_error, reflection_history):
         relevant_reflections = ""
     return relevant_reflections
 
+def stored_reflections(running_error, k, exclude_records=()):
+    """Most similar reflections of the store for the solver of the current job, excluding those of this job"""
+    store = reflection_store.default_store()
+    if store is None or k <= 0:
+        return []
+    exclude_ids = [record.get("store_id") for record in exclude_records if record.get("store_id") is not None]
+    try:
+        return store.query(running_error, config.current_job().case_info.case_solver, k,
+                           config.run_cfg.reflection_min_similarity, exclude_ids)
+    except Exception as e:
+        print(f"Error occurred while querying the reflection store: {e}")
+        return []
+
+def mark_reflections_solved(job, solved):
+    """Called once the run after a reflection has finished: the reflections used are marked as solved in the store when
+    the run succeeded or failed with a different error
+    """
+    store = reflection_store.default_store()
+    if store is not None and solved and job.pending_reflection_ids:
+        store.mark_solved(job.pending_reflection_ids)
+    job.pending_reflection_ids = []
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import difflib
+import filecmp
+
+"""
+Snapshots of an OpenFOAM case directory, one per correction round.
+File contents are stored once as content-addressed blobs under <case>/.snapshots/objects, so a round only stores
+the files changed since the previous one; a snapshot itself is a small manifest of relative path -> blob.
+"""
+
+SNAPSHOT_DIR = ".snapshots"
+CASE_DIRS = ["0", "constant", "system"]
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def case_files(case_path):
+    """Relative paths of the case files: 0/, constant/ (without the mesh, except polyMesh/boundary) and system/"""
+    files = []
+    for case_dir in CASE_DIRS:
+        for root, dirs, names in os.walk(os.path.join(case_path, case_dir)):
+            rel_root = os.path.relpath(root, case_path)
+            if rel_root == os.path.join("constant", "polyMesh"):
+                dirs[:] = []
+                names = [name for name in names if name == "boundary"]
+            for name in names:
+                files.append(os.path.join(rel_root, name))
+    return sorted(files)
+
+def sync_case_files(source_case, target_case):
+    """Make the case files of target_case identical to those of source_case, e.g. to adopt a candidate correction
+    Returns:
+        changed (list): Relative paths written or removed in target_case
+    """
+    source_files = case_files(source_case)
+    changed = []
+    for rel_path in case_files(target_case):
+        if rel_path not in source_files:
+            os.remove(os.path.join(target_case, rel_path))
+            changed.append(rel_path)
+    for rel_path in source_files:
+        source, target = os.path.join(source_case, rel_path), os.path.join(target_case, rel_path)
+        if os.path.exists(target) and filecmp.cmp(source, target, shallow=False):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        changed.append(rel_path)
+    return changed
+
+class CaseSnapshots:
+    """Snapshot store of one case directory"""
+    def __init__(self, case_path):
+        self.case_path = case_path
+        self.root = os.path.join(case_path, SNAPSHOT_DIR)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.snapshots_dir = os.path.join(self.root, "snapshots")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self._stat_cache = {}       # relative path -> (size, mtime_ns, sha256) of the last snapshot, avoids rehashing unchanged files
+
+    def _case_files(self):
+        return case_files(self.case_path)
+
+    def _blob_path(self, sha):
+        return os.path.join(self.objects_dir, sha[:2], sha)
+
+    def _store_blob(self, path, sha):
+        blob = self._blob_path(sha)
+        if os.path.exists(blob):
+            return
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        # Copied, not linked: the pipeline rewrites case files in place, which would change a linked blob
+        tmp_blob = f"{blob}.{os.getpid()}.tmp"
+        shutil.copyfile(path, tmp_blob)
+        os.replace(tmp_blob, blob)
+
+    def _manifest_path(self, snapshot_id):
+        return os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+
+    def take(self, label="", meta=None):
+        """Snapshot the current state of the case
+        Args:
+            label (str): Free text, e.g. "round_3"
+            meta (dict): Extra information stored with the snapshot
+        Returns:
+            snapshot_id (str): Identifier for restore(), diff() and annotate()
+        """
+        files = {}
+        for rel_path in self._case_files():
+            path = os.path.join(self.case_path, rel_path)
+            stat = os.stat(path)
+            cached = self._stat_cache.get(rel_path)
+            if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                sha = cached[2]
+            else:
+                sha = _sha256(path)
+                self._store_blob(path, sha)
+                self._stat_cache[rel_path] = (stat.st_size, stat.st_mtime_ns, sha)
+            files[rel_path] = sha
+
+        snapshot_id = f"{len(os.listdir(self.snapshots_dir)):04d}"
+        snapshot = {"id": snapshot_id, "label": label, "created": time.time(), "files": files, "meta": meta or {}}
+        with open(self._manifest_path(snapshot_id), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=1)
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        with open(self._manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def list(self):
+        """All snapshots, oldest first"""
+        return [self.get(name[:-len(".json")]) for name in sorted(os.listdir(self.snapshots_dir)) if name.endswith(".json")]
+
+    def annotate(self, snapshot_id, **meta):
+        """Add information to a snapshot, e.g. the outcome of the run started from it"""
+        snapshot = self.get(snapshot_id)
+        snapshot["meta"].update(meta)
+        with open(self._manifest_path(snapshot_id), 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=1)
+
+    def restore(self, snapshot_id):
+        """Put the case files back in the state of a snapshot; only files that differ are written
+        Returns:
+            changed (list): Relative paths written or removed
+        """
+        files = self.get(snapshot_id)["files"]
+        changed = []
+        for rel_path in self._case_files():
+            if rel_path not in files:
+                os.remove(os.path.join(self.case_path, rel_path))
+                self._stat_cache.pop(rel_path, None)
+                changed.append(rel_path)
+        current = self._current_files()
+        for rel_path, sha in files.items():
+            if current.get(rel_path) == sha:
+                continue
+            path = os.path.join(self.case_path, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(self._blob_path(sha), path)
+            stat = os.stat(path)
+            self._stat_cache[rel_path] = (stat.st_size, stat.st_mtime_ns, sha)
+            changed.append(rel_path)
+        return changed
+
+    def checkout(self, snapshot_id, target_path):
+        """Create a separate case directory in the state of a snapshot, the mesh is linked from this case
+        Args:
+            snapshot_id (str): Snapshot to check out
+            target_path (str): New case directory, must not exist yet
+        """
+        for rel_path, sha in self.get(snapshot_id)["files"].items():
+            path = os.path.join(target_path, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(self._blob_path(sha), path)
+
+        polymesh_path = os.path.join(self.case_path, "constant", "polyMesh")
+        if os.path.isdir(polymesh_path):
+            target_polymesh = os.path.join(target_path, "constant", "polyMesh")
+            os.makedirs(target_polymesh, exist_ok=True)
+            for name in os.listdir(polymesh_path):
+                source, target = os.path.join(polymesh_path, name), os.path.join(target_polymesh, name)
+                if name == "boundary" or not os.path.isfile(source) or os.path.exists(target):
+                    continue
+                # The solver only reads the mesh, sharing it between candidate cases is safe
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+
+    def read(self, snapshot_id, rel_path):
+        """Content of a case file in a snapshot, None if the file is not in it"""
+        sha = self.get(snapshot_id)["files"].get(rel_path)
+        if sha is None:
+            return None
+        with open(self._blob_path(sha), 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    def _current_files(self):
+        current = {}
+        for rel_path in self._case_files():
+            stat = os.stat(os.path.join(self.case_path, rel_path))
+            cached = self._stat_cache.get(rel_path)
+            if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                current[rel_path] = cached[2]
+            else:
+                current[rel_path] = _sha256(os.path.join(self.case_path, rel_path))
+        return current
+
+    def _read(self, sha, current_path=None):
+        path = self._blob_path(sha) if sha else current_path
+        if path is None or not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read().splitlines(keepends=True)
+
+    def diff(self, old_id, new_id=None):
+        """Unified diff between two snapshots, or between a snapshot and the current case files
+        Returns:
+            diffs (dict): key is relative path, value is the unified diff of that file
+        """
+        old_files = self.get(old_id)["files"]
+        new_files = self.get(new_id)["files"] if new_id is not None else self._current_files()
+        diffs = {}
+        for rel_path in sorted(set(old_files) | set(new_files)):
+            old_sha, new_sha = old_files.get(rel_path), new_files.get(rel_path)
+            if old_sha == new_sha:
+                continue
+            if new_id is None:
+                new_lines = self._read(None, os.path.join(self.case_path, rel_path))
+            else:
+                new_lines = self._read(new_sha) if new_sha else []
+            diffs[rel_path] = "".join(difflib.unified_diff(
+                self._read(old_sha) if old_sha else [], new_lines,
+                fromfile=f"{old_id}/{rel_path}", tofile=f"{new_id or 'current'}/{rel_path}"))
+        return diffs
@@ -1,9 +1,12 @@
 import os
 import sys
-import yaml
 import json
 import subprocess
+import contextvars
+import hashlib
 
+from copy import deepcopy
+from contextlib import contextmanager
 from dataclasses import dataclass, field, fields
 
 # =========================
@@ -64,12 +67,37 @@ class llm_config:
     DEEPSEEK_R1_BASE_URL : str = field(default="https://api.deepseek.com", metadata={"description": "DeepSeek-R1 API Base URL"})
     DEEPSEEK_R1_MODEL_NAME : str = field(default="deepseek-reasoner", metadata={"description": "R1 model name"})
     R1_temperature: float = field(default=0.9, metadata={"description": "R1 model temperature"})
+    R1_input_price: float = field(default=0.0, metadata={"description": "R1 price in USD per million prompt tokens (cache miss), 0 if unknown"})
+    R1_cache_hit_price: float = field(default=0.0, metadata={"description": "R1 price in USD per million prompt tokens served from the provider cache"})
+    R1_output_price: float = field(default=0.0, metadata={"description": "R1 price in USD per million completion tokens, reasoning included"})
 
     # V3 / chat model configuration
     DEEPSEEK_V3_KEY : str = field(default="", metadata={"description": "DeepSeek-V3 API Key"})
     DEEPSEEK_V3_BASE_URL : str = field(default="https://api.deepseek.com", metadata={"description": "DeepSeek-V3 API Base URL"})
     DEEPSEEK_V3_MODEL_NAME : str = field(default="deepseek-chat", metadata={"description": "V3/chat model name"})
     V3_temperature: float = field(default=0.7, metadata={"description": "V3 model temperature"})
+    V3_input_price: float = field(default=0.0, metadata={"description": "V3 price in USD per million prompt tokens (cache miss), 0 if unknown"})
+    V3_cache_hit_price: float = field(default=0.0, metadata={"description": "V3 price in USD per million prompt tokens served from the provider cache"})
+    V3_output_price: float = field(default=0.0, metadata={"description": "V3 price in USD per million completion tokens"})
+
+    # Resilience of the LLM calls, limits are per provider base URL and shared by all jobs of the process
+    llm_requests_per_minute: float = field(default=120.0, metadata={"description": "Sustained LLM calls per minute per provider, halved on each 429 and recovered on success, 0 for no limit"})
+    llm_burst: int = field(default=20, metadata={"description": "LLM calls that can be made at once per provider after an idle period"})
+    llm_max_concurrent_calls: int = field(default=8, metadata={"description": "LLM calls in flight at the same time across all jobs of the process"})
+    llm_max_retries: int = field(default=5, metadata={"description": "Retries of an LLM call failing with 429, 5xx, a timeout or a connection error"})
+    llm_backoff_base: float = field(default=1.0, metadata={"description": "Seconds of the first retry backoff, doubled at each retry, with full jitter"})
+    llm_backoff_max: float = field(default=60.0, metadata={"description": "Maximum seconds of a retry backoff"})
+    llm_timeout: float = field(default=600.0, metadata={"description": "Seconds before an LLM request times out"})
+    llm_circuit_failure_threshold: int = field(default=5, metadata={"description": "Consecutive failed LLM attempts after which calls to the provider fail fast, 0 to disable"})
+    llm_circuit_cooldown: float = field(default=60.0, metadata={"description": "Seconds the provider circuit stays open before a trial call"})
+
+    # Additional backends per role, tried when the DeepSeek endpoints above fail or are much slower
+    llm_backends: list = field(default_factory=list, metadata={"description": "Extra OpenAI-compatible backends, elements as {\"name\", \"role\": \"chat\" or \"reasoner\", \"base_url\", \"model\", \"api_key\"}, e.g. a local vLLM server"})
+    llm_failover_retries: int = field(default=1, metadata={"description": "Retries of transient errors on a backend before failing over to the next one of its role"})
+    llm_router_slow_factor: float = field(default=2.0, metadata={"description": "Another backend is preferred when the p50 latency of the first one is this many times its own"})
+    llm_router_max_error_rate: float = field(default=0.5, metadata={"description": "Recent error rate above which a backend is skipped until its cooldown has passed"})
+    llm_router_cooldown: float = field(default=60.0, metadata={"description": "Seconds after its last failure before a skipped backend is tried again"})
+    llm_record_path: str = field(default="", metadata={"description": "SQLite file in which every answered LLM call is recorded for replay by mock_llm_server, empty to disable"})
 
 @dataclass
 class run_config:
@@ -80,6 +108,42 @@ class run_config:
     run_time: int = field(default=3, metadata={"description": "Number of runs for a single case"})
     max_running_test_round: int = field(default=30, metadata={"description": "Maximum reflection iteration rounds"})
 
+    reject_bad_mesh: bool = field(default=False, metadata={"description": "Stop a case before running the solver when the mesh fails the quality checks, otherwise only report them to the correction prompts"})
+    max_non_orthogonality: float = field(default=70.0, metadata={"description": "Mesh non-orthogonality threshold in degrees"})
+    max_skewness: float = field(default=4.0, metadata={"description": "Mesh skewness threshold"})
+
+    early_stopping: bool = field(default=True, metadata={"description": "Stop steady runs with stopAt writeNow once converged or stagnated"})
+    residual_tolerance: float = field(default=1e-5, metadata={"description": "Steady run converged when all initial residuals are below this value"})
+    convergence_min_iterations: int = field(default=50, metadata={"description": "Iterations before the convergence monitor takes any decision"})
+    plateau_window: int = field(default=200, metadata={"description": "Iterations over which residual stagnation is measured"})
+    plateau_decades: float = field(default=0.1, metadata={"description": "Steady run stagnated when residuals drop by less than this many decades over plateau_window"})
+    convergence_poll_interval: float = field(default=2.0, metadata={"description": "Seconds between two reads of the solver log"})
+    solver_timeout: float = field(default=0.0, metadata={"description": "Seconds after which a solver run is killed and reported to the correction loop as an error, 0 for no limit"})
+    tracing: str = field(default="", metadata={"description": "Export of the tracing spans of each case: chrome (trace.json in the case directory), otlp (to tracing_otlp_endpoint), both as \"chrome,otlp\", empty to disable"})
+    tracing_otlp_endpoint: str = field(default="http://127.0.0.1:4318/v1/traces", metadata={"description": "OTLP/HTTP JSON endpoint of the trace collector"})
+    correct_stagnated_runs: bool = field(default=False, metadata={"description": "Treat a stagnated steady run as an error for the correction loop instead of a success"})
+    rollback_on_regression: bool = field(default=True, metadata={"description": "Restore the round that ran the most time steps when a correction makes the run fail earlier"})
+
+    speculative_candidates: int = field(default=0, metadata={"description": "Number of alternative corrections generated and smoke-tested in parallel per round, 0 or 1 to correct sequentially"})
+    smoke_test_steps: int = field(default=20, metadata={"description": "Time steps run by the smoke test of a speculative candidate"})
+    speculative_temperature_step: float = field(default=0.2, metadata={"description": "Temperature increase between two speculative candidates"})
+
+    reflection_store: bool = field(default=True, metadata={"description": "Keep reflections in database_dir/reflections.sqlite and reuse them across runs"})
+    reflection_store_max_entries: int = field(default=5000, metadata={"description": "Reflections kept in the store, least recently used unsolved ones are evicted first"})
+    reflection_embedder: str = field(default="hashing", metadata={"description": "Embedding of errors for the reflection store, hashing (no model) or sentence_transformer"})
+    reflection_min_similarity: float = field(default=0.6, metadata={"description": "Cosine similarity above which a stored reflection is added to the prompts"})
+
+    prompt_token_budget: int = field(default=24000, metadata={"description": "Tokens of case file content in one whole-case prompt, files least relevant to the error are left out first"})
+
+    log_compression: str = field(default="", metadata={"description": "Compression of qa_logs.jsonl, empty or zstd (requires the zstandard package)"})
+    log_max_bytes: int = field(default=0, metadata={"description": "Rotate qa_logs.jsonl once larger than this many bytes, 0 to never rotate"})
+    log_backup_count: int = field(default=5, metadata={"description": "Rotated LLM logs kept per case"})
+
+    experience_store: bool = field(default=True, metadata={"description": "Record the fixes that made a case pass in database_dir/experience.sqlite and reuse them"})
+    experience_store_max_entries: int = field(default=5000, metadata={"description": "Fixes kept in the experience store"})
+    apply_known_fixes: bool = field(default=True, metadata={"description": "Replay a recorded fix without asking the LLM when the case files match the state it was made from"})
+    known_fix_examples: int = field(default=2, metadata={"description": "Recorded fixes of similar errors shown as examples in the correction prompts"})
+
 @dataclass
 class pdf_config:
     """PDF processing configuration"""
@@ -103,6 +167,7 @@ class ConfigManager:
         self.llm_config = llm_config()
         self.run_config = run_config()
         self.pdf_config = pdf_config()
+        self.openfoam_env_snapshot = None   # Set by load_openfoam_env()
 
     def _load_config_from_json(self):
         """Load configuration from ChatCFD/inputs/chatcfd_config.json"""
@@ -177,8 +242,6 @@ class ConfigManager:
         os.environ["DEEPSEEK_R1_BASE_URL"] = self.llm_config.DEEPSEEK_R1_BASE_URL
         os.environ["DEEPSEEK_R1_MODEL_NAME"] = getattr(self.llm_config, 'DEEPSEEK_R1_MODEL_NAME', 'deepseek-reasoner')
 
-        self._ensure_directory_exists()  # Ensure all necessary directories exist
-
     def save_config_to_json(self):
         """Save configuration to JSON file"""
         print("----- Saving configuration to JSON -----")
@@ -190,12 +253,62 @@ class ConfigManager:
             "DEEPSEEK_R1_BASE_URL": self.llm_config.DEEPSEEK_R1_BASE_URL,
             "DEEPSEEK_R1_MODEL_NAME": getattr(self.llm_config, 'DEEPSEEK_R1_MODEL_NAME', 'deepseek-reasoner'),
             "R1_temperature": self.llm_config.R1_temperature,
+            "R1_input_price": self.llm_config.R1_input_price,
+            "R1_cache_hit_price": self.llm_config.R1_cache_hit_price,
+            "R1_output_price": self.llm_config.R1_output_price,
             "DEEPSEEK_V3_KEY": self.llm_config.DEEPSEEK_V3_KEY,
             "DEEPSEEK_V3_BASE_URL": self.llm_config.DEEPSEEK_V3_BASE_URL,
             "DEEPSEEK_V3_MODEL_NAME": getattr(self.llm_config, 'DEEPSEEK_V3_MODEL_NAME', 'deepseek-chat'),
             "V3_temperature": self.llm_config.V3_temperature,
+            "V3_input_price": self.llm_config.V3_input_price,
+            "V3_cache_hit_price": self.llm_config.V3_cache_hit_price,
+            "V3_output_price": self.llm_config.V3_output_price,
+            "llm_requests_per_minute": self.llm_config.llm_requests_per_minute,
+            "llm_burst": self.llm_config.llm_burst,
+            "llm_max_concurrent_calls": self.llm_config.llm_max_concurrent_calls,
+            "llm_max_retries": self.llm_config.llm_max_retries,
+            "llm_backoff_base": self.llm_config.llm_backoff_base,
+            "llm_backoff_max": self.llm_config.llm_backoff_max,
+            "llm_timeout": self.llm_config.llm_timeout,
+            "llm_circuit_failure_threshold": self.llm_config.llm_circuit_failure_threshold,
+            "llm_circuit_cooldown": self.llm_config.llm_circuit_cooldown,
+            "llm_backends": self.llm_config.llm_backends,
+            "llm_failover_retries": self.llm_config.llm_failover_retries,
+            "llm_router_slow_factor": self.llm_config.llm_router_slow_factor,
+            "llm_router_max_error_rate": self.llm_config.llm_router_max_error_rate,
+            "llm_router_cooldown": self.llm_config.llm_router_cooldown,
+            "llm_record_path": self.llm_config.llm_record_path,
             "run_time": self.run_config.run_time,
             "max_running_test_round": self.run_config.max_running_test_round,
+            "reject_bad_mesh": self.run_config.reject_bad_mesh,
+            "max_non_orthogonality": self.run_config.max_non_orthogonality,
+            "max_skewness": self.run_config.max_skewness,
+            "early_stopping": self.run_config.early_stopping,
+            "residual_tolerance": self.run_config.residual_tolerance,
+            "convergence_min_iterations": self.run_config.convergence_min_iterations,
+            "plateau_window": self.run_config.plateau_window,
+            "plateau_decades": self.run_config.plateau_decades,
+            "convergence_poll_interval": self.run_config.convergence_poll_interval,
+            "solver_timeout": self.run_config.solver_timeout,
+            "tracing": self.run_config.tracing,
+            "tracing_otlp_endpoint": self.run_config.tracing_otlp_endpoint,
+            "correct_stagnated_runs": self.run_config.correct_stagnated_runs,
+            "rollback_on_regression": self.run_config.rollback_on_regression,
+            "speculative_candidates": self.run_config.speculative_candidates,
+            "smoke_test_steps": self.run_config.smoke_test_steps,
+            "speculative_temperature_step": self.run_config.speculative_temperature_step,
+            "reflection_store": self.run_config.reflection_store,
+            "reflection_store_max_entries": self.run_config.reflection_store_max_entries,
+            "reflection_embedder": self.run_config.reflection_embedder,
+            "reflection_min_similarity": self.run_config.reflection_min_similarity,
+            "prompt_token_budget": self.run_config.prompt_token_budget,
+            "log_compression": self.run_config.log_compression,
+            "log_max_bytes": self.run_config.log_max_bytes,
+            "log_backup_count": self.run_config.log_backup_count,
+            "experience_store": self.run_config.experience_store,
+            "experience_store_max_entries": self.run_config.experience_store_max_entries,
+            "apply_known_fixes": self.run_config.apply_known_fixes,
+            "known_fix_examples": self.run_config.known_fix_examples,
             "pdf_chunk_d": self.pdf_config.pdf_chunk_d,
             "mode": self.run_config.mode,               # Not in default json, but keep for completeness
             "grid_type": self.run_config.grid_type,     # Not in default json, but keep for completeness
@@ -204,37 +317,115 @@ class ConfigManager:
             json.dump(config_data, f, indent=4, ensure_ascii=False)
         print("----- Configuration Saved -----")
 
+    # Variables that only describe the shell that sourced the bashrc
+    _shell_only_env_keys = {"_", "SHLVL", "PWD", "OLDPWD"}
+    # The bashrc is sourced under this fixed environment, so that the snapshot does not depend on the shell of the
+    # process that happens to write the cache (e.g. one that already sourced OpenFOAM)
+    _bashrc_base_path = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+
+    def _openfoam_env_cache_path(self):
+        """Snapshot file keyed by OpenFOAM path and bashrc mtime, shared by all processes using the same installation"""
+        bashrc = os.path.join(self.dependencies_config.OpenFOAM_path, "etc", "bashrc")
+        stat = os.stat(bashrc)
+        key = f"{os.path.abspath(self.dependencies_config.OpenFOAM_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self._bashrc_base_path}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.path_config.temp_dir, "openfoam_env", f"{digest}.json")
+
+    def _source_openfoam_bashrc(self):
+        """Source the OpenFOAM bashrc in bash under a minimal environment and return the variables it sets or changes
+        Returns:
+            snapshot (dict): {"set": {key: value}, "prepend": {key: [path entries]}}, path-like variables only keep the
+                entries added to the minimal environment
+        """
+        base_env = {"PATH": self._bashrc_base_path}
+        for key in ("HOME", "USER", "LOGNAME"):
+            if key in os.environ:
+                base_env[key] = os.environ[key]
+        command = f'source {self.dependencies_config.OpenFOAM_path}/etc/bashrc && env -0'
+        output = subprocess.run(
+            command,
+            shell=True,
+            executable="/usr/bin/bash",  # Ensure using Bash
+            check=True,
+            text=True,
+            capture_output=True,
+            env=base_env,
+        )
+        snapshot = {"set": {}, "prepend": {}}
+        for item in output.stdout.split("\0"):
+            if "=" not in item:
+                continue
+            key, value = item.split("=", 1)
+            old_value = base_env.get(key)
+            if key in self._shell_only_env_keys or value == old_value:
+                continue
+            if key.endswith("PATH"):
+                old_entries = old_value.split(os.pathsep) if old_value else []
+                snapshot["prepend"][key] = [entry for entry in value.split(os.pathsep) if entry and entry not in old_entries]
+            else:
+                snapshot["set"][key] = value
+        return snapshot
+
     def load_openfoam_env(self):
-        """Load OpenFOAM environment variables and local machine environment variables into current Python process"""
+        """Load the OpenFOAM environment snapshot, sourcing the bashrc only when no cached snapshot matches
+        Returns:
+            snapshot (dict): {"set": {key: value}, "prepend": {key: [path entries]}}
+        """
         print("Loading openfoam enviroment...")
+        cache_path = None
         try:
-            # ✅ 使用统一属性名
-            command =  f'source {self.dependencies_config.OpenFOAM_path}/etc/bashrc && env'
-            output = subprocess.run(
-                command,
-                shell=True,
-                executable="/usr/bin/bash",  # Ensure using Bash
-                check=True,
-                text=True,
-                capture_output=True,
-            )
-            # Inject environment variables
-            for line in output.stdout.splitlines():
-                if "=" in line:
-                    key, value = line.split("=", 1)
-                    os.environ[key] = value
+            cache_path = self._openfoam_env_cache_path()
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.openfoam_env_snapshot = json.load(f)
+            return self.openfoam_env_snapshot
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable OpenFOAM environment cache: {e}")
+
+        try:
+            self.openfoam_env_snapshot = self._source_openfoam_bashrc()
         except subprocess.CalledProcessError as e:
             print(f"Please check if load_config() was used correctly before running this function")
             print(f"Failed to load OpenFOAM environment: {e.stderr}")
             raise
 
+        if cache_path is not None:
+            try:
+                # Write to a temporary file first so concurrent workers never read a partial snapshot
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.openfoam_env_snapshot, f)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                print(f"Failed to cache OpenFOAM environment: {e}")
+        return self.openfoam_env_snapshot
+
+    def openfoam_env(self, base_env=None):
+        """Build the environment of an OpenFOAM subprocess without touching os.environ
+        Args:
+            base_env (dict): Environment to extend, defaults to the current process environment
+        Returns:
+            env (dict): Environment to pass to subprocess via env=
+        """
+        if self.openfoam_env_snapshot is None:
+            self.load_openfoam_env()
+        env = dict(os.environ if base_env is None else base_env)
+        env.update(self.openfoam_env_snapshot["set"])
+        for key, entries in self.openfoam_env_snapshot["prepend"].items():
+            current = [entry for entry in env.get(key, "").split(os.pathsep) if entry and entry not in entries]
+            env[key] = os.pathsep.join(entries + current)
+        return env
+
 
 # =========================
 # Create global configuration manager instance for ChatCFD related configurations
 # =========================
 config_manager = ConfigManager()          # Create global configuration manager instance
 config_manager.load_config()              # Load configuration
-config_manager.load_openfoam_env()        # Load OpenFOAM environment variables
+# Directories and the OpenFOAM environment are prepared by init_runtime() before running a case,
+# so that importing the pipeline stays cheap
 
 llm_cfg = config_manager.llm_config
 dependencies_cfg = config_manager.dependencies_config
@@ -262,16 +453,84 @@ class grid_status:
     grid_boundary_conditions: dict = field(default_factory=dict, metadata={"description": "Mesh boundary conditions, key is boundary name, value is mesh boundary condition"})
     grid_boundary_init: str = field(default="", metadata={"description": "Initial boundary file content"})
     field_ic_bc_from_input: dict = field(default_factory=dict, metadata={"description": "Field file boundary and initial conditions, key is field file name, value is boundary_name->bc_ic"})
+    mesh_stats: object = field(default=None, metadata={"description": "polymesh.MeshStats of the converted mesh (cell count, bounding box, patch sizes)"})
+    mesh_quality: object = field(default=None, metadata={"description": "mesh_quality.MeshQuality of the converted mesh, None if not checked"})
 
 case_info = case_status()
 grid_info = grid_status()
 
 # =========================
-# Global runtime flags/variables
+# Per-job runtime state
 # =========================
-error_history = []
-correct_trajectory = []
+@dataclass
+class JobContext:
+    """Runtime state of a single case run. Each job owns its own instance so that several cases can be driven from one process"""
+    case_name: str = field(default="", metadata={"description": "Case name with run index, e.g. cavity_0"})
+    output_case_path: str = field(default="", metadata={"description": "OpenFOAM case directory of this job"})
+    pdf_path: str = field(default="", metadata={"description": "Path to PDF or txt file describing simulation case"})
+    grid_path: str = field(default="", metadata={"description": "Path to mesh file in msh or polyMesh format"})
+    grid_type: str = field(default="msh", metadata={"description": "Mesh file type, msh or polyMesh"})
+
+    case_info: case_status = field(default_factory=case_status, metadata={"description": "Case requirements (solver, turbulence model, file structure...)"})
+    grid_info: grid_status = field(default_factory=grid_status, metadata={"description": "Mesh status and boundary conditions"})
+    OF_case_data_dict: dict = field(default_factory=dict, metadata={"description": "Tutorial cases filtered by the case solver"})
+    case_turbulence_type: str = field(default="laminar", metadata={"description": "Turbulence type derived from the turbulence model"})
+    paper_content: str = field(default=" ", metadata={"description": "Text content of the case description"})
+    paper_table: list = field(default_factory=list, metadata={"description": "Tables extracted from the case description"})
+
+    global_files: object = field(default=None, metadata={"description": "Case files, list of names before generation and dict of name->content after"})
+    error_history: list = field(default_factory=list, metadata={"description": "Latest running errors"})
+    correct_trajectory: list = field(default_factory=list, metadata={"description": "Latest corrections, elements as {file_name: [original_content, modified_content]}"})
+    reflection_history: list = field(default_factory=list, metadata={"description": "Reflection records, elements as {running_error, reflection_result, store_id}"})
+    pending_reflection_ids: list = field(default_factory=list, metadata={"description": "Stored reflections used for the latest correction, marked as solved when the error changes"})
+
+    mesh_convert_success: bool = field(default=False, metadata={"description": "Whether mesh conversion succeeded"})
+    set_controlDict_time: bool = field(default=False, metadata={"description": "Whether the controlDict time settings have been applied"})
+    case_log_write: bool = field(default=False, metadata={"description": "Whether LLM calls are logged to qa_logs.jsonl under output_case_path"})
+    flag_case_success_run: bool = field(default=False, metadata={"description": "Whether the case has run successfully"})
+    residual_log: object = field(default=None, metadata={"description": "foam_log.ResidualLog of the latest solver run"})
+    convergence_status: str = field(default="", metadata={"description": "Result of the convergence monitor for the latest steady run: converged, stagnated or running (reached endTime)"})
+    convergence_message: str = field(default="", metadata={"description": "Description of a stagnated run, for the correction loop"})
+    snapshots: object = field(default=None, metadata={"description": "case_snapshot.CaseSnapshots of output_case_path, one snapshot per correction round"})
+    llm_temperature_offset: float = field(default=0.0, metadata={"description": "Added to the configured LLM temperatures, used to diversify speculative correction candidates"})
+
+_current_job = contextvars.ContextVar("chatcfd_current_job", default=None)
+
+def new_job(case_name="", output_case_path=""):
+    """Create a job seeded with copies of the module-level case settings
+    Args:
+        case_name (str): Case name with run index
+        output_case_path (str): OpenFOAM case directory of this job
+    Returns:
+        job (JobContext): New job, not yet activated
+    """
+    return JobContext(
+        case_name=case_name,
+        output_case_path=output_case_path,
+        pdf_path=pdf_path or path_cfg.case_description_path,
+        grid_path=case_grid or path_cfg.grid_path,
+        grid_type=grid_type,
+        case_info=deepcopy(case_info),
+        grid_info=deepcopy(grid_info),
+    )
+
+def current_job():
+    """Return the job active in the current thread/task, or the process default job"""
+    job = _current_job.get()
+    return job if job is not None else default_job
+
+@contextmanager
+def use_job(job):
+    """Activate job for the current thread/task, e.g. `with config.use_job(job): ...`"""
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
 
+# =========================
+# Global runtime flags/variables (per-case state lives in JobContext)
+# =========================
 mode = run_cfg.mode                   # 0: frontend; 1: headless
 grid_type = run_cfg.grid_type
 
@@ -288,15 +547,6 @@ SRC_DIR = "src"
 Src_PATH = os.path.dirname(os.path.abspath(__file__))
 Base_PATH = os.path.dirname(Src_PATH)
 
-# 保留对 json 的读取（与原工程保持兼容），但上面已从对象加载到全局变量
-try:
-    with open(f"{Base_PATH}/inputs/chatcfd_config.json", "r", encoding="utf-8") as f:
-        _config_data = json.load(f)
-        of_path = _config_data.get("OpenFOAM_path", of_path)
-        sentence_transformer_path = _config_data.get("sentence_transformer_path", sentence_transformer_path)
-except Exception:
-    pass
-
 # Temperatures / thresholds from cfg
 R1_temperature = llm_cfg.R1_temperature
 V3_temperature = llm_cfg.V3_temperature
@@ -325,9 +575,6 @@ def convert_boundary_names_to_lowercase(data):
 global_target_case_dict = None
 
 case_boundaries = []            # Case boundary conditions
-case_solver = None              # Case solver
-case_turbulence_type = "laminar"
-case_turbulence_model = "invalid"
 case_boundary_names = None
 
 reference_case_searching_round = 10
@@ -336,18 +583,14 @@ case_name = None
 Database_OFv24_PATH = f'{Base_PATH}/database_OFv24'
 TEMP_PATH = f'{Base_PATH}/temp'
 OUTPUT_CHATCFD_PATH = f'{Base_PATH}/run_chatcfd'
-OUTPUT_PATH = None
 
 case_grid = None
 pdf_path = None
 
-ensure_directory_exists(Database_OFv24_PATH)
-ensure_directory_exists(OUTPUT_CHATCFD_PATH)
-ensure_directory_exists(TEMP_PATH)
+# Job used when no job is activated, shares case_info/grid_info with the module so legacy scripts keep working
+default_job = JobContext(case_info=case_info, grid_info=grid_info, grid_type=grid_type)
 
 paper_case_number = None
-paper_content = " "
-paper_table = " "
 
 boundary_type_match = None
 global_OF_keywords = None
@@ -357,11 +600,9 @@ best_reference_cases = []
 of_tutorial_dir = dependencies_cfg.OpenFOAM_tutorials_path
 
 global_file_requirement = {}
-global_files = None
 pdf_short_case_description = None
 
 OF_data_path = f"{Database_OFv24_PATH}/processed_merged_OF_cases.json"
-OF_case_data_dict = {}      # Content from processed_merged_OF_cases.json
 max_running_test_round = run_cfg.max_running_test_round
 
 # （提示词保留原样）
@@ -418,10 +659,7 @@ string_of_solver_keywords = ", ".join(solver_keywords)
 string_of_boundary_type_keywords = ", ".join(boundary_type_keywords)
 string_of_thermodynamic_model = ", ".join(thermodynamic_model_keywords)
 
-case_log_write = False
 flag_OF_tutorial_processed = False
-mesh_convert_success = False
-set_controlDict_time = False
 
 case_ic_bc_from_paper = ""
 
@@ -448,3 +686,19 @@ compressible_solvers = [
     "compressibleInterIsoFoam","MPPICInterFoam","overCompressibleInterDyMFoam"
 ]
 
+_runtime_initialized = False
+
+def init_runtime():
+    """Create the working directories and load the OpenFOAM environment, once per process"""
+    global _runtime_initialized
+    if _runtime_initialized:
+        return
+    config_manager._ensure_directory_exists()
+    for directory in [Database_OFv24_PATH, OUTPUT_CHATCFD_PATH, TEMP_PATH]:
+        ensure_directory_exists(directory)
+    config_manager.load_openfoam_env()
+    _runtime_initialized = True
+
+def openfoam_env():
+    """Environment for OpenFOAM subprocesses (solvers, fluentMeshToFoam...)"""
+    return config_manager.openfoam_env()
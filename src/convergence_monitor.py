@@ -0,0 +1,144 @@
+import os
+import re
+import math
+import time
+import signal
+import subprocess
+
+import numpy as np
+
+"""
+Convergence monitoring of steady runs. The solver log is parsed while the solver runs (foam_log.ResidualLog);
+once the initial residuals are below the tolerance, or have stopped decreasing, `stopAt writeNow` is written to
+system/controlDict so that the solver writes the current state and exits cleanly (requires runTimeModifiable).
+"""
+
+RUNNING = "running"
+CONVERGED = "converged"
+STAGNATED = "stagnated"
+SMOKE_TEST_PASSED = "smoke test passed"
+
+class ConvergenceMonitor:
+    """Decide from the residual history whether a steady run has converged or stagnated"""
+    def __init__(self, residual_tolerance=1e-5, min_iterations=50, plateau_window=200, plateau_decades=0.1):
+        """
+        Args:
+            residual_tolerance (float): Converged once the initial residual of every solved field is below this value
+            min_iterations (int): Number of iterations before any decision is taken
+            plateau_window (int): Number of iterations over which the residual decrease is measured
+            plateau_decades (float): Stagnated when no field decreased by this many decades (log10) over the window
+        """
+        self.residual_tolerance = residual_tolerance
+        self.min_iterations = min_iterations
+        self.plateau_window = plateau_window
+        self.plateau_decades = plateau_decades
+        self.status = RUNNING
+        self.reason = ""
+
+    def check(self, residual_log):
+        """Update the status from the time steps parsed so far
+        Args:
+            residual_log (foam_log.ResidualLog): Log of the running solver
+        Returns:
+            status (str): RUNNING, CONVERGED or STAGNATED
+        """
+        if residual_log.n_rows < self.min_iterations:
+            return self.status
+
+        last = residual_log.last()
+        residuals = {name[:-len("_initial")]: value for name, value in last.items()
+                     if name.endswith("_initial") and not math.isnan(value)}
+        if not residuals:
+            return self.status
+
+        if max(residuals.values()) < self.residual_tolerance:
+            self.status = CONVERGED
+            self.reason = f"initial residuals below {self.residual_tolerance:g} after {residual_log.n_rows} iterations: {residuals}"
+            return self.status
+
+        if residual_log.n_rows >= max(self.plateau_window, self.min_iterations):
+            decreases = {}
+            half = self.plateau_window // 2
+            for field_name in residuals:
+                history = np.asarray(residual_log.columns[f"{field_name}_initial"][-self.plateau_window:], dtype=np.float64)
+                history = np.log10(np.maximum(history[~np.isnan(history)], 1e-300))
+                if len(history) < self.plateau_window:
+                    continue
+                # Medians of both halves of the window, so that oscillating residuals are not taken for progress
+                decreases[field_name] = float(np.median(history[:half]) - np.median(history[half:]))
+            if decreases and max(decreases.values()) < self.plateau_decades:
+                self.status = STAGNATED
+                self.reason = (f"initial residuals decreased by less than {self.plateau_decades:g} decades over the last "
+                               f"{self.plateau_window} iterations, last residuals {residuals}")
+        return self.status
+
+class SmokeTestMonitor:
+    """Stop a run after a fixed number of time steps, used to try a correction without running the whole case"""
+    def __init__(self, n_steps=20):
+        self.n_steps = n_steps
+        self.status = RUNNING
+        self.reason = ""
+
+    def check(self, residual_log):
+        if residual_log.n_rows >= self.n_steps:
+            self.status = SMOKE_TEST_PASSED
+            self.reason = f"{residual_log.n_rows} time steps without error"
+        return self.status
+
+def set_control_dict_entry(control_dict_path, key, value):
+    """Set a top-level entry of system/controlDict in place, keeping the rest of the file untouched
+    Returns:
+        original (str): File content before the change
+    """
+    with open(control_dict_path, 'r') as f:
+        original = f.read()
+    pattern = re.compile(rf'^(\s*{key}\s+)[^;]*;', re.MULTILINE)
+    if pattern.search(original):
+        content = pattern.sub(lambda match: f"{match.group(1)}{value};", original, count=1)
+    else:
+        content = original.rstrip("\n") + f"\n\n{key} {value};\n"
+    if content != original:
+        # Written in place (not replaced) so that OpenFOAM notices the modification of the watched file
+        with open(control_dict_path, 'w') as f:
+            f.write(content)
+    return original
+
+def communicate_with_monitor(process, residual_log, monitor, control_dict_path, poll_interval=2.0, timeout=None):
+    """Wait for a running solver, stopping it with `stopAt writeNow` when the monitor reports convergence or stagnation
+    Args:
+        process (subprocess.Popen): Solver process writing to residual_log.log_path, started in its own session
+        residual_log (foam_log.ResidualLog): Parser of the solver log
+        monitor (ConvergenceMonitor): Convergence criteria, None to only follow the log
+        control_dict_path (str): system/controlDict of the case
+        poll_interval (float): Seconds between two log updates
+        timeout (float): Seconds after which the process group of the solver is killed, None for no limit
+    Returns:
+        stdout, stderr (str): Output of the process, stderr ends with a timeout message when the solver was killed
+    """
+    stop_requested = False
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            stdout, stderr = process.communicate(timeout=poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if deadline is not None and time.monotonic() > deadline:
+            # The shell and the solver it started are killed together
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                process.kill()
+            stdout, stderr = process.communicate()
+            stderr = (stderr or "") + f"\nThe solver did not finish within {timeout:g} s and was stopped."
+            break
+        residual_log.update()
+        if monitor is None or stop_requested:
+            continue
+        if monitor.check(residual_log) != RUNNING:
+            print(f"Run {monitor.status}: {monitor.reason}, requesting writeNow")
+            set_control_dict_entry(control_dict_path, "stopAt", "writeNow")
+            stop_requested = True
+    residual_log.update()
+    residual_log.finish()
+    return stdout, stderr
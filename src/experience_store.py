@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+import config
+import reflection_store
+
+"""
+Experience store of the corrections that worked.
+When a correction round turns a failing case into a passing one (or into a different error), the error, the solver,
+the turbulence model and the files changed by the round are recorded in SQLite. file_corrector.correct_error applies
+a recorded fix directly when the case files are exactly in the state the fix was made from, and otherwise shows the
+closest fixes to the model as examples.
+"""
+
+PASSED = "passed"
+ERROR_CHANGED = "error changed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiences (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    signature TEXT NOT NULL,
+    solver TEXT NOT NULL DEFAULT '',
+    turbulence_model TEXT NOT NULL DEFAULT '',
+    running_error TEXT NOT NULL,
+    fix_key TEXT NOT NULL,
+    files TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    case_name TEXT NOT NULL DEFAULT '',
+    embedder TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiences_signature ON experiences (signature, solver);
+CREATE INDEX IF NOT EXISTS experiences_fix ON experiences (signature, solver, fix_key);
+CREATE INDEX IF NOT EXISTS experiences_eviction ON experiences (outcome, last_used);
+"""
+
+def _sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _sha256_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class ExperienceStore:
+    """SQLite store of successful fixes, shared by all jobs and runs"""
+    def __init__(self, path, max_entries=5000):
+        """
+        Args:
+            path (str): SQLite database file
+            max_entries (int): Number of fixes kept, the least recently used partial fixes are evicted first
+        """
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with reflection_store.connect(self.path) as connection:
+            connection.executescript(_SCHEMA)
+
+    @staticmethod
+    def _record(row, similarity=None):
+        record = {
+            "id": row["id"],
+            "signature": row["signature"],
+            "solver": row["solver"],
+            "turbulence_model": row["turbulence_model"],
+            "running_error": row["running_error"],
+            "files": json.loads(row["files"]),
+            "outcome": row["outcome"],
+            "case_name": row["case_name"],
+            "hits": row["hits"],
+        }
+        if similarity is not None:
+            record["similarity"] = similarity
+        return record
+
+    def record(self, running_error, files, outcome, solver="", turbulence_model="", case_name=""):
+        """Store a fix, or count it again if the same fix of the same error is already stored
+        Args:
+            running_error (str): Error the fix was made for
+            files (dict): key is relative path, value is {"before_sha": sha256 of the content before the fix (None for a
+                new file), "after": content after the fix (None for a removed file), "diff": unified diff}
+            outcome (str): PASSED or ERROR_CHANGED
+            solver, turbulence_model, case_name (str): Case the fix comes from
+        Returns:
+            experience_id (int)
+        """
+        signature = reflection_store.error_signature(running_error)
+        fix_key = _sha256_text(json.dumps({path: [change["before_sha"], change["after"]] for path, change in files.items()}, sort_keys=True))
+        now = time.time()
+        with reflection_store.connect(self.path) as connection:
+            row = connection.execute("SELECT id, outcome FROM experiences WHERE signature = ? AND solver = ? AND fix_key = ?",
+                                     (signature, solver or "", fix_key)).fetchone()
+            if row is not None:
+                # A passing outcome is never downgraded by a later partial one
+                best_outcome = PASSED if PASSED in (row["outcome"], outcome) else outcome
+                connection.execute("UPDATE experiences SET hits = hits + 1, last_used = ?, outcome = ? WHERE id = ?",
+                                   (now, best_outcome, row["id"]))
+                return row["id"]
+            embedder_name, vectors = reflection_store.embed([running_error])
+            cursor = connection.execute(
+                "INSERT INTO experiences (signature, solver, turbulence_model, running_error, fix_key, files, outcome, case_name, embedder, embedding, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (signature, solver or "", turbulence_model or "", running_error, fix_key, json.dumps(files), outcome, case_name,
+                 embedder_name, vectors[0].tobytes(), now, now))
+            experience_id = cursor.lastrowid
+            count = connection.execute("SELECT COUNT(*) FROM experiences").fetchone()[0]
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM experiences WHERE id IN (SELECT id FROM experiences ORDER BY outcome = ? ASC, last_used ASC LIMIT ?)",
+                    (PASSED, count - self.max_entries))
+        return experience_id
+
+    def find(self, running_error, solver="", turbulence_model="", k=3, min_similarity=0.0):
+        """Fixes of the same or similar errors for a solver
+        Args:
+            running_error (str): Error to fix
+            solver (str): Case solver, only fixes made for this solver are returned
+            turbulence_model (str): Fixes made with the same turbulence model come first among equally similar ones
+            k (int): Maximum number of fixes
+            min_similarity (float): Cosine similarity below which fixes of other errors are ignored
+        Returns:
+            experiences (list): Fixes of the same error signature first, then by similarity, passing fixes first
+        """
+        signature = reflection_store.error_signature(running_error)
+        embedder_name, vectors = reflection_store.embed([running_error])
+        with reflection_store.connect(self.path) as connection:
+            rows = connection.execute("SELECT * FROM experiences WHERE solver = ? AND (signature = ? OR embedder = ?)",
+                                      (solver or "", signature, embedder_name)).fetchall()
+        scored = []
+        for row in rows:
+            if row["signature"] == signature:
+                similarity = 1.0
+            elif row["embedder"] == embedder_name:
+                similarity = float(np.frombuffer(row["embedding"], dtype=np.float32) @ vectors[0])
+            else:
+                continue
+            if similarity >= min_similarity:
+                scored.append((row, similarity))
+        scored.sort(key=lambda item: (item[0]["signature"] != signature, -round(item[1], 3), item[0]["outcome"] != PASSED,
+                                      item[0]["turbulence_model"] != (turbulence_model or ""), -item[0]["hits"]))
+        return [self._record(row, similarity) for row, similarity in scored[:k]]
+
+    def applicable(self, experience, case_path):
+        """Whether the case files are exactly in the state the fix was made from, so that it can be replayed as is"""
+        for rel_path, change in experience["files"].items():
+            path = os.path.join(case_path, rel_path)
+            if change["before_sha"] is None:
+                if os.path.exists(path):
+                    return False
+            elif not os.path.isfile(path) or _sha256_file(path) != change["before_sha"]:
+                return False
+        return True
+
+    def apply(self, experience, case_path):
+        """Replay a fix in a case
+        Returns:
+            files_corrected (dict): Same format as file_corrector.correct_error, {file_name: [original_content, modified_content]}
+        """
+        files_corrected = {}
+        for rel_path, change in experience["files"].items():
+            path = os.path.join(case_path, rel_path)
+            original = ""
+            if os.path.isfile(path):
+                with open(path, 'r') as f:
+                    original = f.read()
+            if change["after"] is None:
+                os.remove(path)
+                files_corrected[rel_path] = [original, ""]
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(change["after"])
+            files_corrected[rel_path] = [original, change["after"]] if change["before_sha"] is not None else [change["after"]]
+        with reflection_store.connect(self.path) as connection:
+            connection.execute("UPDATE experiences SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), experience["id"]))
+        return files_corrected
+
+    def __len__(self):
+        with reflection_store.connect(self.path) as connection:
+            return connection.execute("SELECT COUNT(*) FROM experiences").fetchone()[0]
+
+def few_shot_context(experiences, max_diff_chars=4000):
+    """Prompt block showing known fixes of similar errors"""
+    if not experiences:
+        return ""
+    context = "\n<known_fixes>\nThe following corrections fixed similar OpenFOAM errors in earlier cases. Use them as examples if they apply to this error:"
+    for idx, experience in enumerate(experiences):
+        diffs = "\n".join(change["diff"] for change in experience["files"].values())
+        if len(diffs) > max_diff_chars:
+            diffs = diffs[:max_diff_chars] + "\n... ..."
+        context += f"\n### fix_{idx} ({experience['outcome']}, solver {experience['solver']})\nError:\n{experience['running_error'][-1500:]}\nChanges:\n{diffs}"
+    return context + "\n</known_fixes>"
+
+def snapshot_fix(snapshots, before_id, after_id):
+    """Files changed between two round snapshots, in the format of ExperienceStore.record"""
+    before_files = snapshots.get(before_id)["files"]
+    diffs = snapshots.diff(before_id, after_id)
+    return {rel_path: {"before_sha": before_files.get(rel_path),
+                       "after": snapshots.read(after_id, rel_path),
+                       "diff": diff}
+            for rel_path, diff in diffs.items()}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def default_store():
+    """Store of the ChatCFD database directory, shared by all jobs of the process; None when disabled"""
+    if not config.run_cfg.experience_store:
+        return None
+    path = os.path.join(config.path_cfg.database_dir, "experience.sqlite")
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ExperienceStore(path, config.run_cfg.experience_store_max_entries)
+        return _stores[path]
@@ -0,0 +1,322 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+
+import fluent_mesh
+
+"""
+Stand-in OpenFOAM installation for benchmarking and testing the pipeline on machines without OpenFOAM.
+create_installation() writes an installation directory with an etc/bashrc and bin/ wrappers for fluentMeshToFoam and
+the solvers; setting dependencies_config.OpenFOAM_path to it makes load_openfoam_env, convert_mesh and case_run use
+the fake tools unchanged. Each run of a tool follows a scenario from scenarios.json:
+    succeed     write a solver log with decreasing residuals (or a small polyMesh) and exit 0
+    fail        exit 1 with a FOAM FATAL ERROR on stderr, optionally after some time steps
+    hang        write the log header and never finish (exercises run_config.solver_timeout)
+    diverge     residuals grow after diverge_after steps, then a floating point exception
+scenarios.json holds {"default": scenario, "rules": [{"tool": glob, "case": glob, "scenario": scenario or [scenarios]}]},
+the first rule matching the tool name and the case path is used. A list of scenarios is played in turn over the runs of
+the tool in the case (the last one repeating), e.g. a fatal error that a correction round fixes.
+Scenario keys: outcome, steps (time steps when the controlDict does not give them, also the cap), step_seconds, error,
+fail_after, diverge_after, residual_start, residual_decay, cells (cells of the generated mesh).
+Usage:
+    python src/fake_openfoam.py create /tmp/fake_openfoam --scenarios scenarios.json
+"""
+
+DEFAULT_SOLVERS = [
+    "simpleFoam", "pimpleFoam", "pisoFoam", "icoFoam", "potentialFoam", "porousSimpleFoam", "SRFSimpleFoam",
+    "rhoSimpleFoam", "rhoPimpleFoam", "rhoCentralFoam", "sonicFoam", "buoyantSimpleFoam", "buoyantPimpleFoam",
+    "buoyantBoussinesqSimpleFoam", "chtMultiRegionFoam", "chtMultiRegionSimpleFoam", "interFoam", "laplacianFoam",
+    "scalarTransportFoam", "reactingFoam", "foamRun",
+]
+
+DEFAULT_SCENARIO = {
+    "outcome": "succeed",
+    "steps": 50,
+    "step_seconds": 0.0,
+    "error": "",
+    "fail_after": 0,
+    "diverge_after": 20,
+    "residual_start": 1.0,
+    "residual_decay": 0.8,
+    "cells": 8,
+}
+
+DEFAULT_FATAL_ERROR = """--> FOAM FATAL IO ERROR: (openfoam-2406)
+Entry 'div(phi,U)' not found in dictionary "system/fvSchemes/divSchemes"
+
+file: system/fvSchemes/divSchemes at line 25.
+
+    From const Foam::entry& Foam::dictionary::lookupEntry(const Foam::word&, Foam::keyType::option) const
+    in file db/dictionary/dictionary.C at line 370.
+
+FOAM exiting
+"""
+
+_SCENARIO_FILE = "scenarios.json"
+_RUN_COUNTS = ".fake_openfoam_runs.json"
+_SOLVED_FIELDS = ("Ux", "Uy", "Uz", "p", "k", "omega")
+
+def create_installation(root, scenarios=None, solvers=None):
+    """Write a fake OpenFOAM installation
+    Args:
+        root (str): Installation directory, used as dependencies_config.OpenFOAM_path
+        scenarios (dict): Content of scenarios.json, everything succeeds by default
+        solvers (list): Solver names to provide, DEFAULT_SOLVERS by default
+    Returns:
+        root (str): Absolute installation directory
+    """
+    root = os.path.abspath(root)
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    os.makedirs(os.path.join(root, "etc"), exist_ok=True)
+    os.makedirs(os.path.join(root, "tutorials"), exist_ok=True)
+    with open(os.path.join(root, _SCENARIO_FILE), 'w', encoding='utf-8') as f:
+        json.dump(scenarios or {"default": DEFAULT_SCENARIO, "rules": []}, f, indent=4)
+    with open(os.path.join(root, "etc", "bashrc"), 'w', encoding='utf-8') as f:
+        f.write(f'export WM_PROJECT=OpenFOAM\n'
+                f'export WM_PROJECT_VERSION=2406-fake\n'
+                f'export WM_PROJECT_DIR="{root}"\n'
+                f'export FOAM_TUTORIALS="{root}/tutorials"\n'
+                f'export FOAM_FAKE_SCENARIOS="{root}/{_SCENARIO_FILE}"\n'
+                f'export PATH="{bin_dir}:$PATH"\n')
+    script = os.path.abspath(__file__)
+    for tool in ["fluentMeshToFoam"] + list(solvers or DEFAULT_SOLVERS):
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'#!/usr/bin/env bash\nexec "{sys.executable}" "{script}" run {tool} "$@"\n')
+        os.chmod(path, 0o755)
+    return root
+
+def select_scenario(scenarios, tool, case_path, run_index):
+    """Scenario of the run_index-th run (from 0) of tool in case_path"""
+    chosen = scenarios.get("default") or {}
+    for rule in scenarios.get("rules", []):
+        if fnmatch.fnmatch(tool, rule.get("tool", "*")) and fnmatch.fnmatch(case_path, rule.get("case", "*")):
+            chosen = rule.get("scenario") or {}
+            break
+    if isinstance(chosen, list):
+        chosen = chosen[min(run_index, len(chosen) - 1)] if chosen else {}
+    return {**DEFAULT_SCENARIO, **chosen}
+
+def _next_run_index(case_path, tool):
+    """Count the runs of a tool in a case, in a file of the case directory"""
+    path = os.path.join(case_path, _RUN_COUNTS)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            counts = json.load(f)
+    except (OSError, ValueError):
+        counts = {}
+    index = counts.get(tool, 0)
+    counts[tool] = index + 1
+    os.makedirs(case_path, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(counts, f)
+    return index
+
+def _control_dict_entry(content, key):
+    match = re.search(rf'^\s*{key}\s+([^;]+);', content, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+def _fatal(error, tool, case_path):
+    sys.stderr.write(f"\n\n{error or DEFAULT_FATAL_ERROR}\n")
+    sys.stderr.flush()
+    print(f"{tool} -case {case_path}: fake run failed", file=sys.stderr)
+    return 1
+
+def _banner(tool, case_path):
+    print("/*---------------------------------------------------------------------------*\\")
+    print("| =========                 |                                                 |")
+    print("| \\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |")
+    print("|  \\\\    /   O peration     | Version:  2406-fake                             |")
+    print("\\*---------------------------------------------------------------------------*/")
+    print(f"Exec   : {tool} -case {case_path}")
+    print(f"Case   : {case_path}")
+    print("\nCreate time\n")
+    sys.stdout.flush()
+
+def run_solver(tool, case_path, scenario):
+    """Write a solver log on stdout following the scenario
+    Returns:
+        returncode (int)
+    """
+    control_dict_path = os.path.join(case_path, "system", "controlDict")
+    try:
+        with open(control_dict_path, 'r') as f:
+            content = f.read()
+    except OSError:
+        return _fatal(f"--> FOAM FATAL ERROR: (openfoam-2406)\ncannot find file \"{control_dict_path}\"\n\nFOAM exiting\n", tool, case_path)
+
+    delta_t = float(_control_dict_entry(content, "deltaT") or 1)
+    end_time = float(_control_dict_entry(content, "endTime") or scenario["steps"] * delta_t)
+    steps = min(int(round(end_time / delta_t)) if delta_t > 0 else scenario["steps"], scenario["steps"])
+    _banner(tool, case_path)
+
+    outcome = scenario["outcome"]
+    if outcome == "fail" and scenario["fail_after"] <= 0:
+        return _fatal(scenario["error"], tool, case_path)
+    residual = scenario["residual_start"]
+    time_value = 0.0
+    start = time.monotonic()
+    for step in range(1, steps + 1):
+        if outcome == "hang":
+            while True:
+                time.sleep(3600)
+        time_value += delta_t
+        if outcome == "diverge" and step > scenario["diverge_after"]:
+            residual *= 10.0
+        else:
+            residual *= scenario["residual_decay"]
+        print(f"Time = {time_value:g}\n")
+        for index, name in enumerate(_SOLVED_FIELDS):
+            initial = min(residual * (1.0 + 0.1 * index), 1.0)
+            print(f"smoothSolver:  Solving for {name}, Initial residual = {initial:.6g}, Final residual = {initial * 0.01:.6g}, No Iterations 3")
+        print(f"time step continuity errors : sum local = {residual * 1e-3:.6g}, global = {residual * 1e-5:.6g}, cumulative = {residual * 1e-5:.6g}")
+        print(f"ExecutionTime = {time.monotonic() - start:.2f} s  ClockTime = {int(time.monotonic() - start)} s\n")
+        sys.stdout.flush()
+        if scenario["step_seconds"]:
+            time.sleep(scenario["step_seconds"])
+        if outcome == "fail" and step >= scenario["fail_after"]:
+            return _fatal(scenario["error"], tool, case_path)
+        if outcome == "diverge" and residual > 1e3:
+            sys.stderr.write("#0  Foam::error::printStack(Foam::Ostream&) at ??:?\n"
+                             "#1  Foam::sigFpe::sigHandler(int) at ??:?\n"
+                             "#2  ? in /lib/x86_64-linux-gnu/libc.so.6\n"
+                             "Floating point exception (core dumped)\n")
+            return 136
+        # The convergence monitor asks for writeNow through the controlDict
+        try:
+            with open(control_dict_path, 'r') as f:
+                if _control_dict_entry(f.read(), "stopAt") == "writeNow":
+                    break
+        except OSError:
+            pass
+
+    initial_dir = os.path.join(case_path, "0")
+    time_dir = os.path.join(case_path, f"{time_value:g}")
+    if os.path.isdir(initial_dir) and time_value > 0 and not os.path.exists(time_dir):
+        shutil.copytree(initial_dir, time_dir)
+    print("End\n")
+    return 0
+
+def _foam_file(path, foam_class, body, note=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = f'FoamFile\n{{\n    version     2.0;\n    format      ascii;\n    class       {foam_class};\n'
+    if note:
+        header += f'    note        "{note}";\n'
+    header += f'    location    "constant/polyMesh";\n    object      {os.path.basename(path)};\n}}\n\n'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(header + body)
+
+def write_polymesh(polymesh_path, patches, cells=8):
+    """Write a row of unit hexahedra whose boundary faces are shared out between the patches
+    Args:
+        polymesh_path (str): constant/polyMesh directory of the case
+        patches (dict): Patch name -> Fluent zone type, in file order
+        cells (int): Number of cells
+    """
+    cells = max(int(cells), 1)
+    corners = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    points = [(x, y, layer) for layer in range(cells + 1) for x, y in corners]
+    internal = [((4 * layer, 4 * layer + 1, 4 * layer + 2, 4 * layer + 3), layer - 1, layer) for layer in range(1, cells)]
+    boundary = [((0, 3, 2, 1), 0)]
+    for cell in range(cells):
+        for corner in range(4):
+            following = (corner + 1) % 4
+            boundary.append(((4 * cell + corner, 4 * cell + following, 4 * cell + 4 + following, 4 * cell + 4 + corner), cell))
+    boundary.append(((4 * cells, 4 * cells + 1, 4 * cells + 2, 4 * cells + 3), cells - 1))
+
+    patches = patches or {"walls": "wall"}
+    share, extra = divmod(len(boundary), len(patches))
+    entries = []
+    start = len(internal)
+    for index, (name, zone_type) in enumerate(patches.items()):
+        n_faces = share + (1 if index < extra else 0)
+        patch_type = "wall" if "wall" in zone_type.lower() else "patch"
+        entries.append(f"    {name}\n    {{\n        type            {patch_type};\n"
+                       f"        nFaces          {n_faces};\n        startFace       {start};\n    }}\n")
+        start += n_faces
+
+    faces = [face for face, *_ in internal] + [face for face, _ in boundary]
+    owner = [cell for _, cell, _ in internal] + [cell for _, cell in boundary]
+    neighbour = [cell for *_, cell in internal]
+    note = f"nPoints:{len(points)}  nCells:{cells}  nFaces:{len(faces)}  nInternalFaces:{len(internal)}"
+    _foam_file(os.path.join(polymesh_path, "points"), "vectorField",
+               f"{len(points)}\n(\n" + "".join(f"({x} {y} {z})\n" for x, y, z in points) + ")\n")
+    _foam_file(os.path.join(polymesh_path, "faces"), "faceList",
+               f"{len(faces)}\n(\n" + "".join(f"4({' '.join(map(str, face))})\n" for face in faces) + ")\n")
+    _foam_file(os.path.join(polymesh_path, "owner"), "labelList",
+               f"{len(owner)}\n(\n" + "".join(f"{cell}\n" for cell in owner) + ")\n", note)
+    _foam_file(os.path.join(polymesh_path, "neighbour"), "labelList",
+               f"{len(neighbour)}\n(\n" + "".join(f"{cell}\n" for cell in neighbour) + ")\n", note)
+    _foam_file(os.path.join(polymesh_path, "boundary"), "polyBoundaryMesh", f"{len(entries)}\n(\n" + "".join(entries) + ")\n")
+
+def run_fluent_mesh_to_foam(case_path, grid_path, scenario):
+    """Write constant/polyMesh with the boundary zones of the Fluent mesh as patches"""
+    _banner("fluentMeshToFoam", case_path)
+    if scenario["outcome"] == "hang":
+        while True:
+            time.sleep(3600)
+    if scenario["outcome"] != "succeed":
+        return _fatal(scenario["error"] or f"--> FOAM FATAL ERROR: (openfoam-2406)\nCannot read file {grid_path}\n\nFOAM exiting\n",
+                      "fluentMeshToFoam", case_path)
+    try:
+        patches = fluent_mesh.read_boundary_zones(grid_path)
+    except OSError as e:
+        return _fatal(f"--> FOAM FATAL ERROR: (openfoam-2406)\nCannot open file {grid_path}: {e}\n\nFOAM exiting\n",
+                      "fluentMeshToFoam", case_path)
+    if scenario["step_seconds"]:
+        time.sleep(scenario["step_seconds"])
+    write_polymesh(os.path.join(case_path, "constant", "polyMesh"), patches, scenario["cells"])
+    print("End\n")
+    return 0
+
+def run_tool(tool, argv):
+    """Entry point of the bin/ wrappers
+    Returns:
+        returncode (int)
+    """
+    parser = argparse.ArgumentParser(prog=tool)
+    parser.add_argument("-case", default=".")
+    parser.add_argument("args", nargs="*")
+    args, _ = parser.parse_known_args(argv)
+    case_path = os.path.abspath(args.case)
+    scenarios = {}
+    if os.environ.get("FOAM_FAKE_SCENARIOS"):
+        with open(os.environ["FOAM_FAKE_SCENARIOS"], 'r', encoding='utf-8') as f:
+            scenarios = json.load(f)
+    scenario = select_scenario(scenarios, tool, case_path, _next_run_index(case_path, tool))
+    if tool == "fluentMeshToFoam":
+        if not args.args:
+            return _fatal("--> FOAM FATAL ERROR: (openfoam-2406)\nWrong number of arguments, expected 1 found 0\n\nFOAM exiting\n",
+                          tool, case_path)
+        return run_fluent_mesh_to_foam(case_path, args.args[0], scenario)
+    return run_solver(tool, case_path, scenario)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenFOAM installation driven by scenarios")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Write an installation directory")
+    create.add_argument("root")
+    create.add_argument("--scenarios", help="JSON file of the scenarios, everything succeeds by default")
+    create.add_argument("--solvers", nargs="*", help="Solver names, defaults to the common OpenFOAM solvers")
+    run = commands.add_parser("run", help="Run a fake tool (used by the bin/ wrappers)")
+    run.add_argument("tool")
+    args, rest = parser.parse_known_args()
+
+    if args.command == "create":
+        scenarios = None
+        if args.scenarios:
+            with open(args.scenarios, 'r', encoding='utf-8') as f:
+                scenarios = json.load(f)
+        root = create_installation(args.root, scenarios, args.solvers)
+        print(f"Fake OpenFOAM installation in {root}, set OpenFOAM_path to it")
+    else:
+        sys.exit(run_tool(args.tool, rest))
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,18 @@ import random
 from pathlib import Path
 
 import file_writer
+import prompt_context
+import foam_payload
+import llm_extract
+import experience_store
+import reflection_store
+import qa_modules
+import stream_json
 from qa_modules import QA_NoContext_deepseek_V3,QA_NoContext_deepseek_R1
 
 # import prompt
 from pydantic import BaseModel, Field
 from typing import List, Dict
-from langchain.output_parsers import PydanticOutputParser
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -29,9 +35,26 @@ def robust_llm_parse(qa, prompt, parser, max_retries=3):
     Returns:
         result (object): Parsed result if successful; fallback if all retries fail.
     """
+    pydantic_object = getattr(parser, "pydantic_object", None)
+    if pydantic_object is not None:
+        # Pydantic answers are validated while streamed, a malformed answer is cut and asked again at once
+        try:
+            return qa_modules.ask_json(qa, prompt, pydantic_object, max_attempts=max_retries)
+        except stream_json.StructuredOutputError as e:
+            print(f"{e}, using fallback result")
+            return None
+        except Exception as e:
+            print(f"LLM call failed: {e}, using fallback result")
+            return None
+
     for attempt in range(max_retries):
         try:
             response = qa.ask(prompt)
+        except Exception as e:
+            # Transient provider errors were already retried by qa_modules.call_with_resilience
+            print(f"LLM call failed: {e}, using fallback result")
+            return None
+        try:
             result = parser.parse(response)
             return result
         except Exception as e:
@@ -91,10 +114,8 @@ def create_OF_case_json(source_dir):
                 relative_path = os.path.join(dir_name, entry).replace("\\", "/")
                 
                 try:
-                    # Read file content
-                    with open(entry_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        file_data[relative_path] = content
+                    # Read file content, large list payloads summarised
+                    file_data[relative_path] = foam_payload.read_compact(entry_path)[0]
                 except Exception as e:
                     print(f"Unable to read file {entry_path}: {str(e)}")
                     continue
@@ -173,20 +194,20 @@ def read_files_to_dict(base_dir):
                 rel_path = os.path.join(dir_name, entry)
                 # Read file content
                 try:
-                    with open(full_path, 'r', encoding='utf-8') as f:
-                        file_dict[rel_path] = f.read()
+                    file_dict[rel_path] = foam_payload.read_compact(full_path)[0]
                 except Exception as e:
                     file_dict[rel_path] = f"<Error reading file: {str(e)}>"
     
     return file_dict
 
 def add_new_file(file_name):
+    job = config.current_job()
 
     print(f"adding new file: {file_name}")
 
-    file_path = f'{config.OUTPUT_PATH}/{file_name}'
+    file_path = f'{job.output_case_path}/{file_name}'
 
-    other_case_file_content = read_files_to_dict(config.OUTPUT_PATH)
+    other_case_file_content = prompt_context.case_context(job.output_case_path, file_name)
 
     add_new_file_prompt = f'''
     A new case file {file_name} must be add to the OpenFOAM case dir. The file contents of other case files are: {other_case_file_content}. Please respond the file contents for the new file which can make this case run correctly with other case files. Ensure the dimension is correct if the dimension shows in the file content.
@@ -212,9 +233,9 @@ def add_new_file(file_name):
             if match:
                 if file_name+"_" in dimensions_dict.keys(): # The underlined parts cannot be compressed.
                     if file_name in ["0/p", "0/p_rgh", "0/alphat"]: 
-                        if config.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
+                        if job.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
                             file_content = re.sub(dimension_pattern, f'dimensions      {dimensions_dict[file_name]};\n', file_content)
-                        elif config.case_info.case_solver in config.incompressible_solvers:
+                        elif job.case_info.case_solver in config.incompressible_solvers:
                             file_content = re.sub(dimension_pattern, f'dimensions      {dimensions_dict[file_name+"_"]};\n', file_content)
                         else:
                             pass
@@ -225,9 +246,9 @@ def add_new_file(file_name):
         else:
             if file_name+"_" in dimensions_dict.keys(): 
                 if file_name in ["0/p", "0/p_rgh", "0/alphat"]: 
-                    if config.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
+                    if job.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
                         file_content = f"\ndimensions      {dimensions_dict[file_name]};\n"
-                    elif config.case_info.case_solver in config.incompressible_solvers:
+                    elif job.case_info.case_solver in config.incompressible_solvers:
                         file_content = f"\ndimensions      {dimensions_dict[file_name+'_']};\n"
                 else:
                     pass    # File will error, let LLM solve it itself
@@ -244,8 +265,9 @@ def add_new_file(file_name):
     return answer
 
 def identify_file_name_from_error(running_error):
+    job = config.current_job()
 
-    case_files = list_case_file(config.OUTPUT_PATH)
+    case_files = list_case_file(job.output_case_path)
 
     analyze_running_error_prompt = f'''
     Analyze the provided OpenFOAM runtime error { {running_error} } to identify the file requires revision. The result must be one of the following files: { {case_files} }. You response must only include the case name.
@@ -269,8 +291,9 @@ def identify_file_name_from_error(running_error):
 # Parameter target_file is the file name identified from running_error that needs to be modified
 # Find by solver
 def find_reference_files_by_solver(target_file):
-    case_solver = config.case_solver
-    turbulence_model = config.case_turbulence_model
+    job = config.current_job()
+    case_solver = job.case_info.case_solver
+    turbulence_model = job.case_info.turbulence_model
     turbulence_model_list = [
         "SpalartAllmarasIDDES",
         "SpalartAllmarasDDES",
@@ -291,7 +314,7 @@ def find_reference_files_by_solver(target_file):
     if turbulence_model not in turbulence_model_list:
         turbulence_model = None
 
-    other_physical_model = config.other_physical_model
+    other_physical_model = job.case_info.other_physical_model
 
     # 返回内容
     target_file_reference = {}
@@ -300,7 +323,7 @@ def find_reference_files_by_solver(target_file):
 
     file_number = 0
 
-    for key, value in config.OF_case_data_dict.items():
+    for key, value in job.OF_case_data_dict.items():
         if case_solver in key and turbulence_model == value["turbulence_model"]:
             
             # If there is other_physical_model, need to check if they are the same
@@ -321,7 +344,7 @@ def find_reference_files_by_solver(target_file):
     
     # If not found, do not consider turbulence model matching
     if file_number == 0:
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
             if case_solver in key:
                 config_files = value['configuration_files']
 
@@ -333,7 +356,7 @@ def find_reference_files_by_solver(target_file):
 
     # If the above result is 0, search at a higher level, first find the solver type, such as compressible
     if file_number == 0:
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
             if case_solver in key:
                 path_split = key.split('/')
                 solver_type = path_split[0]
@@ -341,7 +364,7 @@ def find_reference_files_by_solver(target_file):
 
     # Find target_file under the solver type
     if solver_type is not None:
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
                 path_split = key.split('/')
                 if solver_type == path_split[0]:
                     config_files = value['configuration_files']
@@ -360,12 +383,13 @@ def find_reference_files_by_solver(target_file):
 
 def analyze_running_error_with_all_case_file_content(running_error):
     """Find the file causing the error and its modification suggestions"""
+    job = config.current_job()
 
-    all_case_file_content = create_OF_case_json(config.OUTPUT_PATH)
+    all_case_file_content = prompt_context.case_context(job.output_case_path, running_error)
 
     file_content = None
 
-    case_files = list_case_file(config.OUTPUT_PATH)
+    case_files = list_case_file(job.output_case_path)
 
     case_files = dict_to_json_string(case_files)    # json.dumps()
 
@@ -396,15 +420,16 @@ def analyze_running_error_with_all_case_file_content(running_error):
     return [wrong_file,advices_for_revision]
 
 def analyze_running_error_2(running_error, file_name):
+    job = config.current_job()
 
     file_content = None
 
-    file_path = f'{config.OUTPUT_PATH}/{file_name}'
+    file_path = f'{job.output_case_path}/{file_name}'
 
-    with open(file_path, "r", encoding="utf-8") as file:
-        file_content = file.read()
+    # Large nonuniform List payloads are replaced by a summary
+    file_content = foam_payload.read_compact(file_path)[0]
 
-    case_files = list_case_file(config.OUTPUT_PATH)
+    case_files = list_case_file(job.output_case_path)
 
     analyze_running_error_prompt = f'''
     Analyze the provided OpenFOAM runtime error {running_error} to identify the root cause. Give advice on correcting the file {file_name} with the file contents as {file_content}.
@@ -448,14 +473,15 @@ def analyze_error_repetition(error_history):
         return False
 
 def rewrite_file(file_name, reference_files):
+    job = config.current_job()
     print(f"rewriting {file_name}")
 
     file_content = None
 
-    file_path = f'{config.OUTPUT_PATH}/{file_name}'
+    file_path = f'{job.output_case_path}/{file_name}'
 
-    with open(file_path, "r", encoding="utf-8") as file:
-        file_content = file.read()
+    # Large nonuniform List payloads are replaced by a summary, and copied back when the file is written
+    file_content, payloads = foam_payload.read_compact(file_path)
 
     correct_file_prompt = f'''{config.general_prompts}
     Please rewrite the {file_name} file for the OpenFOAM case. The original file content is: {file_content}. You can reference these files from OpenFOAM tutorial {reference_files} for formating and key values. Ensure the dimension is correct if the dimension shows in the file content.
@@ -472,7 +498,7 @@ def rewrite_file(file_name, reference_files):
     answer = file_writer.extract_pure_response(answer)
 
     try:
-        file_writer.write_field_to_file(answer,file_path)
+        file_writer.write_field_to_file(answer,file_path,payloads)
         print(f"write the file {file_name}")
 
     except Exception as e:
@@ -482,15 +508,16 @@ def rewrite_file(file_name, reference_files):
 
 
 def analyze_running_error_with_reference_files(running_error, file_name,early_revision_advice, reference_files):
+    job = config.current_job()
 
     file_content = None
 
-    file_path = f'{config.OUTPUT_PATH}/{file_name}'
+    file_path = f'{job.output_case_path}/{file_name}'
 
-    with open(file_path, "r", encoding="utf-8") as file:
-        file_content = file.read()
+    # Large nonuniform List payloads are replaced by a summary
+    file_content = foam_payload.read_compact(file_path)[0]
 
-    case_files = list_case_file(config.OUTPUT_PATH)
+    case_files = list_case_file(job.output_case_path)
 
     analyze_running_error_prompt = f'''Analyze the provided OpenFOAM runtime error [[[ {running_error} ]]] to identify the root cause. Give advice on correcting the file { {file_name} } with the file contents as [[[ {file_content} ]]]. The revision must not alter the file to voilate these initial and boundary conditions in the paper [[[ {config.case_ic_bc_from_paper} ]]]. You can refer to these files from OpenFOAM tutorial [[[ {reference_files} ]]] to improve the correction advice.
 
@@ -511,19 +538,20 @@ In your response: Absolutely AVOID any elements including but not limited to:
     return advices_for_revision
 
 def single_file_corrector2(file_name, advices_for_revision, reference_files):
+    job = config.current_job()
     print(f"correcting {file_name}")
 
     file_content = None
 
-    file_path = f'{config.OUTPUT_PATH}/{file_name}'
+    file_path = f'{job.output_case_path}/{file_name}'
 
-    with open(file_path, "r", encoding="utf-8") as file:
-        file_content = file.read()
+    # Large nonuniform List payloads are replaced by a summary, and copied back when the file is written
+    file_content, payloads = foam_payload.read_compact(file_path)
 
     correct_file_prompt = f'''{config.general_prompts} Correct the OpenFOAM case file.
 Please correct the { {file_name} } file with file contents as { {file_content} } to strictly adhere to the following correction advice { {advices_for_revision} }. Ensure the dimension in [] is correct if the dimension shows in the file content. You must not change any other contents of the file except for the correction advice or dimension in [].
 You can reference these files from OpenFOAM tutorial { {reference_files} } for formatting.
-This is the name of the boundary condition and the corresponding type [[{config.grid_info.grid_boundary_conditions}]] for this example. Please ensure that the boundary condition settings in the file comply with it.
+This is the name of the boundary condition and the corresponding type [[{job.grid_info.grid_boundary_conditions}]] for this example. Please ensure that the boundary condition settings in the file comply with it.
 
 In your final response after "Here is my response:", absolutely AVOID any elements including but not limited to:
 - Markdown code block markers (``` or  ```)
@@ -536,7 +564,7 @@ In your final response after "Here is my response:", absolutely AVOID any elemen
     answer = file_writer.extract_pure_response(answer)
 
     try:
-        file_writer.write_field_to_file(answer,file_path)
+        file_writer.write_field_to_file(answer,file_path,payloads)
         print(f"write the file {file_name}")
 
     except Exception as e:
@@ -545,10 +573,11 @@ In your final response after "Here is my response:", absolutely AVOID any elemen
         file_write_successful = True
 
 def ensure_all_field_file_dimensions():
+    job = config.current_job()
 
     print(f"Ensuring all field file dimensions")
 
-    case_0_folder = f'{config.OUTPUT_PATH}/0'
+    case_0_folder = f'{job.output_case_path}/0'
 
     folder_path = Path(case_0_folder)
 
@@ -557,9 +586,7 @@ def ensure_all_field_file_dimensions():
         if file_path.is_file():
             field_file = f'{case_0_folder}/{file_path.name}'
 
-        with open(file_path, "r", encoding="utf-8") as file:
-            file_content = file.read()
-            a = 1
+        file_content, payloads = foam_payload.read_compact(file_path)
 
         # reference_files = find_reference_files_by_solver(field_file)
 
@@ -579,7 +606,7 @@ def ensure_all_field_file_dimensions():
         answer = file_writer.extract_pure_response(answer)
 
         try:
-            file_writer.write_field_to_file(answer,file_path)
+            file_writer.write_field_to_file(answer,file_path,payloads)
             print(f"write the file 0/{file_path.name}")
 
         except Exception as e:
@@ -596,11 +623,13 @@ def find_reference_files(target_file, case_name = None):
     Returns:
         files_content (dict): key is case_name, value is corresponding content
     """
+    job = config.current_job()
     if case_name == None:
-        case_name = config.case_name
+        case_name = job.case_info.case_name
 
     class ReferenceFilesContent(BaseModel):
         files: Dict[str, str] = Field(description="A dictionary where keys are case names and values are the content of the target file for that case.")
+    from langchain.output_parsers import PydanticOutputParser
     parser = PydanticOutputParser(pydantic_object=ReferenceFilesContent)
     print("Searching for related files...")
     qa = QA_NoContext_deepseek_V3()
@@ -622,16 +651,16 @@ def find_reference_files(target_file, case_name = None):
 3. If selectable_files lists only case names without corresponding file contents, leave the content of the {target_file} as an empty string.
 </Output_Requirements>"""
 
-    solver = config.case_solver
-    turbulence_model = config.case_turbulence_model
-    other_physical_model = config.other_physical_model
+    solver = job.case_info.case_solver
+    turbulence_model = job.case_info.turbulence_model
+    other_physical_model = job.case_info.other_physical_model
 
     # Search for reference files, try to ensure reference cases that match both solver and turbulence model
     loose = 0 # Search looseness level, 0 means consider special physical models, 1 means ignore
     file_content = {} # (case_name, file_content), [[], []]
     has_content = True # Whether the returned file_content has content
     while len(file_content) == 0 and loose < 2:
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
             if solver==value["solver"] and turbulence_model == value["turbulence_model"]:
                 # If there is other_physical_model, need to check if they are the same
                 if loose < 1:
@@ -654,7 +683,7 @@ def find_reference_files(target_file, case_name = None):
     if len(file_content) == 0:
         print("No cases that match both solver and turbulence model")
         file_content_sol = {}
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
             if solver == value["solver"]:
                 config_files = value['configuration_files']
                 if target_file in config_files.keys():
@@ -663,13 +692,13 @@ def find_reference_files(target_file, case_name = None):
         # If still no cases matching the solver are found, search from domain (e.g., compressible) (actually special files needed by different turbulence models)
         if len(file_content_sol) == 0:
             domain_type = None
-            for key, value in config.OF_case_data_dict.items():
+            for key, value in job.OF_case_data_dict.items():
                 if solver in key:
                     path_split = key.split('/')
                     domain_type = path_split[0]
                     break
             if domain_type is not None:
-                for key, value in config.OF_case_data_dict.items():
+                for key, value in job.OF_case_data_dict.items():
                     path_split = key.split('/')
                     if domain_type == path_split[0]:
                         config_files = value['configuration_files']
@@ -686,32 +715,26 @@ def find_reference_files(target_file, case_name = None):
                     file_content_sol[k] = ""
                 has_content = False
 
-            file_content_sol = qa.ask(select_appropriate_files.format(
-                case_name=case_name,
-                target_file=target_file,
-                file_num=2,
-                simulation_requirements=config.case_description,
-                selectable_files=file_content_sol,
-                response_format=parser.get_format_instructions()
-            ))
-
             max_retries = 3  # Maximum retry attempts
-            file_content = robust_llm_parse(
+            selected = robust_llm_parse(
                 qa,
                 select_appropriate_files.format(
                     case_name=case_name,
                     target_file=target_file,
                     file_num=2,
-                    simulation_requirements=config.case_description,
+                    simulation_requirements=job.case_info.case_description,
                     selectable_files=file_content_sol,
                     response_format=parser.get_format_instructions()
                 ),
                 parser,
                 max_retries=max_retries
-            ).files
+            )
 
-            if file_content == None:
-                file_content = random.sample(list(file_content_sol.keys()), 2) if isinstance(file_content, dict) else file_content
+            if selected is None:
+                print("Randomly selecting 2 as reference")
+                file_content = {name: file_content_sol[name] for name in random.sample(list(file_content_sol.keys()), 2)}
+            else:
+                file_content = selected.files
 
         else:
             file_content = file_content_sol
@@ -724,27 +747,19 @@ def find_reference_files(target_file, case_name = None):
                 has_content = False
             # print(file_content)
             max_retries = 3  # Maximum retry attempts
-            for attempt in range(max_retries):
-                try:
-                    # Get file content
-                    file_content = qa.ask(select_appropriate_files.format(
-                        case_name=case_name,
-                        target_file=target_file,
-                        file_num=2,
-                        simulation_requirements=config.case_description,
-                        selectable_files=json.dumps(file_content, ensure_ascii=False, indent=4),
-                        response_format=parser.get_format_instructions()
-                    ))
-                    file_content = parser.parse(file_content).files
-                    break  # Parsing successful, exit loop
-                except Exception as e:
-                    print(f"Failed to parse when searching for reference files (attempt {attempt + 1}/{max_retries}): {e}")
-
-                    if attempt < max_retries - 1:
-                        continue  # Continue retrying
-                    else:
-                        print("Maximum retry attempts reached, randomly selecting 2 as reference")
-                        file_content = random.sample(file_content, 2)
+            try:
+                file_content = qa_modules.ask_json(qa, select_appropriate_files.format(
+                    case_name=case_name,
+                    target_file=target_file,
+                    file_num=2,
+                    simulation_requirements=job.case_info.case_description,
+                    selectable_files=json.dumps(file_content, ensure_ascii=False, indent=4),
+                    response_format=parser.get_format_instructions()
+                ), ReferenceFilesContent, max_attempts=max_retries).files
+            except stream_json.StructuredOutputError as e:
+                print(f"Failed to parse when searching for reference files: {e}")
+                print("Maximum retry attempts reached, randomly selecting 2 as reference")
+                file_content = {name: file_content[name] for name in random.sample(list(file_content.keys()), 2)}
         else:
             file_content = json.dumps(file_content, ensure_ascii=False, indent=4)
 
@@ -754,99 +769,68 @@ def find_reference_files(target_file, case_name = None):
     # print("file_content:",file_content)
     return file_content
 
-def clean_json_string(json_str):
-    """Clean problematic characters in a JSON string"""
-    # Remove leading and trailing whitespace
-    json_str = json_str.strip()
-    
-    # Fix common escape character issues
-    replacements = [
-        (r'\\(?!["\\/bfnrtu])', r'\\\\'),
-        (r'\\"', r'"'),
-        (r'\\n', r'\n'),
-        (r'\\t', r'\t'),
-        (r'\\r', r'\r'),
-    ]
-    
-    for old, new in replacements:
-        json_str = re.sub(old, new, json_str)
-    
-    return json_str
-
 def extract_content_from_response(llm_response, output_type = 'json'):
-    llm_response = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', llm_response)  # 去掉非法控制字符
+    """Content of an LLM answer
+    Args:
+        llm_response (str): Answer
+        output_type (str): 'json' or 'dict' for the first JSON value (repaired if needed), 'str' for the first ``` block
+    Returns:
+        content (dict, list or str)
+    Raises:
+        ValueError: If output_type is 'json' and the answer has no JSON value
+    """
     if output_type == 'json' or output_type == 'dict':
-        llm_response = json.dumps(llm_response)  # Handle \n and \" in values
-        patterns = [
-            r'```json\s*(.*?)\s*```',
-            r'```\s*(.*?)\s*```',
-            r'\[.*?\]'
-        ]
-        for pattern in patterns:
-            # print(pattern)
-            match = re.search(pattern, llm_response, re.DOTALL)
-            if match:
-                json_str = match.group(1) if '```' in pattern else match.group(0)
-                # print(json_str)
-                # Clean and fix JSON string
-                json_str = clean_json_string(json_str)
-                # print(json_str)
-                try:
-                    content = json.loads(json_str)
-                    return content
-                except json.JSONDecodeError as e:
-                    # print(f"JSON parsing error: {e}")
-                    continue
-
-        # Direct processing
-        try:
-            content = json.loads(llm_response.strip())
-        except:
-            # Find the content within the first closed {} or [] in llm_response
-            start = llm_response.find('{')
-            start_ = llm_response.find('[')
-            if start < start_:
-                pos = start + 1
-                depth = 1
-                while pos < len(llm_response) and depth > 0:
-                    if llm_response[pos] == '{':
-                        depth += 1
-                    elif llm_response[pos] == '}':
-                        depth -= 1
-                    pos += 1
-            else:
-                pos = start_ + 1
-                depth = 1
-                while pos < len(llm_response) and depth > 0:
-                    if llm_response[pos] == '[':
-                        depth += 1
-                    elif llm_response[pos] == ']':
-                        depth -= 1
-                    pos += 1
-            content = json.loads(llm_response[start:pos])
-
+        return llm_extract.parse_json(llm_response)
     elif output_type == 'str':
-        pattern = r'```(.*?)```'
-        match = re.search(pattern, llm_response, re.DOTALL)
-        if match == None:
-            content = ""
-        else:
-            content = match.group(1).strip()
-            if content.startswith("text") or content.startswith("Text"):
-                content = content[4:]
-            if content.startswith("cpp"):
-                content = content[3:]
-
-    return content
+        return llm_extract.extract_code_block(llm_extract.strip_control_chars(llm_response))
+
+def mesh_quality_context():
+    """Mesh quality problems of the current case as prompt context, empty when the mesh passed the checks"""
+    quality = config.current_job().grid_info.mesh_quality
+    if quality is None or quality.ok:
+        return ""
+    return f"""
+<mesh_quality>
+The mesh of this case failed the quality checks. Errors such as floating point exceptions or diverging solutions may come from the mesh rather than from the case files; prefer more robust numerics (non-orthogonal correctors, limited schemes, lower relaxation factors) over changing physical settings.
+{quality.summary()}
+</mesh_quality>"""
+
+def find_known_fixes(running_error):
+    """Recorded fixes of the same or similar errors for the solver of the current job
+    Returns:
+        replayable (dict): A fix of the same error made from the current state of the case files, None if there is none
+        examples (list): Fixes to show as examples in the correction prompts
+    """
+    store = experience_store.default_store()
+    if store is None:
+        return None, []
+    job = config.current_job()
+    try:
+        experiences = store.find(running_error, job.case_info.case_solver, job.case_info.turbulence_model,
+                                 k=config.run_cfg.known_fix_examples + 3, min_similarity=config.run_cfg.reflection_min_similarity)
+    except Exception as e:
+        print(f"Error occurred while querying the experience store: {e}")
+        return None, []
+    signature = reflection_store.error_signature(running_error)
+    replayable = None
+    if config.run_cfg.apply_known_fixes:
+        for experience in experiences:
+            if experience["signature"] == signature and experience["outcome"] == experience_store.PASSED \
+                    and store.applicable(experience, job.output_case_path):
+                replayable = experience
+                break
+    return replayable, experiences[:config.run_cfg.known_fix_examples]
 
 def analyse_error(running_error, case_files=None, relevant_reflections = ""):
+    job = config.current_job()
     if case_files is None:
-        case_files = config.case_info.file_structure
+        case_files = job.case_info.file_structure
         # print(case_files)
 
     class SuspiciousFilesResponse(BaseModel):
         files: Dict[str, str] = Field(description="A mapping from file name to the possible reasons for the error")
 
+    from langchain.output_parsers import PydanticOutputParser
     parser = PydanticOutputParser(pydantic_object=SuspiciousFilesResponse)
 
     print("Searching for files that may cause OpenFOAM errors...")
@@ -888,12 +872,12 @@ Analyze the error message and, in light of the physical meaning and role of each
 
     if relevant_reflections != "":
         search_for_suspicious_files += f"\n{relevant_reflections}"
+    search_for_suspicious_files += mesh_quality_context()
     qa = QA_NoContext_deepseek_V3()
 
     suspicious_files = None
 
-    response = qa.ask(search_for_suspicious_files)
-    suspicious_files = parser.parse(response).files
+    suspicious_files = qa_modules.ask_json(qa, search_for_suspicious_files, SuspiciousFilesResponse).files
     print("suspicious_files:\n", suspicious_files)
 
     if len(suspicious_files) > 1:   # If suspicious files > 1, need to check combined with file content
@@ -901,10 +885,8 @@ Analyze the error message and, in light of the physical meaning and role of each
         # Get content from suspicious files
         suspicious_file_content = {}
         for name, reason in suspicious_files.items():
-            if os.path.exists(os.path.join(config.path_cfg.output_case_path, name)) != False:
-                with open(os.path.join(config.path_cfg.output_case_path, name), "r") as f:
-                    file_content = f.read()
-                    suspicious_file_content[name] = file_content
+            if os.path.exists(os.path.join(job.output_case_path, name)) != False:
+                suspicious_file_content[name] = foam_payload.read_compact(os.path.join(job.output_case_path, name))[0]
 
         class ErrorFilesResponse(BaseModel):
             files: Dict[str, str] = Field(description="A mapping from file name to the reasons for the error")
@@ -952,25 +934,18 @@ Interpret the error message in light of each file's content, physical meaning, a
 
         if relevant_reflections != "":
             search_for_error_files += f"\n{relevant_reflections}"
+        search_for_error_files += mesh_quality_context()
 
         qa = QA_NoContext_deepseek_R1()
 
         error_files = None
         max_retries = 3  # Set maximum retry count
-        for attempt in range(max_retries):
-            try:
-                response = qa.ask(search_for_error_files)
-                error_files = parser.parse(response).files
-                break  # If parsing is successful, exit the loop
-            except Exception as e:
-                print(f"Parsing failed (attempt {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:  # If not the last attempt
-                    print("Retrying...")
-                    continue
-                else:
-                    print("Reached maximum retry count, unable to parse response, using suspicious files directly")
-                    error_files = suspicious_files   # If
-                    break
+        try:
+            error_files = qa_modules.ask_json(qa, search_for_error_files, ErrorFilesResponse, max_attempts=max_retries).files
+        except stream_json.StructuredOutputError as e:
+            print(f"Parsing failed: {e}")
+            print("Reached maximum retry count, unable to parse response, using suspicious files directly")
+            error_files = suspicious_files
 
         print("error_files:\n", suspicious_files)
 
@@ -988,8 +963,15 @@ def correct_error(running_error, error_files, case_files=None, relevant_reflecti
     Returns:
         files_corrected(list): List of modified files
     """
+    job = config.current_job()
     if case_files is None:
-        case_files = config.case_info.file_structure
+        case_files = job.case_info.file_structure
+
+    replayable, known_fixes = find_known_fixes(running_error)
+    if replayable is not None:
+        print(f"Replaying the recorded fix {replayable['id']} from case {replayable['case_name']}")
+        return experience_store.default_store().apply(replayable, job.output_case_path)
+    known_fixes_context = experience_store.few_shot_context(known_fixes)
 
     class FileReference(BaseModel):
         """FileReference={'reference_files':[], 'reference_reason':''}"""
@@ -998,6 +980,7 @@ def correct_error(running_error, error_files, case_files=None, relevant_reflecti
     class ErrorFilesResponse(BaseModel):
         """{'error_files':{'': FileReference}}"""
         error_files: Dict[str, FileReference] = Field(description="Error files and their reference information")
+    from langchain.output_parsers import PydanticOutputParser
     parser = PydanticOutputParser(pydantic_object=ErrorFilesResponse)   # Create parser
 
     search_relevant_files = f'''The OpenFOAM case reports the following error. After analysis, the listed files are suspected. When fixing these files, cross-file references may be necessary. Please list, for each file to be modified, the other files that should be consulted and the reasons why.
@@ -1061,16 +1044,15 @@ Combine the error message with the content, physical meaning, and role of each f
         reference_files[k_clean] = find_reference_files(k_clean)
         
     files_content = {}     # key: names of files used for modification and reference, value: corresponding file content
+    files_payloads = {}    # key: names of files, value: list payloads elided from files_content, see foam_payload
     for k, v in relevant_files.items():
         if k not in files_content.keys():
-            if os.path.exists(os.path.join(config.path_cfg.output_case_path, k)) != False:
-                with open(os.path.join(config.path_cfg.output_case_path, k), "r") as f:
-                    files_content[k] = f.read()
+            if os.path.exists(os.path.join(job.output_case_path, k)) != False:
+                files_content[k], files_payloads[k] = foam_payload.read_compact(os.path.join(job.output_case_path, k))
         for v_ in v:
             if v_ not in files_content.keys():
-                if os.path.exists(os.path.join(config.path_cfg.output_case_path, v_)) != False:
-                    with open(os.path.join(config.path_cfg.output_case_path, v_), "r") as f:
-                        files_content[v_] = f.read()
+                if os.path.exists(os.path.join(job.output_case_path, v_)) != False:
+                    files_content[v_], files_payloads[v_] = foam_payload.read_compact(os.path.join(job.output_case_path, v_))
 
     processed_files = set()
     correcting_advice = {}
@@ -1125,13 +1107,15 @@ Combine the error message with the content, physical meaning, and role of each f
 
 6. Case configuration requirements:
 <case_requirements>
-{config.case_description}
+{job.case_info.case_description}
 </case_requirements>
 
 Output requirements:
 {output_requirements}"""
         if relevant_reflections != "":
             advice_based_on_ref += f"\n{relevant_reflections}"
+        advice_based_on_ref += known_fixes_context
+        advice_based_on_ref += mesh_quality_context()
 
         MAX_LENGTH = 98304/2  # The maximum input length limit of OpenAI
         if len(advice_based_on_ref) > MAX_LENGTH:
@@ -1174,12 +1158,12 @@ Output requirements:
 
 5. Mesh boundary conditions:
     <mesh_boundary_condition>
-    {config.grid_info.grid_boundary_conditions}
+    {job.grid_info.grid_boundary_conditions}
     </mesh_boundary_condition>
 
 6. Case configuration requirements:
     <case_requirements>
-    {config.case_description}
+    {job.case_info.case_description}
     </case_requirements>
 
 Output requirements:
@@ -1191,10 +1175,9 @@ Output requirements:
         response = qa.ask(correct_error_file)
         if "NO" not in response:
 
-            with open(os.path.join(config.path_cfg.output_case_path, error_file_name), "w") as f:
-                print(f"Modified: {os.path.join(config.path_cfg.output_case_path, error_file_name)}")
-                new_file_content = extract_content_from_response(response,"str")
-                f.write(new_file_content)
+            print(f"Modified: {os.path.join(job.output_case_path, error_file_name)}")
+            new_file_content = extract_content_from_response(response,"str")
+            foam_payload.write_with_payloads(os.path.join(job.output_case_path, error_file_name), new_file_content, files_payloads.get(error_file_name))
                 
             files_corrected[error_file_name] = [files_content[error_file_name], new_file_content]
     print(f"Modified: {files_corrected.keys()}")
@@ -4,16 +4,20 @@ import re
 
 import subprocess
 from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
-from PyFoam.Basics.DataStructures import BinaryList
 
 import config
+import fluent_mesh
+import mesh_cache
+import mesh_quality
+import polymesh
 import pdf_chunk_ask_question
+import qa_modules
+import tracing
 from qa_modules import QA_NoContext_deepseek_V3,QA_NoContext_deepseek_R1
 from file_corrector import extract_content_from_response, find_reference_files
 
 from pydantic import BaseModel, Field
 from typing import List, Dict
-from langchain.output_parsers import PydanticOutputParser
 
 
 def convert_mesh(output_case_path=None, grid_path=None, grid_type=None):
@@ -24,40 +28,57 @@ def convert_mesh(output_case_path=None, grid_path=None, grid_type=None):
     Returns:
         bool: Whether conversion/copying is successful
     """
+    job = config.current_job()
     if output_case_path is None:
-        output_case_path = config.path_cfg.output_case_path
+        output_case_path = job.output_case_path
     if grid_path is None:
-        grid_path = config.path_cfg.grid_path
+        grid_path = job.grid_path
     if grid_type is None:
-        grid_type = config.grid_type
+        grid_type = job.grid_type
     try:
         constant_path = os.path.join(output_case_path, "constant")
 
-        if grid_type == "msh":
+        # Identical input meshes are converted once and then linked into each case directory
+        digest = mesh_cache.mesh_digest(grid_path, grid_type)
+        cached_polymesh = mesh_cache.lookup(digest)
+        if cached_polymesh is not None:
+            mesh_cache.materialize(cached_polymesh, constant_path)
+            print(f"Mesh loaded from cache ({digest[:12]})")
+        elif grid_type == "msh":
             command = [
                 "fluentMeshToFoam",
                 "-case",
                 output_case_path,
                 grid_path
             ]
-            subprocess.run(command, check=True)
+            with tracing.span("subprocess", command="fluentMeshToFoam", mesh=grid_path):
+                subprocess.run(command, check=True, env=config.openfoam_env())
             print("Mesh conversion completed successfully")
+            mesh_cache.store(digest, os.path.join(constant_path, "polyMesh"))
         elif grid_type == "polyMesh":
             if not os.path.exists(constant_path):
                 os.makedirs(constant_path)
             print(f"Copying mesh to {constant_path}/")
-            command = f"cp -r {grid_path} {constant_path}"
-            # print(command)
-
-            subprocess.run(command, shell=True, check=True)
+            cached_polymesh = mesh_cache.store(digest, grid_path)
+            if cached_polymesh is not None:
+                mesh_cache.materialize(cached_polymesh, constant_path)
+            else:
+                command = f"cp -r {grid_path} {constant_path}"
+                subprocess.run(command, shell=True, check=True)
             print("Mesh loaded successfully")
 
-        config.mesh_convert_success = True
+        job.mesh_convert_success = True
+        try:
+            job.grid_info.mesh_stats = polymesh.read_mesh_stats(os.path.join(constant_path, "polyMesh"))
+            print(f"Mesh size: {job.grid_info.mesh_stats.n_cells} cells, {job.grid_info.mesh_stats.n_points} points")
+        except (OSError, ValueError) as e:
+            print(f"Failed to read mesh statistics: {e}")
+        check_mesh_quality(os.path.join(constant_path, "polyMesh"))
         # Save initial boundary file
         boundary_path = os.path.join(constant_path, "polyMesh/boundary")
         with open(boundary_path, "r", encoding="utf-8") as file:
             boundary_content = file.read()
-        config.grid_info.grid_boundary_init = boundary_content
+        job.grid_info.grid_boundary_init = boundary_content
 
         return True
     except subprocess.CalledProcessError as e:
@@ -69,6 +90,29 @@ def convert_mesh(output_case_path=None, grid_path=None, grid_type=None):
         print("Related files or directories not found")
         return False
 
+def check_mesh_quality(polymesh_path=None):
+    """Check the converted mesh (volumes, non-orthogonality, skewness) and store the result in grid_info.mesh_quality
+    Args:
+        polymesh_path (str): polyMesh directory, defaults to constant/polyMesh of the current case
+    Returns:
+        quality (mesh_quality.MeshQuality): Check result, None if the mesh could not be read
+    """
+    job = config.current_job()
+    if polymesh_path is None:
+        polymesh_path = os.path.join(job.output_case_path, "constant", "polyMesh")
+    try:
+        quality = mesh_quality.check_mesh(
+            polymesh_path,
+            max_non_orthogonality=config.run_cfg.max_non_orthogonality,
+            max_skewness=config.run_cfg.max_skewness,
+        )
+    except (OSError, ValueError, IndexError) as e:
+        print(f"Failed to check mesh quality: {e}")
+        return None
+    job.grid_info.mesh_quality = quality
+    print(f"Mesh quality:\n{quality.summary()}")
+    return quality
+
 def extract_boundary_names(grid_file_path, grid_type = None):
     """
     Extract boundary condition names from fluent.msh mesh file
@@ -78,46 +122,20 @@ def extract_boundary_names(grid_file_path, grid_type = None):
     Returns:
         result list (list): List of extracted boundary condition names (dict for polyMesh)
     """
+    job = config.current_job()
     if grid_file_path == None:
-        grid_file_path = config.path_cfg.grid_path
+        grid_file_path = job.grid_path
     if grid_type == None:
-        grid_type = config.grid_type
+        grid_type = job.grid_type
     if grid_type == "msh":
-        # Read file content
-        with open(grid_file_path, 'r') as f:
-            content = f.read().splitlines()
-
-        # Find starting point
-        start_index = -1
-        for i in range(len(content)-1, -1, -1):  # Find starting line from back to front
-            if content[i].strip() == '(0 "Zone Sections")':
-                start_index = i
-                break
-
-            if content[i].strip().startswith('4 4 4 4 4 4 4 4 4'):
-                start_index = i
-                break
-        
-        if start_index == -1:
-            return []
-
-        # Extract relevant lines
-        pattern = re.compile(r'\(\d+\s+\(\d+\s+\S+\s+(\S+)\)\(\)\)')
+        # Only the zone definitions (39/45 sections) are read, the mesh data is never loaded
+        boundary_zones = fluent_mesh.read_boundary_zones(grid_file_path)
         results = []
-        
-        # Process each line of data
-        for line in content[start_index+1:]:
-            line = line.strip()
-            if not line.startswith('(39'):
-                continue
-                
-            match = pattern.match(line)
-            if match:
-                value = match.group(1)
-                # Filter *_FLUID and *_SOLID
-                if not re.search(r'^(FLUID|\w+?_FLUID|\w+?_SOLID)$', value):
-                    results.append(value)
-        
+        for value in boundary_zones:
+            # Filter *_FLUID and *_SOLID
+            if not re.search(r'^(FLUID|\w+?_FLUID|\w+?_SOLID)$', value):
+                results.append(value)
+
         # config.case_boundaries = results
         return results
     elif grid_type == "polyMesh":
@@ -126,13 +144,10 @@ def extract_boundary_names(grid_file_path, grid_type = None):
         boundary_types = []
     
         try:
-            boundary_content = ParsedParameterFile(os.path.join(grid_file_path, "boundary"), boundaryDict=True).content
-            if type(boundary_content) == BinaryList:
-                raise ValueError("Binary content is not supported")
-            numOfBoundaries = len(boundary_content) // 2    # 0,2,4... are boundary names, 1,3,5... are boundary types
-            for i in range(numOfBoundaries):
-                boundary_names.append(boundary_content[i * 2])
-                boundary_types.append(boundary_content[i * 2 + 1]["type"])
+            patches = polymesh.read_boundary(grid_file_path)
+            for name, patch in patches.items():
+                boundary_names.append(name)
+                boundary_types.append(patch["type"])
 
             # print("boundary_names:\n", boundary_names)
             # print("boundary_types:\n", boundary_types)
@@ -145,11 +160,8 @@ def extract_boundary_names(grid_file_path, grid_type = None):
                 return boundary_dict  # .........
                 # return boundary_names
         except:
-            if type(boundary_content) == BinaryList:
-                boundary_content = boundary_content.data
-            else:
-                with open(os.path.join(grid_file_path, "boundary"), 'r', encoding='utf-8') as file:
-                    boundary_content = file.read()
+            with open(os.path.join(grid_file_path, "boundary"), 'r', encoding='utf-8', errors='replace') as file:
+                boundary_content = file.read()
 
             pattern = r'(\w+)\s*\{[^}]*?type\s+(\w+);'
             # pattern = r'(\w+)\s*\n\s*\{\s*type\s+(\w+);'
@@ -162,8 +174,9 @@ def extract_boundary_names(grid_file_path, grid_type = None):
 
 def setup_cfl_control(case_path, max_co=0.6, controlDict_ref=None):
     """Set CFL control parameters"""
+    job = config.current_job()
     demo_compressible_solver = ["rhoCentralFoam", "sonicFoam"]
-    if controlDict_ref is None or solver in demo_compressible_solver:
+    if controlDict_ref is None or job.case_info.case_solver in demo_compressible_solver:
         try:
             # Modify controlDict file
             control_dict_path = f'{case_path}/system/controlDict'
@@ -208,7 +221,7 @@ def setup_cfl_control(case_path, max_co=0.6, controlDict_ref=None):
             
             # Save modifications
             control_dict.writeFile()
-            config.set_controlDict_time = True
+            job.set_controlDict_time = True
             print("Successfully configured CFL control parameters")
             return True
         except Exception as e:
@@ -220,14 +233,22 @@ def setup_cfl_control(case_path, max_co=0.6, controlDict_ref=None):
             """{'deltaT':str}"""
             deltaT: str = Field(description="The value of deltaT")
 
+        from langchain.output_parsers import PydanticOutputParser
         parser = PydanticOutputParser(pydantic_object=deltaTSetting)   # Create parser
         qa = QA_NoContext_deepseek_V3()
+        mesh_requirement = ""
+        mesh_stats = job.grid_info.mesh_stats
+        if mesh_stats is not None and mesh_stats.n_cells:
+            # The stable deltaT scales with the cell size, which the tutorial controlDict does not know
+            (x0, y0, z0), (x1, y1, z1) = mesh_stats.bounding_box
+            mesh_requirement = (f"\n- Mesh: {mesh_stats.n_cells} cells, bounding box ({x0:.4g} {y0:.4g} {z0:.4g}) to "
+                                f"({x1:.4g} {y1:.4g} {z1:.4g}), mean cell size {mesh_stats.mean_cell_size:.4g}")
         set_deltaT_prompt = f"""I will simulate the following case using OpenFOAM-v2406 and need to set deltaT in controlDict. Please help me complete this setting:
 
 <case_requirements>
-- Solver: {config.case_info.case_solver}
-- Turbulence model: {config.case_info.turbulence_model}
-- Case description: {config.case_info.case_description}
+- Solver: {job.case_info.case_solver}
+- Turbulence model: {job.case_info.turbulence_model}
+- Case description: {job.case_info.case_description}{mesh_requirement}
 </case_requirements>
 
 Here is a controlDict file from the OpenFOAM tutorials for your reference:
@@ -244,7 +265,7 @@ Please strictly follow the requirements below for the output:
 2. Do not include any additional text, explanations, or Markdown formatting.
 </output_requirements>"""
 
-        deltaT_value = parser.parse(qa.ask(set_deltaT_prompt)).deltaT
+        deltaT_value = qa_modules.ask_json(qa, set_deltaT_prompt, deltaTSetting).deltaT
         # print(f"deltaT_value: {deltaT_value}")
 
         try:
@@ -266,7 +287,7 @@ Please strictly follow the requirements below for the output:
 
             # Save modifications
             control_dict.writeFile()
-            config.set_controlDict_time = True
+            job.set_controlDict_time = True
             print("Successfully configured CFL control parameters")
             return True
         except Exception as e:
@@ -298,16 +319,17 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
         required_files (set): List of files to be generated
         file_turbulence_model(dict): Reference cases for generating file structure and their corresponding turbulence models
     """
+    job = config.current_job()
     # if solver == None:
-    #     solver=config.case_solver
-    config.case_solver = solver
-    config.case_turbulence_model = turbulence_model
+    #     solver=job.case_info.case_solver
+    job.case_info.case_solver = solver
+    job.case_info.turbulence_model = turbulence_model
     # if turbulence_model == None:
-    #     turbulence_model=config.case_turbulence_model
+    #     turbulence_model=job.case_info.turbulence_model
     if other_physical_model == None:
-        other_physical_model = config.case_info.other_physical_model
+        other_physical_model = job.case_info.other_physical_model
     if case_name == None:
-        case_name = config.case_info.other_physical_model
+        case_name = job.case_info.other_physical_model
 
     # Find reference files and select required files for the case based on simulation requirements
     file_alternative = {}
@@ -318,7 +340,7 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
     # Ensure the solver and turbulence model are the same, and try to keep other physical models the same as much as possible
     loose = 0 # Search looseness level, 0 means considering special physical models, 1 means not considering
     while len(file_alternative) == 0 and loose < 2:
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
             # Ensure the solver is the same
             if solver==value["solver"] and turbulence_model == value["turbulence_model"]:
                 if loose < 1:
@@ -339,7 +361,7 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
         # Ensure the solver must be the same
         loose = 0
         while len(file_alternative) == 0 and loose < 2:
-            for key, value in config.OF_case_data_dict.items():
+            for key, value in job.OF_case_data_dict.items():
                 if solver==value["solver"]:
                     if loose < 1:
                         if "other_physical_model" in value.keys():
@@ -359,13 +381,13 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
     if len(file_alternative) == 0:
         # If not found, search from domain
         domain_type = None
-        for key, value in config.OF_case_data_dict.items():
+        for key, value in job.OF_case_data_dict.items():
             if solver in key:
                 path_split = key.split('/')
                 domain_type = path_split[0]
                 break
         if domain_type is not None:
-            for key, value in config.OF_case_data_dict.items():
+            for key, value in job.OF_case_data_dict.items():
                 if domain_type == key.split('/')[0]:
                     file_alternative[key.split("/")[-1]] = set(value['configuration_files'].keys())
                     file_turbulence_model[key.split("/")[-1]] = value["turbulence_model"]
@@ -433,12 +455,12 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
     if response.lower() == "none":
         print("No suitable reference case found, using default file list")
         
-        if config.case_turbulence_model in ["SpalartAllmarasDDES", "SpalartAllmarasIDDES"]:
-            config.case_turbulence_type = "LES"
-        elif config.case_turbulence_model in ["SpalartAllmaras","kOmegaSST","LaunderSharmaKE","realizableKE","kOmegaSSTLM","kEpsilon","RNGkEpsilon"]:
-            config.case_turbulence_type = "RAS"
+        if job.case_info.turbulence_model in ["SpalartAllmarasDDES", "SpalartAllmarasIDDES"]:
+            job.case_turbulence_type = "LES"
+        elif job.case_info.turbulence_model in ["SpalartAllmaras","kOmegaSST","LaunderSharmaKE","realizableKE","kOmegaSSTLM","kEpsilon","RNGkEpsilon"]:
+            job.case_turbulence_type = "RAS"
         else:
-            config.case_turbulence_type = "laminar"
+            job.case_turbulence_type = "laminar"
 
         with open(f"{config.Database_OFv24_PATH}/final_OF_solver_required_files.json", 'r', encoding='utf-8') as file:
             file_structure = set(json.load(file)[solver])
@@ -447,7 +469,7 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
                 file_structure = file_structure.union(set(json.load(file)[turbulence_model]))
 
     file_structure.discard("system/blockMeshDict")
-    # config.global_files = list(file_structure)
+    # job.global_files = list(file_structure)
     # file_structure = list(file_structure)
     if file_turbulence_model == {}:
         for k in file_alternative.keys():
@@ -462,14 +484,15 @@ def case_required_files(solver=None, turbulence_model=None, other_physical_model
 
 # Generate initial files
 def generate_initial_files(case_description=None, output_case_path=None, grid_path=None, grid_type=None):
+    job = config.current_job()
     if case_description is None:
-        case_description = config.case_info.case_description
+        case_description = job.case_info.case_description
     if output_case_path is None:
-        output_case_path = config.path_cfg.output_case_path
+        output_case_path = job.output_case_path
     if grid_path is None:
-        grid_path = config.path_cfg.grid_path
+        grid_path = job.grid_path
     if grid_type is None:
-        grid_type = config.grid_type
+        grid_type = job.grid_type
 
     print("Generating controlDict, mesh conversion, extracting mesh boundary information...")
     write_controlDict = False
@@ -487,7 +510,7 @@ def generate_initial_files(case_description=None, output_case_path=None, grid_pa
 }}
 // * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * //
 
-application     {config.case_info.case_solver};
+application     {job.case_info.case_solver};
 
 startFrom       startTime;
 
@@ -526,8 +549,8 @@ runTimeModifiable true;"""
             # Mesh conversion
             convert_mesh(output_case_path=output_case_path, grid_path=grid_path, grid_type=grid_type)
             # Extract mesh boundary names and conditions (after mesh conversion, grid_type becomes polyMesh)
-            config.grid_info.grid_boundary_conditions = extract_boundary_names(grid_file_path=os.path.join(output_case_path, "constant/polyMesh"), grid_type='polyMesh')
-            print("Mesh boundaries:", config.grid_info.grid_boundary_conditions)
+            job.grid_info.grid_boundary_conditions = extract_boundary_names(grid_file_path=os.path.join(output_case_path, "constant/polyMesh"), grid_type='polyMesh')
+            print("Mesh boundaries:", job.grid_info.grid_boundary_conditions)
             write_controlDict = True
         except Exception as e:
             print(f"Unexpected error: {type(e).__name__}: {e}")
@@ -548,11 +571,11 @@ runTimeModifiable true;"""
 
     # Process PDF or txt, and use RAG to answer questions
     extractor = pdf_chunk_ask_question.CFDCaseExtractor()
-    extractor.process_pdf(config.pdf_path)
+    extractor.process_pdf(job.pdf_path)
 
     # Get physical fields
     initial_files = []  # Field files
-    for i in config.case_info.file_structure:
+    for i in job.case_info.file_structure:
         if "0/" in i:
             initial_files.append(i[2:])
 
@@ -560,11 +583,11 @@ runTimeModifiable true;"""
     bc_template = {}
     for i in initial_files:
         bc_template[i] = {}
-        for j in config.grid_info.grid_boundary_conditions.keys():
+        for j in job.grid_info.grid_boundary_conditions.keys():
             bc_template[i][j] = ""
     print("Boundary condition template:", bc_template)
 
-    query_embedded = f"Could you please clarify what the boundary conditions are for the {config.case_name} example mentioned in the text?"
+    query_embedded = f"Could you please clarify what the boundary conditions are for the {job.case_info.case_name} example mentioned in the text?"
     get_bc_prompt = f"""{query_embedded}Please return the boundary-condition settings for each physical field on every boundary of this case based on the following information:
 
 Available boundary-condition types:
@@ -574,7 +597,7 @@ Available boundary-condition types:
 
 Boundary names and their geometric types from the mesh:
 <mesh_boundary_conditions>
-{config.grid_info.grid_boundary_conditions}
+{job.grid_info.grid_boundary_conditions}
 </mesh_boundary_conditions>
 
 <output_requirements>
@@ -597,7 +620,7 @@ Boundary names and their geometric types from the mesh:
     ic_bc_template = {}
     for i in initial_files:
         ic_bc_template[i] = {"internalField":"", "boundaryField":{}}
-        for j in config.grid_info.grid_boundary_conditions.keys():
+        for j in job.grid_info.grid_boundary_conditions.keys():
             ic_bc_template[i]["boundaryField"][j] = {"type":bc_info[i][j]}
             if bc_info[i][j] in OF_bc_entry.keys():
                 for k in OF_bc_entry[bc_info[i][j]]:
@@ -606,7 +629,7 @@ Boundary names and their geometric types from the mesh:
                 continue   # noSlip, zeroGridient, empty
 
     # print("Initial condition and boundary condition template:", ic_bc_template)
-    query_embedded = f"What are the initial conditions for {initial_files} in the {config.case_name} case described in the document?"
+    query_embedded = f"What are the initial conditions for {initial_files} in the {job.case_info.case_name} case described in the document?"
     get_ic_bc_prompt = f"""{query_embedded}Please return the initial and boundary-condition settings for all physical fields in this case according to the following requirements:
 
 <output_requirements>
@@ -621,7 +644,7 @@ Boundary names and their geometric types from the mesh:
     # print("Boundary condition settings:", bc_response)
     ic_bc_info = extract_content_from_response(ic_bc_response, 'json')
     print("Initial condition and boundary condition settings:", ic_bc_info)
-    config.grid_info.field_ic_bc_from_input = ic_bc_info
+    job.grid_info.field_ic_bc_from_input = ic_bc_info
 
     # other_setting_info = ""
     # print("Discretization schemes, solver settings, material properties, etc.:")
@@ -629,6 +652,7 @@ Boundary names and their geometric types from the mesh:
     # Preparation before generating OpenFOAM case files
     class FileContent(BaseModel):
         files_content: Dict[str, str] = Field(description="A mapping from file name to its file content")
+    from langchain.output_parsers import PydanticOutputParser
     parser = PydanticOutputParser(pydantic_object=FileContent)
 
     OF_header = '''/*--------------------------------*- C++ -*----------------------------------*\\\\\\n| =========                 |                                                 |\\n| \\\\\\\\      /  F ield         | OpenFOAM: The Open Source CFD Toolbox           |\\n|  \\\\\\\\    /   O peration     | Version:  v2406                                 |\\n|   \\\\\\\\  /    A nd           | Website:  www.openfoam.com                      |\\n|    \\\\\\\\/     M anipulation  |                                                 |\\n\\\\*---------------------------------------------------------------------------*/'''
@@ -645,7 +669,7 @@ Boundary names and their geometric types from the mesh:
     constant_files = []
     system_files = []
     multiple_dimensions = {}
-    for i in config.case_info.file_structure:
+    for i in job.case_info.file_structure:
         if i.startswith("0/"):
             zero_files.append(i)
             if i in ["0/p", "0/alphat_", "0/p_gh","0/B_", "0/pa"]:
@@ -661,18 +685,19 @@ Boundary names and their geometric types from the mesh:
 
     # Prepare reference file content in advance
     reference_files = {}
-    if config.case_info.reference_file_name != "":
+    if job.case_info.reference_file_name != "":
         with open(os.path.join(config.path_cfg.database_dir, 'processed_merged_OF_cases.json'), 'r', encoding='utf-8') as f:
             reference_files = json.load(f)
             for file_name in reference_files:
-                if config.case_info.reference_file_name == file_name.split("/")[-1]:
+                # The case name becomes the full tutorial path here, a regeneration attempt gets the path
+                if job.case_info.reference_file_name in (file_name, file_name.split("/")[-1]):
                     reference_files = reference_files[file_name]["configuration_files"]
-                    config.case_info.reference_file_name = file_name
+                    job.case_info.reference_file_name = file_name
                     break
             else:
                 reference_files = {}
 
-    print(f"Reference file when generating initial files: {config.case_info.reference_file_name}")
+    print(f"Reference file when generating initial files: {job.case_info.reference_file_name}")
     reference_files_zero = {}
     reference_files_constant = {}
     reference_files_system = {}
@@ -695,8 +720,8 @@ Boundary names and their geometric types from the mesh:
     generate_files_prompt_0 = f"""I would like to simulate the following case with OpenFOAM-v2406:
 
 <case_requirements>
-- Solver: {config.case_info.case_solver}
-- Turbulence model: {config.case_info.turbulence_model}
+- Solver: {job.case_info.case_solver}
+- Turbulence model: {job.case_info.turbulence_model}
 - Case description: {case_description}
 </case_requirements>
 
@@ -730,15 +755,15 @@ Please follow the requirements below for your output:
 6. Do not include the OpenFOAM file-header line (e.g., {OF_header}) for each file, but retain the FoamFile block (e.g., {Foamfile_string}).
 7. The output must be complete and self-contained; do not rely on #include directives to pull in external content.
 </output_requirements>"""
-    case_file = parser.parse(extractor.query_case_setup(generate_files_prompt_0, context = True)).files_content
+    case_file = extractor.query_case_setup(generate_files_prompt_0, context = True, pydantic_object = FileContent).files_content
     # case_file = parser.parse(qa.ask(generate_files_prompt_0)).files_content
 
     reference_files_constant.update(reference_files_system)
     generate_files_prompt_1 = f"""I would like to simulate the following case with OpenFOAM-v2406:
 
 <case_requirements>
-- Solver: {config.case_info.case_solver}
-- Turbulence model: {config.case_info.turbulence_model}
+- Solver: {job.case_info.case_solver}
+- Turbulence model: {job.case_info.turbulence_model}
 - Case description: {case_description}
 - List of physical fields: {initial_files}
 </case_requirements>
@@ -762,7 +787,7 @@ Please follow the requirements below for your output:
 4. The output must be complete and self-contained; do not rely on #include directives to pull in external content.
 </output_requirements>"""
 
-    case_file.update(parser.parse(extractor.query_case_setup(generate_files_prompt_1, context = True)).files_content)
+    case_file.update(extractor.query_case_setup(generate_files_prompt_1, context = True, pydantic_object = FileContent).files_content)
     # case_file.update(parser.parse(qa.ask(generate_files_prompt_1)).files_content)
     # print(case_file)
 
@@ -776,8 +801,9 @@ def check_file_format(files_content=None):
     Returns:
         files_content (dict): Modified file content
     """
+    job = config.current_job()
     if files_content == None:
-        files_content = config.global_files
+        files_content = job.global_files
 
     check_file_prompt = """Please cross-check the following {file_name} file against the same file in other OpenFOAM-tutorials cases for any formatting issues. Focus on file structure, nesting logic, completeness and correctness of keywords, and whether any statements are missing.
 
@@ -818,9 +844,9 @@ def check_file_format(files_content=None):
                 if match:
                     if file_name+"_" in dimensions_dict.keys(): # Underscore suffix for incompressible
                         if file_name in ["0/p", "0/p_rgh", "0/alphat"]: 
-                            if config.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
+                            if job.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
                                 files_content[file_name] = re.sub(dimension_pattern, f'dimensions      {dimensions_dict[file_name]};\n', file_content)
-                            elif config.case_info.case_solver in config.incompressible_solvers:
+                            elif job.case_info.case_solver in config.incompressible_solvers:
                                 files_content[file_name] = re.sub(dimension_pattern, f'dimensions      {dimensions_dict[file_name+"_"]};\n', file_content)
                             else:
                                 continue    
@@ -831,9 +857,9 @@ def check_file_format(files_content=None):
             else:
                 if file_name+"_" in dimensions_dict.keys(): 
                      if file_name in ["0/p", "0/p_rgh", "0/alphat"]: 
-                         if config.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
+                         if job.case_info.case_solver in config.compressible_solvers or "compressible" in file_content:
                              files_content[file_name] = f"\ndimensions      {dimensions_dict[file_name]};\n"
-                         elif config.case_info.case_solver in config.incompressible_solvers:
+                         elif job.case_info.case_solver in config.incompressible_solvers:
                              files_content[file_name] = f"\ndimensions      {dimensions_dict[file_name+'_']};\n"
                      else:
                          continue    # File will error, let LLM solve it itself
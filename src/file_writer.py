@@ -8,19 +8,15 @@ from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
 import json
 import re
 
+import foam_payload
+import llm_extract
+
 def extract_content_in_brackets(text, indicator_string):
     # double brackets
-    pattern = fr'{indicator_string} \[\[(.*?)\]\]'
-    matches = re.findall(pattern, text, re.DOTALL)
-    return [m.strip() for m in matches]
+    return llm_extract.extract_tagged(text, indicator_string)
 
 def extract_foamfile_content(input_string, indicator_string):
-    start_tag = r"\\Start_" + indicator_string
-    end_tag = r"\\End_" + indicator_string
-    
-    # Use regex to find all matches
-    pattern = re.compile(f"{start_tag}(.*?){end_tag}", re.DOTALL)
-    matches = pattern.findall(input_string)
+    matches = llm_extract.extract_between(input_string, indicator_string)
     
     # Filter out content containing "FoamFile"
     foamfile_matches = [match for match in matches if 'FoamFile' in match]
@@ -33,23 +29,21 @@ def extract_foamfile_content(input_string, indicator_string):
         return foamfile_matches[0]
     
 def extract_pure_response(text):
-    # Use regex to match all content (including newlines)
-    pattern = r"Here is my response:(.*?)(?=$|\Z)"
-    match = re.search(pattern, text, re.DOTALL)
-    
-    if match:
-        # Remove leading and trailing whitespace
-        return match.group(1).strip()
-    return ""
+    return llm_extract.extract_after_marker(text)
 
 def remove_functions_blocks(text):
     pattern = r'functions\s*\{.*?\}'
     return re.sub(pattern, '', text, flags=re.DOTALL)
 
-def write_field_to_file(field_file_content, output_file_name):
+def write_field_to_file(field_file_content, output_file_name, payloads=None):
     # Escape processing (handle \n and special symbols)
     processed_content = field_file_content.encode('latin-1').decode('unicode_escape')
 
+    if payloads:
+        # The content was read with foam_payload.read_compact(), the elided list payloads are copied back
+        foam_payload.write_with_payloads(output_file_name, processed_content, payloads)
+        return
+
     directory = os.path.dirname(output_file_name)
 
     if directory and not os.path.exists(directory):
@@ -110,7 +104,7 @@ def copy_folder(source_folder, destination_folder):
 
 def analyze_running_error(running_error):
 
-    str_global_files = ", ".join(config.global_files)
+    str_global_files = ", ".join(config.current_job().global_files)
 
     analyze_running_error_prompt = f'''{config.general_prompts}
     Examine the following error encountered while running an OpenFOAM case, and determine which file needs revision to correct the error. The candidate files are {str_global_files}.
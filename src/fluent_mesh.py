@@ -0,0 +1,91 @@
+import os
+import re
+import mmap
+
+# Zone definition records, e.g. (39 (3 wall wall-1)()) or (45 (3 velocity-inlet inlet)())
+_ZONE_RECORD = re.compile(rb'\((39|45)\s+\((\d+)\s+([^\s()]+)\s+([^\s()]+)[^()]*\)')
+# Headers of the sections holding mesh data (nodes, cells, faces, periodic shadows, trees), ASCII and binary
+_DATA_SECTION = re.compile(rb'\((?:[23]0)?(?:10|12|13|18|58|59)\s+\(')
+_ZONE_SECTIONS_COMMENT = b'(0 "Zone Sections")'
+
+# Zone types of cell zones and internal faces, which do not become boundary patches
+NON_BOUNDARY_ZONE_TYPES = {"fluid", "solid", "interior"}
+
+_TAIL_CHUNK = 1 << 20     # Bytes read per step when scanning backwards from the end of the file
+_OVERLAP = 1024           # Keep records cut by a chunk boundary whole
+
+def _scan_tail(mm):
+    """Collect the zone records written after the last mesh data section, reading backwards from the end
+    Returns:
+        records (dict): zone_id -> (offset, zone_type, zone_name), empty if the tail holds no zone records
+        complete (bool): Whether the tail starts with the Zone Sections comment, i.e. holds all the zone records
+    """
+    records = {}
+    end = len(mm)
+    while end > 0:
+        start = max(0, end - _TAIL_CHUNK)
+        window = mm[start:min(len(mm), end + _OVERLAP)]
+
+        # Records before the last data section header (or the Zone Sections comment) are not part of the tail
+        stop = -1
+        for match in _DATA_SECTION.finditer(window):
+            stop = match.start()
+        comment = window.rfind(_ZONE_SECTIONS_COMMENT)
+        complete = comment >= 0 and comment > stop
+        if complete:
+            stop = comment
+
+        for match in _ZONE_RECORD.finditer(window, max(stop, 0)):
+            zone_id = int(match.group(2))
+            records.setdefault(zone_id, (start + match.start(), match.group(3), match.group(4)))
+
+        if stop >= 0:
+            return records, complete
+        end = start
+    return records, False
+
+def _scan_forward(f):
+    """Stream the whole file line by line, used when zone records are interleaved with the data sections"""
+    records = {}
+    offset = 0
+    for line in f:
+        stripped = line.lstrip()
+        if stripped.startswith((b"(39", b"(45")):
+            match = _ZONE_RECORD.match(stripped)
+            if match:
+                records.setdefault(int(match.group(2)), (offset, match.group(3), match.group(4)))
+        offset += len(line)
+    return records
+
+def read_zone_sections(msh_path):
+    """Read the zone definitions (sections 39/45) of a Fluent .msh file, ASCII or binary, in constant memory
+    Args:
+        msh_path (str): Path of the Fluent mesh file
+    Returns:
+        zones (list): Zones in file order, elements as {"id": int, "type": str, "name": str}
+    """
+    with open(msh_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            records, complete = _scan_tail(mm)
+        if not complete:
+            # Without the Zone Sections comment the records may be interleaved with the data sections (a (39 ...)
+            # after each (13 ...) face block), the tail would then only hold the last zones
+            f.seek(0)
+            records = _scan_forward(f)
+
+    zones = []
+    for zone_id, (_, zone_type, zone_name) in sorted(records.items(), key=lambda item: item[1][0]):
+        zones.append({"id": zone_id, "type": zone_type.decode("latin-1"), "name": zone_name.decode("latin-1")})
+    return zones
+
+def read_boundary_zones(msh_path):
+    """Read the boundary zones of a Fluent .msh file
+    Args:
+        msh_path (str): Path of the Fluent mesh file
+    Returns:
+        boundaries (dict): key is boundary name, value is Fluent zone type (wall, velocity-inlet, ...)
+    """
+    return {zone["name"]: zone["type"] for zone in read_zone_sections(msh_path)
+            if zone["type"].lower() not in NON_BOUNDARY_ZONE_TYPES}
@@ -0,0 +1,204 @@
+import os
+import re
+import math
+
+import numpy as np
+
+"""
+Incremental parser of OpenFOAM solver logs (case_run.log).
+Each time step becomes one row; residuals, Courant numbers, continuity errors and execution time are kept as columns,
+so a growing log is read once, from the last parsed offset, and can be saved and resumed.
+"""
+
+# One pass over each chunk of complete lines, lines matching none of the alternatives are skipped by the regex engine
+_LOG_LINE = re.compile(
+    rb'^[ \t]*(?:'
+    rb'Time = (?P<time>\S+)'
+    rb'|deltaT = (?P<delta_t>\S+)'
+    rb'|Courant Number mean: (?P<courant_mean>\S+) max: (?P<courant_max>\S+)'
+    rb'|[^\n]*?Solving for (?P<field>\w+), Initial residual = (?P<initial>[^,\s]+), Final residual = (?P<final>[^,\s]+), No Iterations (?P<iterations>\d+)'
+    rb'|time step continuity errors : sum local = (?P<continuity_local>[^,\s]+), global = (?P<continuity_global>[^,\s]+), cumulative = (?P<continuity_cumulative>\S+)'
+    rb'|ExecutionTime = (?P<execution_time>\S+) s\s+ClockTime = (?P<clock_time>\S+) s'
+    rb')',
+    re.MULTILINE,
+)
+
+_READ_CHUNK = 8 << 20
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+class ResidualLog:
+    """Per time step values of a solver log, parsed incrementally
+    Columns:
+        time, deltaT, courant_mean, courant_max, continuity_local, continuity_global, continuity_cumulative,
+        execution_time, clock_time, and <field>_initial, <field>_final, <field>_iterations per solved field
+        (the initial residual of the first solve and the final residual of the last solve of each time step)
+    """
+    def __init__(self, log_path):
+        self.log_path = log_path
+        self.offset = 0             # Bytes of the log already parsed
+        self.columns = {}           # name -> list of values, one per completed time step
+        self.n_rows = 0
+        self._row = None            # Time step being parsed, completed when the next one starts
+        self._row_offset = 0        # Offset of the first line of the time step being parsed
+        self._partial = b""         # Incomplete last line
+        self._pending = {}          # deltaT/Courant number printed before the "Time =" line they belong to
+        self._pending_offset = 0
+        self._field_key_cache = {}
+
+    def _commit_row(self):
+        if self._row is None:
+            return
+        for name in self._row:
+            if name not in self.columns:
+                # Fields solved only from a later time step on (e.g. after a restart) are padded with NaN
+                self.columns[name] = [math.nan] * self.n_rows
+        for name, values in self.columns.items():
+            values.append(self._row.get(name, math.nan))
+        self.n_rows += 1
+        self._row = None
+
+    def _field_keys(self, field_name):
+        keys = self._field_key_cache.get(field_name)
+        if keys is None:
+            name = field_name.decode()
+            keys = self._field_key_cache[field_name] = (f"{name}_initial", f"{name}_final", f"{name}_iterations")
+        return keys
+
+    def _parse_lines(self, data, base_offset):
+        """Parse complete lines, base_offset is the position of data in the log"""
+        for match in _LOG_LINE.finditer(data):
+            kind = match.lastgroup
+            row = self._row
+            if kind == "iterations":
+                if row is None:
+                    continue
+                initial_key, final_key, iterations_key = self._field_keys(match.group("field"))
+                if initial_key not in row:
+                    row[initial_key] = _to_float(match.group("initial"))
+                row[final_key] = _to_float(match.group("final"))
+                row[iterations_key] = row.get(iterations_key, 0) + int(match.group("iterations"))
+            elif kind == "time":
+                self._commit_row()
+                self._row = {"time": _to_float(match.group("time")), **self._pending}
+                self._row_offset = self._pending_offset if self._pending else base_offset + match.start()
+                self._pending = {}
+            elif kind in ("delta_t", "courant_max"):
+                # Printed before "Time =" by solvers adjusting deltaT, after it by the others
+                if kind == "delta_t":
+                    values = {"deltaT": _to_float(match.group("delta_t"))}
+                else:
+                    values = {"courant_mean": _to_float(match.group("courant_mean")), "courant_max": _to_float(match.group("courant_max"))}
+                if row is None or "execution_time" in row:
+                    if not self._pending:
+                        self._pending_offset = base_offset + match.start()
+                    self._pending.update(values)
+                else:
+                    row.update(values)
+            elif row is None:
+                # Header, mesh and field reading before the first time step
+                continue
+            elif kind == "continuity_cumulative":
+                row["continuity_local"] = _to_float(match.group("continuity_local"))
+                row["continuity_global"] = _to_float(match.group("continuity_global"))
+                row["continuity_cumulative"] = _to_float(match.group("continuity_cumulative"))
+            elif kind == "clock_time":
+                row["execution_time"] = _to_float(match.group("execution_time"))
+                row["clock_time"] = _to_float(match.group("clock_time"))
+
+    def update(self):
+        """Parse what was appended to the log since the last call
+        Returns:
+            new_rows (int): Number of time steps completed by this call
+        """
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+        if size < self.offset:
+            # The log was rewritten by a new run
+            self.__init__(self.log_path)
+        rows_before = self.n_rows
+        with open(self.log_path, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(_READ_CHUNK)
+                if not chunk:
+                    break
+                data = self._partial + chunk
+                base_offset = self.offset - len(self._partial)
+                self.offset += len(chunk)
+                complete = data.rfind(b"\n") + 1
+                self._partial = data[complete:]
+                self._parse_lines(data[:complete], base_offset)
+        return self.n_rows - rows_before
+
+    def finish(self):
+        """Complete the last time step once the solver has exited"""
+        if self._partial:
+            self._parse_lines(self._partial, self.offset - len(self._partial))
+            self._partial = b""
+        self._commit_row()
+
+    def fields(self):
+        """Names of the solved fields, e.g. ['Ux', 'Uy', 'p']"""
+        return [name[:-len("_initial")] for name in self.columns if name.endswith("_initial")]
+
+    def arrays(self):
+        """Columns as NumPy arrays (float64, iterations as float because of NaN padding)"""
+        return {name: np.asarray(values, dtype=np.float64) for name, values in self.columns.items()}
+
+    def last(self):
+        """Values of the last completed time step"""
+        return {name: values[-1] for name, values in self.columns.items()} if self.n_rows else {}
+
+    def save(self, path):
+        """Save the completed time steps and the position to resume parsing from, as .npz or as .parquet (requires pyarrow)"""
+        # The time step in progress is not saved, it is parsed again from its "Time =" line after load()
+        if self._row is not None:
+            resume_offset = self._row_offset
+        elif self._pending:
+            resume_offset = self._pending_offset
+        else:
+            resume_offset = self.offset - len(self._partial)
+        if path.endswith(".parquet"):
+            import pyarrow
+            import pyarrow.parquet
+            table = pyarrow.table(self.arrays())
+            table = table.replace_schema_metadata({"log_path": self.log_path, "offset": str(resume_offset)})
+            pyarrow.parquet.write_table(table, path)
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, _offset=np.int64(resume_offset), **self.arrays())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, log_path, path):
+        """Resume from a file written by save() as .npz, so that only the rest of the log is parsed"""
+        log = cls(log_path)
+        with np.load(path) as data:
+            log.offset = int(data["_offset"])
+            for name in data.files:
+                if not name.startswith("_"):
+                    log.columns[name] = data[name].tolist()
+        log.n_rows = len(next(iter(log.columns.values()), []))
+        return log
+
+def parse_log(log_path, save_path=None):
+    """Parse a complete solver log
+    Args:
+        log_path (str): Solver log, e.g. <case>/case_run.log
+        save_path (str): Optional .npz or .parquet file to save the columns to
+    Returns:
+        log (ResidualLog): Parsed log, see ResidualLog.arrays()
+    """
+    log = ResidualLog(log_path)
+    log.update()
+    log.finish()
+    if save_path:
+        log.save(save_path)
+    return log
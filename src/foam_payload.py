@@ -0,0 +1,243 @@
+import io
+import os
+import re
+import contextlib
+
+import numpy as np
+
+"""
+Streaming reader of OpenFOAM files that keeps large nonuniform List payloads out of memory.
+read_compact() returns the file text with each large payload replaced by a placeholder carrying its size, min, max
+and mean, together with the byte range of the payload in the file. write_with_payloads() writes an edited text back
+and copies the original payloads into the placeholders left in it, so a file corrected by the LLM keeps its field
+values whatever the mesh size. compact_text() applies the same elision to a text already in memory, for prompts.
+"""
+
+_CHUNK = 4 << 20
+_HEADER_TAIL = 256          # Bytes kept between chunks so that a list header is never cut
+_LIST_HEADER = re.compile(rb'nonuniform\s+List<(\w+)>\s*(\d+)?\s*\(')
+_COMPOUND_END = re.compile(rb'\)\s*\)')
+_PARENTHESES_TO_SPACE = bytes.maketrans(b"()", b"  ")
+_PLACEHOLDER = re.compile(r'\(/\* payload (\d+):[^*]*\*/\)')
+_PAYLOAD_PLACEHOLDER = "(/* payload {index}: {summary}, kept unchanged when the file is written */)"
+
+_WIDTHS = {b"vector": 3, b"tensor": 9, b"symmTensor": 6, b"sphericalTensor": 1, b"diagTensor": 3}
+
+class _PayloadStats:
+    """Count, min, max and mean of a list payload, fed chunk by chunk"""
+    def __init__(self, width):
+        self.width = width
+        self.count = 0
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+        self.sum = np.zeros(width)
+        self._leftover = np.zeros(0)
+        self.valid = True
+
+    def feed(self, data):
+        if not self.valid:
+            return
+        try:
+            numbers = np.array(data.translate(_PARENTHESES_TO_SPACE).split(), dtype=np.float64)
+        except ValueError:
+            # Not a plain numeric payload (e.g. a List<word>), only the bytes are kept
+            self.valid = False
+            return
+        numbers = np.concatenate([self._leftover, numbers])
+        complete = len(numbers) - len(numbers) % self.width
+        self._leftover = numbers[complete:]
+        values = numbers[:complete].reshape(-1, self.width)
+        if len(values):
+            self.count += len(values)
+            self.min = np.minimum(self.min, values.min(axis=0))
+            self.max = np.maximum(self.max, values.max(axis=0))
+            self.sum += values.sum(axis=0)
+
+    def summary(self):
+        if not self.valid:
+            return "values"
+        if not self.count:
+            return "0 values"
+        def fmt(values):
+            return f"{values[0]:.6g}" if self.width == 1 else "(" + " ".join(f"{value:.6g}" for value in values) + ")"
+        return f"{self.count} values, min {fmt(self.min)} max {fmt(self.max)} mean {fmt(self.sum / self.count)}"
+
+def _cut_position(data, end):
+    """Last separator position before end, so that a number is never split between two chunks"""
+    for position in range(end - 1, max(end - 64, -1), -1):
+        if data[position:position + 1] in b" \t\r\n()":
+            return position + 1
+    return 0
+
+def read_compact(path, max_values=20, chunk_size=_CHUNK):
+    """Read an OpenFOAM file, replacing nonuniform List payloads of more than max_values entries by placeholders
+    Args:
+        path (str): File to read
+        max_values (int): Lists with at most this many entries are kept as they are
+        chunk_size (int): Bytes read at a time, memory use does not grow with the payload size
+    Returns:
+        text (str): File content with placeholders "(/* payload <n>: <count> values, min .. max .. mean .. */)"
+        payloads (dict): Placeholders of the text, {"path", "size", "mtime_ns", "ranges": [(start, end) byte offsets of
+            each payload including its parentheses]}, to pass to write_with_payloads()
+    """
+    stat = os.stat(path)
+    payloads = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "ranges": []}
+    with open(path, 'rb') as f:
+        data = _compact_stream(f, payloads["ranges"], max_values, chunk_size, _PAYLOAD_PLACEHOLDER)
+    return data.decode('utf-8', errors='replace'), payloads
+
+def compact_text(text, max_values=20, placeholder="(/* {summary} elided */)"):
+    """Replace the nonuniform List payloads of more than max_values entries of a text by a summary comment
+    Args:
+        text (str): OpenFOAM file content
+        max_values (int): Lists with at most this many entries are kept as they are
+        placeholder (str): Replacement of a payload, formatted with its index and summary
+    Returns:
+        text (str): Content with the large payloads replaced
+    """
+    if "nonuniform" not in text:
+        return text
+    data = _compact_stream(io.BytesIO(text.encode('utf-8')), [], max_values, _CHUNK, placeholder)
+    return data.decode('utf-8', errors='replace')
+
+def _compact_stream(f, ranges, max_values, chunk_size, placeholder):
+    """Copy a binary stream with its large list payloads replaced by placeholders, appending their byte ranges to ranges"""
+    pieces = []
+    buffer = f.read(chunk_size)
+    offset = 0          # File offset of buffer[0]
+    eof = len(buffer) < chunk_size
+    if b"format" in buffer[:4096] and re.search(rb'\bformat\s+binary\s*;', buffer[:4096]):
+        # Binary payloads cannot be summarised as text
+        pieces.append(buffer)
+        pieces.append(f.read())
+        return b"".join(pieces)
+
+    def more():
+        nonlocal buffer, eof
+        data = f.read(chunk_size)
+        eof = len(data) < chunk_size
+        buffer += data
+
+    while True:
+        match = _LIST_HEADER.search(buffer)
+        if match is None:
+            if eof:
+                pieces.append(buffer)
+                break
+            keep = max(len(buffer) - _HEADER_TAIL, 0)
+            pieces.append(buffer[:keep])
+            offset += keep
+            buffer = buffer[keep:]
+            more()
+            continue
+
+        element_type, size = match.group(1), match.group(2)
+        open_pos = match.end() - 1
+        elide = size is None or int(size) > max_values
+        stats = _PayloadStats(_WIDTHS.get(element_type, 1))
+        pieces.append(buffer[:open_pos] if elide else buffer[:match.end()])
+        start = offset + open_pos
+        offset += open_pos + 1
+        buffer = buffer[open_pos + 1:]
+
+        # Scan the payload for its closing parenthesis, chunk by chunk
+        compound = element_type in _WIDTHS
+        while True:
+            if compound:
+                stripped = buffer.lstrip()
+                if stripped.startswith(b")"):
+                    end_match = len(buffer) - len(stripped)
+                else:
+                    found = _COMPOUND_END.search(buffer)
+                    end_match = found.end() - 1 if found else -1
+            else:
+                end_match = buffer.find(b")")
+            if end_match >= 0:
+                if elide:
+                    stats.feed(buffer[:end_match])
+                else:
+                    pieces.append(buffer[:end_match + 1])
+                offset += end_match + 1
+                buffer = buffer[end_match + 1:]
+                break
+            if eof:
+                # Unterminated list, kept as it is
+                if elide:
+                    payload_end = offset + len(buffer)
+                    f.seek(start)
+                    pieces.append(f.read(payload_end - start))
+                else:
+                    pieces.append(buffer)
+                buffer = b""
+                elide = False
+                break
+            cut = _cut_position(buffer, max(len(buffer) - _HEADER_TAIL, 0))
+            if elide:
+                stats.feed(buffer[:cut])
+            else:
+                pieces.append(buffer[:cut])
+            offset += cut
+            buffer = buffer[cut:]
+            more()
+
+        if elide:
+            ranges.append((start, offset))
+            pieces.append(placeholder.format(index=len(ranges) - 1, summary=stats.summary()).encode('utf-8'))
+        if not buffer and eof:
+            break
+        if len(buffer) < _HEADER_TAIL and not eof:
+            more()
+    return b"".join(pieces)
+
+def write_with_payloads(path, text, payloads=None, chunk_size=_CHUNK):
+    """Write text to path, copying the original payloads into the placeholders left by read_compact()
+    Args:
+        path (str): File to write, may be the file the payloads were read from
+        text (str): Content to write, e.g. an LLM-edited version of the read_compact() text
+        payloads (dict): Second return value of read_compact(), None if the text has no placeholders
+        chunk_size (int): Bytes copied at a time
+    Raises:
+        ValueError: If a placeholder of the text has no payload, or the source file changed since read_compact();
+            path is then left untouched
+    """
+    matches = list(_PLACEHOLDER.finditer(text))
+    if matches:
+        # A placeholder left in the file would be read by OpenFOAM as an empty list of the wrong size
+        ranges = payloads["ranges"] if payloads else []
+        missing = sorted({int(match.group(1)) for match in matches if int(match.group(1)) >= len(ranges)})
+        if missing:
+            raise ValueError(f"No payload for the placeholders {missing} of the text written to {path}")
+        stat = os.stat(payloads["path"])
+        if (stat.st_size, stat.st_mtime_ns) != (payloads["size"], payloads["mtime_ns"]):
+            raise ValueError(f"{payloads['path']} changed since it was read, its list payloads cannot be restored")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as out:
+            position = 0
+            source = open(payloads["path"], 'rb') if matches else None
+            try:
+                for match in matches:
+                    out.write(text[position:match.start()].encode('utf-8'))
+                    start, end = payloads["ranges"][int(match.group(1))]
+                    source.seek(start)
+                    remaining = end - start
+                    while remaining > 0:
+                        data = source.read(min(chunk_size, remaining))
+                        if not data:
+                            raise ValueError(f"{payloads['path']} ended inside the payload {match.group(1)}")
+                        out.write(data)
+                        remaining -= len(data)
+                    position = match.end()
+            finally:
+                if source is not None:
+                    source.close()
+            out.write(text[position:].encode('utf-8'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
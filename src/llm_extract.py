@@ -0,0 +1,232 @@
+import re
+import json
+from functools import lru_cache
+
+"""
+Extraction of JSON objects, code blocks and tagged sections from LLM answers.
+All patterns are compiled once. JSON objects are located with a bracket matcher that jumps between structural
+characters with a compiled pattern, skips quoted strings and escapes, and runs in linear time. Objects that do not
+parse are repaired for the defects LLMs commonly produce: code fences, comments, trailing commas, single-quoted
+strings, Python literals, unquoted keys, raw newlines and invalid escapes in strings, and truncated endings.
+"""
+
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+_FENCED_BLOCK = re.compile(r'```[ \t]*([\w+\-]*)[ \t]*\n?(.*?)```', re.DOTALL)
+_JSON_START = re.compile(r'[{\[]')
+_STRUCTURAL = re.compile(r'["\'{}\[\]]')
+_STRING_END = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+_REPAIR_TOKEN = re.compile(r'''["'{}\[\],]|//[^\n]*|/\*.*?\*/|#[^\n]*|\b(?:True|False|None)\b|[A-Za-z_$][\w$\-]*(?=\s*:)''', re.DOTALL)
+_CLOSER_AHEAD = re.compile(r'\s*(?:[}\]]|\Z)')
+_STRING_SPECIAL = re.compile(r'[\\\x00-\x1F"\']')
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Language tags of code blocks that are not part of the file content
+_CODE_TAGS = {"text", "Text", "txt", "plaintext", "cpp", "c++", "C++", "c", "foam", "openfoam", "OpenFOAM", "json", "bash", "sh"}
+
+def strip_control_chars(text):
+    """Remove control characters other than tab, newline and carriage return"""
+    return _CONTROL_CHARS.sub('', text)
+
+def _string_end(text, pos, quote):
+    """Position just after the string whose opening quote is at pos - 1, -1 if it is not closed"""
+    pattern = _STRING_END[quote]
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            return -1
+        if match.group() == "\\":
+            pos = match.end() + 1
+        else:
+            return match.end()
+
+def find_balanced(text, start):
+    """End of the JSON object or array opened at text[start], skipping brackets inside strings
+    Returns:
+        end (int): Position just after the matching closing bracket, -1 if the brackets do not match or are not closed
+    """
+    stack = [_CLOSERS[text[start]]]
+    pos = start + 1
+    while True:
+        match = _STRUCTURAL.search(text, pos)
+        if match is None:
+            return -1
+        char, pos = match.group(), match.end()
+        if char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            if stack[-1] != char:
+                return -1
+            stack.pop()
+            if not stack:
+                return pos
+        else:
+            pos = _string_end(text, pos, char)
+            if pos < 0:
+                return -1
+
+def json_candidates(text):
+    """Substrings of an answer that may hold its JSON value: fenced blocks first, then each balanced object or array,
+    then the unterminated value left at the end of a truncated answer"""
+    for match in _FENCED_BLOCK.finditer(text):
+        block = match.group(2).strip()
+        if block[:1] in _CLOSERS:
+            yield block
+    pos = 0
+    while True:
+        match = _JSON_START.search(text, pos)
+        if match is None:
+            return
+        end = find_balanced(text, match.start())
+        if end < 0:
+            yield text[match.start():]
+            pos = match.end()
+            continue
+        yield text[match.start():end]
+        pos = end
+
+def _repair_string(text, pos, quote, out, close_truncated):
+    """Copy the string opened at pos - 1 as a valid JSON string, returns the position after it"""
+    out.append('"')
+    while True:
+        match = _STRING_SPECIAL.search(text, pos)
+        if match is None:
+            if not close_truncated:
+                raise ValueError("Truncated JSON value: unterminated string")
+            out.append(text[pos:])
+            out.append('"')
+            return len(text)
+        out.append(text[pos:match.start()])
+        char, pos = match.group(), match.end()
+        if char == quote:
+            out.append('"')
+            return pos
+        if char == "\\":
+            escaped = text[pos:pos + 1]
+            if quote == "'" and escaped == "'":
+                out.append("'")
+            elif escaped in _VALID_ESCAPES and escaped:
+                out.append("\\" + escaped)
+            else:
+                out.append("\\\\" + escaped)
+            pos += 1
+        elif char == '"':
+            out.append('\\"')
+        elif char == "'":
+            out.append("'")
+        else:
+            out.append(_CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}"))
+
+def repair_json(text, close_truncated=False):
+    """Rewrite an almost-JSON value produced by an LLM as valid JSON
+    Args:
+        text (str): JSON value with the usual LLM defects (single quotes, unquoted keys, trailing commas, comments, ...)
+        close_truncated (bool): Close the strings and brackets left open by a cut-off answer; the value is then
+            incomplete, so by default a truncated answer is an error
+    Returns:
+        repaired (str)
+    Raises:
+        ValueError: If the value is truncated and close_truncated is False
+    """
+    out = []
+    stack = []
+    pos = 0
+    while True:
+        match = _REPAIR_TOKEN.search(text, pos)
+        if match is None:
+            out.append(text[pos:])
+            break
+        out.append(text[pos:match.start()])
+        token, pos = match.group(), match.end()
+        if token in ('"', "'"):
+            pos = _repair_string(text, pos, token, out, close_truncated)
+        elif token in _CLOSERS:
+            stack.append(_CLOSERS[token])
+            out.append(token)
+        elif token in "}]":
+            if stack and stack[-1] == token:
+                stack.pop()
+            out.append(token)
+        elif token == ",":
+            # Trailing commas are dropped
+            if _CLOSER_AHEAD.match(text, pos) is None:
+                out.append(token)
+        elif token[0] in "/#":
+            continue
+        elif token in _PYTHON_LITERALS:
+            out.append(_PYTHON_LITERALS[token])
+        else:
+            out.append(json.dumps(token))
+    repaired = "".join(out).rstrip()
+    if stack:
+        if not close_truncated:
+            raise ValueError(f"Truncated JSON value: {len(stack)} unclosed brackets")
+        # Truncated answer: drop a dangling separator and close what is open
+        repaired = repaired.rstrip(",:").rstrip()
+        repaired += "".join(reversed(stack))
+    return repaired
+
+def parse_json(text, close_truncated=False):
+    """First JSON object or array of an LLM answer
+    Args:
+        text (str): Answer, possibly with prose, code fences and JSON defects
+        close_truncated (bool): Accept a cut-off answer by closing it, see repair_json()
+    Returns:
+        value (dict or list)
+    Raises:
+        ValueError: If no candidate parses, even after repair
+    """
+    text = strip_control_chars(text)
+    stripped = text.strip()
+    if stripped[:1] in _CLOSERS:
+        try:
+            return json.loads(stripped)
+        except ValueError:
+            pass
+    last_error = None
+    for candidate in json_candidates(text):
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        try:
+            return json.loads(repair_json(candidate, close_truncated))
+        except ValueError as e:
+            last_error = e
+    raise ValueError(f"No JSON value in the answer: {last_error or 'no object or array found'}")
+
+def extract_code_block(text):
+    """Content of the first ``` block of an answer without its language tag, empty if there is none"""
+    match = _FENCED_BLOCK.search(text)
+    if match is None:
+        return ""
+    tag, content = match.group(1), match.group(2)
+    if tag and tag not in _CODE_TAGS:
+        # Not a language tag but the first word of the content, e.g. ```FoamFile
+        content = match.group(0)[3:-3]
+    return content.strip()
+
+@lru_cache(maxsize=None)
+def _tagged_pattern(indicator_string):
+    return re.compile(fr'{re.escape(indicator_string)} \[\[(.*?)\]\]', re.DOTALL)
+
+def extract_tagged(text, indicator_string):
+    """Sections written as '<indicator_string> [[...]]'"""
+    return [match.strip() for match in _tagged_pattern(indicator_string).findall(text)]
+
+@lru_cache(maxsize=None)
+def _between_pattern(indicator_string):
+    return re.compile(fr'\\Start_{re.escape(indicator_string)}(.*?)\\End_{re.escape(indicator_string)}', re.DOTALL)
+
+def extract_between(text, indicator_string):
+    """Sections written between \\Start_<indicator_string> and \\End_<indicator_string>"""
+    return _between_pattern(indicator_string).findall(text)
+
+_RESPONSE_MARKER = re.compile(r"Here is my response:(.*)\Z", re.DOTALL)
+
+def extract_after_marker(text):
+    """Text after 'Here is my response:', empty if the marker is missing"""
+    match = _RESPONSE_MARKER.search(text)
+    return match.group(1).strip() if match else ""
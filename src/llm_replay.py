@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+"""
+Recorded LLM answers for offline runs of the pipeline.
+Answers are stored in SQLite under the hash of the prompt messages, with the reasoning, the token usage and the
+latency of the call. qa_modules records every answered call when llm_config.llm_record_path is set, and
+mock_llm_server replays them as an OpenAI-compatible endpoint. export_jsonl/import_jsonl move recordings to and from a
+text file that can be committed, e.g. the recorded answers of the benchmark corpus. Only the standard library is used
+so that the mock server runs without the pipeline configuration.
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT '',
+    model TEXT NOT NULL DEFAULT '',
+    prompt TEXT NOT NULL,
+    content TEXT NOT NULL,
+    reasoning TEXT NOT NULL DEFAULT '',
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    reasoning_tokens INTEGER NOT NULL DEFAULT 0,
+    latency REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_key ON responses (key, id);
+"""
+
+# Columns written by export_jsonl besides the prompt messages, content first
+_JSONL_FIELDS = ("content", "reasoning", "role", "model", "prompt_tokens", "completion_tokens", "reasoning_tokens", "latency")
+
+_WORD = re.compile(r'[A-Za-z_][\w./]*')
+
+def prompt_key(messages):
+    """Hash of the role and content of the prompt messages, the same for any model or backend"""
+    canonical = json.dumps([[message.get("role", ""), message.get("content", "")] for message in messages],
+                           ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+@contextmanager
+def _connect(path):
+    # Same pattern as reflection_store.connect, kept here so that the mock server does not load the configuration
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+class ReplayStore:
+    """SQLite store of recorded answers, safe to use from several threads and processes"""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with _connect(self.path) as connection:
+            connection.executescript(_SCHEMA)
+        # Identical prompts asked several times (retries, several runs of a case) replay their recordings in turn
+        self._next = {}
+        self._lock = threading.Lock()
+        self._index = None
+
+    def record(self, messages, content, reasoning="", role="", model="", prompt_tokens=0, completion_tokens=0,
+               reasoning_tokens=0, latency=0.0):
+        """Store the answer to a prompt
+        Args:
+            messages (list): Prompt messages as sent to the provider
+            content, reasoning (str): Answer and reasoning content
+            role, model (str): Router role and model that answered
+            prompt_tokens, completion_tokens, reasoning_tokens (int): Usage of the call
+            latency (float): Seconds the call took
+        """
+        with _connect(self.path) as connection:
+            connection.execute(
+                "INSERT INTO responses (key, role, model, prompt, content, reasoning, prompt_tokens, completion_tokens, reasoning_tokens, latency, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (prompt_key(messages), role, model, json.dumps(messages, ensure_ascii=False), content or "", reasoning or "",
+                 prompt_tokens, completion_tokens, reasoning_tokens, latency, time.time()))
+        with self._lock:
+            self._index = None
+
+    def lookup(self, messages):
+        """Recorded answer of exactly these messages, the recordings of a prompt being returned in turn; None if there is none"""
+        key = prompt_key(messages)
+        with _connect(self.path) as connection:
+            rows = connection.execute("SELECT * FROM responses WHERE key = ? ORDER BY id", (key,)).fetchall()
+        if not rows:
+            return None
+        with self._lock:
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+        return dict(rows[index % len(rows)])
+
+    def nearest(self, messages):
+        """Recorded answer whose last user prompt shares the most words with the one of messages, None if the store is empty"""
+        words = set(_WORD.findall(_last_user_prompt(messages)))
+        with self._lock:
+            if self._index is None:
+                with _connect(self.path) as connection:
+                    rows = connection.execute("SELECT id, prompt FROM responses").fetchall()
+                self._index = [(row["id"], set(_WORD.findall(_last_user_prompt(json.loads(row["prompt"]))))) for row in rows]
+            index = self._index
+        if not index:
+            return None
+        best_id = max(index, key=lambda item: len(words & item[1]) / (len(words | item[1]) or 1))[0]
+        with _connect(self.path) as connection:
+            return dict(connection.execute("SELECT * FROM responses WHERE id = ?", (best_id,)).fetchone())
+
+    def import_qa_logs(self, log_path, role_by_model_type=None):
+        """Add the calls of a qa_logs.jsonl file, as single user messages (the conversation history is not logged)
+        Returns:
+            count (int): Calls imported
+        """
+        role_by_model_type = role_by_model_type or {"deepseek-v3": "chat", "deepseek-r1": "reasoner"}
+        count = 0
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not entry.get("user_prompt") or entry.get("assistant_response") is None:
+                    continue
+                self.record([{"role": "user", "content": entry["user_prompt"]}], entry["assistant_response"],
+                            entry.get("reasoning_content", ""), role_by_model_type.get(entry.get("model_type"), ""), "",
+                            entry.get("prompt_tokens", 0), entry.get("response_tokens", 0), entry.get("reasoning_tokens", 0))
+                count += 1
+        return count
+
+    def export_jsonl(self, path):
+        """Write the recordings to a JSON lines file, one recording per line with its prompt messages, in recording order
+        Returns:
+            count (int): Recordings written
+        """
+        with _connect(self.path) as connection:
+            rows = connection.execute("SELECT * FROM responses ORDER BY id").fetchall()
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                entry = {name: row[name] for name in _JSONL_FIELDS}
+                entry["messages"] = json.loads(row["prompt"])
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return len(rows)
+
+    def import_jsonl(self, path):
+        """Add the recordings of a file written by export_jsonl, under the same prompt keys
+        Returns:
+            count (int): Recordings imported
+        """
+        count = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self.record(entry["messages"], entry["content"], **{name: entry[name] for name in _JSONL_FIELDS[1:] if name in entry})
+                count += 1
+        return count
+
+    def __len__(self):
+        with _connect(self.path) as connection:
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+def _last_user_prompt(messages):
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+import config
+
+"""
+Background writer of JSON Lines logs.
+Records are put on a bounded queue by the calling thread and written by one writer thread in batches, one record per
+line, optionally as zstd frames (a .zst file of concatenated frames reads back as one stream), with size-based
+rotation. Pending records are flushed when the process exits.
+"""
+
+_STOP = object()
+
+class JsonlWriter:
+    """Asynchronous JSONL writer shared by all jobs of the process"""
+    def __init__(self, max_queue=10000, batch_size=256, flush_interval=1.0, compression=None, max_bytes=0,
+                 backup_count=5, put_timeout=1.0):
+        """
+        Args:
+            max_queue (int): Records waiting to be written, callers block up to put_timeout when the queue is full
+            batch_size (int): Records written per file open
+            flush_interval (float): Seconds a record may wait for its batch to fill up
+            compression (str): None or "zstd" (requires the zstandard package)
+            max_bytes (int): Rotate a log once it is larger than this, 0 to never rotate
+            backup_count (int): Rotated logs kept, as <name>.1.jsonl ... <name>.<backup_count>.jsonl
+            put_timeout (float): Seconds write() waits for room in the queue before dropping the record
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self._compressor = None
+        if compression == "zstd":
+            try:
+                import zstandard
+                self._compressor = zstandard.ZstdCompressor(level=3)
+            except ImportError:
+                print("zstandard is not installed, LLM logs are written uncompressed")
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_path(self, path):
+        """Actual path written for path, with .zst appended when compressing"""
+        return f"{path}.zst" if self._compressor is not None else path
+
+    def write(self, path, record):
+        """Queue a record for path, returns at once unless the queue is full"""
+        try:
+            self._queue.put((path, record), timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                print(f"Log queue full, {self.dropped} records dropped")
+
+    def flush(self):
+        """Block until every queued record is written"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Write the pending records and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and item[0] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            stop = batch[-1][0] is _STOP
+            records = {}
+            for path, record in batch:
+                if path is not _STOP:
+                    records.setdefault(path, []).append(record)
+            for path, path_records in records.items():
+                try:
+                    self._write_batch(path, path_records)
+                except Exception as e:
+                    print(f"Failed to write {len(path_records)} log records to {path}: {e}")
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, path, records):
+        path = self.log_path(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8')
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        with open(path, 'ab') as f:
+            f.write(data)
+            size = f.tell()
+        if self.max_bytes and size > self.max_bytes:
+            self._rotate(path)
+
+    def _rotate(self, path):
+        base, extension = path.rsplit(".jsonl", 1) if ".jsonl" in path else (path, "")
+        rotated = lambda index: f"{base}.{index}.jsonl{extension}"
+        if os.path.exists(rotated(self.backup_count)):
+            os.remove(rotated(self.backup_count))
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(rotated(index)):
+                os.replace(rotated(index), rotated(index + 1))
+        if self.backup_count > 0:
+            os.replace(path, rotated(1))
+        else:
+            os.remove(path)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def default_writer():
+    """Writer configured from run_config, created on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = JsonlWriter(compression=config.run_cfg.log_compression or None,
+                                  max_bytes=config.run_cfg.log_max_bytes,
+                                  backup_count=config.run_cfg.log_backup_count)
+        return _writer
@@ -1,16 +1,18 @@
 import os
 import json
-import torch
-import pdfplumber
 
-import config, file_writer, run_of_case, file_corrector,file_preparation
+import config, file_writer, run_of_case, file_corrector,file_preparation, qa_modules
 
 import Reflextion
-
-torch.classes.__path__ = [os.path.join(torch.__path__[0], torch.classes.__file__)]
+import case_snapshot
+import speculative_correction
+import experience_store
+import tracing
 
 def process_pdf_pdfplumber(file_path):
     """Extract PDF text and tables using pdfplumber"""
+    import pdfplumber
+
     text = ""
     tables = []
 
@@ -32,59 +34,149 @@ def process_pdf_pdfplumber(file_path):
         "tables": tables
     }
 
-def load_OF_data_json():
+def load_OF_data_json(job=None):
+    if job is None:
+        job = config.current_job()
     try:
         with open(config.OF_data_path, 'r', encoding='utf-8') as file:
             full_data = json.load(file)
-            config.OF_case_data_dict = {}
+            job.OF_case_data_dict = {}
             for case_path, case_info in full_data.items():
-                if config.case_info.case_solver in case_path:
-                    config.OF_case_data_dict[case_path] = case_info
+                if job.case_info.case_solver in case_path:
+                    job.OF_case_data_dict[case_path] = case_info
             print("Successfully read the OF_tut_case_json file!")
     except json.JSONDecodeError:
         print("Input JSON format error, please check data integrity")
         exit()
 
-def main(case_name_idx):
-
-    # Load PDF or txt file
-    if config.pdf_path.endswith('.pdf'):
-        config.paper_content, config.paper_table = process_pdf_pdfplumber(config.pdf_path)
+def main(case_name_idx, job=None):
+    """Generate, run and correct one case
+    Args:
+        case_name_idx (str): Case name with run index, also the folder name under output_path
+        job (JobContext): Per-case state, a new job seeded from config is created when None
+    """
+    config.init_runtime()
+    if job is None:
+        job = config.new_job(case_name_idx, os.path.join(config.path_cfg.output_path, case_name_idx))
+    if not job.OF_case_data_dict:
+        load_OF_data_json(job)
+
+    with config.use_job(job), tracing.trace("case", os.path.join(job.output_case_path, "trace.json"), case=case_name_idx,
+                                            solver=job.case_info.case_solver, turbulence_model=job.case_info.turbulence_model) as root:
+        try:
+            _run_job(job)
+        finally:
+            root.set(success=bool(job.flag_case_success_run))
+            # qa_logs.jsonl of the case is complete once the job returns
+            qa_modules.GlobalLogManager.flush()
+            write_token_usage(job)
+
+def rollback_if_regressed(job, snapshot_id, progress, running_error):
+    """Restore the best earlier round when the last corrections made the run fail earlier than before
+    Args:
+        job (JobContext): Current job, job.snapshots holds one snapshot per round
+        snapshot_id (str): Snapshot the failed run started from
+        progress (int): Number of time steps the failed run completed
+        running_error (str): Error of the failed run
+    Returns:
+        running_error (str): Error to correct next, the one of the restored round after a rollback
+    """
+    failed_rounds = [snapshot for snapshot in job.snapshots.list()
+                     if "progress" in snapshot["meta"] and not snapshot["meta"]["success"]]
+    if not failed_rounds:
+        return running_error
+    # Latest of the rounds that got furthest, it carries the most corrections
+    best = max(failed_rounds, key=lambda snapshot: (snapshot["meta"]["progress"], snapshot["id"]))
+    if best["id"] == snapshot_id or best["meta"]["progress"] <= progress:
+        return running_error
+
+    changed = job.snapshots.restore(best["id"])
+    print(f"Run regressed ({progress} < {best['meta']['progress']} time steps), rolled back to {best['label']}: {changed}")
+    with open(f"{job.output_case_path}/error_history.txt", "a") as f:
+        f.write(f"Rolled back to {best['label']} ({best['meta']['progress']} time steps), restored files {changed}\n")
+    return best["meta"]["error"]
+
+def write_token_usage(job):
+    """Write the LLM token usage and cost of the job per stage to token_usage.json in the case directory"""
+    summary = qa_modules.GlobalLogManager.usage_summary(job.case_name)
+    if not summary or not os.path.isdir(job.output_case_path):
+        return
+    total = {name: sum(row[name] for row in summary)
+             for name in ("calls", "prompt_tokens", "cache_hit_tokens", "response_tokens", "reasoning_tokens", "cost")}
+    with open(os.path.join(job.output_case_path, "token_usage.json"), "w", encoding="utf-8") as f:
+        json.dump({"total": total, "stages": summary}, f, indent=2)
+    print(f"LLM usage of {job.case_name}: {total['calls']} calls, {total['prompt_tokens']} prompt tokens, "
+          f"{total['response_tokens'] + total['reasoning_tokens']} completion tokens, cost {total['cost']:.4f} USD")
+
+def record_experience(job, fix_base_id, fixed_error, snapshot_id, case_run_info):
+    """Store the corrections made between fix_base_id and snapshot_id if the run after them passed or failed differently
+    Args:
+        job (JobContext): Current job
+        fix_base_id (str): Snapshot taken right before the corrections
+        fixed_error (str): Error the corrections were made for
+        snapshot_id (str): Snapshot the following run started from
+        case_run_info (str): Result of the following run
+    """
+    store = experience_store.default_store()
+    if store is None:
+        return
+    if case_run_info == "case run success.":
+        outcome = experience_store.PASSED
+    elif case_run_info != fixed_error:
+        outcome = experience_store.ERROR_CHANGED
     else:
-        with open(config.pdf_path, 'r', encoding='utf-8') as file:
-            config.paper_content = file.read()
-            config.paper_table = []
+        return
+    files = experience_store.snapshot_fix(job.snapshots, fix_base_id, snapshot_id)
+    if files:
+        store.record(fixed_error, files, outcome, job.case_info.case_solver, job.case_info.turbulence_model, job.case_name)
+        print(f"Recorded fix of {list(files)} ({outcome})")
 
-    # prepare config
-    config.OUTPUT_PATH = os.path.join(config.path_cfg.output_path, case_name_idx)
-    config.path_cfg.output_case_path = os.path.join(config.path_cfg.output_path, case_name_idx)
+def _run_job(job):
+    case_name_idx = job.case_name
+
+    # Load PDF or txt file
+    with tracing.span("load_case_description", file=job.pdf_path):
+        if job.pdf_path.endswith('.pdf'):
+            pdf_data = process_pdf_pdfplumber(job.pdf_path)
+            job.paper_content, job.paper_table = pdf_data["text"], pdf_data["tables"]
+        else:
+            with open(job.pdf_path, 'r', encoding='utf-8') as file:
+                job.paper_content = file.read()
+                job.paper_table = []
 
     # Create folder for storing cases
-    config.ensure_directory_exists(config.path_cfg.output_case_path)
-    config.case_log_write = True
+    config.ensure_directory_exists(job.output_case_path)
+    job.case_log_write = True
 
     # list the files required by the solver and turbulence model
-    config.global_files, config.case_info.reference_file_name, _ = file_preparation.case_required_files(config.case_info.case_solver, config.case_info.turbulence_model)
-    config.global_files = list(config.global_files)
-    config.case_info.file_structure = list(config.global_files)
-    print("File structure:", config.case_info.file_structure)
-
-    # Generate initial files
-    write_initial_files = False
-    while not write_initial_files:
+    job.global_files, job.case_info.reference_file_name, _ = file_preparation.case_required_files(job.case_info.case_solver, job.case_info.turbulence_model)
+    job.global_files = list(job.global_files)
+    job.case_info.file_structure = list(job.global_files)
+    print("File structure:", job.case_info.file_structure)
+
+    # Generate initial files, regenerating them when the answers cannot be used
+    max_attempts = config.llm_cfg.llm_max_retries + 1
+    for attempt in range(1, max_attempts + 1):
         try:
-            config.global_files = file_preparation.generate_initial_files()
-            write_initial_files = True
-        except:
-            print("Regenerating initial files")
+            with tracing.span("generate_initial_files", attempt=attempt) as span:
+                job.global_files = file_preparation.generate_initial_files()
+                span.set(files=len(job.global_files))
+            break
+        except qa_modules.LLMUnavailableError:
+            raise
+        except Exception as e:
+            if qa_modules.is_rejected_request(e) or attempt == max_attempts:
+                raise
+            print(f"Regenerating initial files ({type(e).__name__}: {e}), attempt {attempt + 1}/{max_attempts}")
 
     # Simple check of file format and ensure correct dimensions
     print("Performing simple checks...")
-    config.global_files = file_preparation.check_file_format(config.global_files)
+    with tracing.span("check_file_format", files=len(job.global_files)):
+        job.global_files = file_preparation.check_file_format(job.global_files)
 
     # write the case files
-    for key, value in config.global_files.items():
-        output_file = f"{config.path_cfg.output_case_path}/{key}"
+    for key, value in job.global_files.items():
+        output_file = f"{job.output_case_path}/{key}"
 
         try:
             file_preparation.write_field_to_file(value,output_file)
@@ -94,33 +186,78 @@ def main(case_name_idx):
             print(f"Errors occur during write_field_to_file: {e}")
             continue
 
-    with open(f"{config.path_cfg.output_case_path}/error_history.txt", "w") as f:
+    with open(f"{job.output_case_path}/error_history.txt", "w") as f:
         f.write("****************error_history****************\n")
 
+    # A broken mesh cannot be repaired by editing the case files, do not spend correction rounds on it
+    quality = job.grid_info.mesh_quality
+    if quality is not None and not quality.ok:
+        with open(f"{job.output_case_path}/error_history.txt", "a") as f:
+            f.write(f"Mesh quality check failed:\n{quality.summary()}\n")
+        if config.run_cfg.reject_bad_mesh:
+            print(f"Case {case_name_idx} rejected, the mesh failed the quality checks")
+            return
+
+    # One snapshot per round, unchanged files are stored only once
+    job.snapshots = case_snapshot.CaseSnapshots(job.output_case_path)
+
+    last_fix = None     # (snapshot before the corrections, error they were made for) of the previous round
+    round_span = None
+
     # run the OpenFOAM case and ICOT debug
     for test_time in range(0, config.max_running_test_round):
+        # The round span covers the solver run and the corrections that follow it
+        if round_span is not None:
+            round_span.end()
+        round_span = tracing.start_span("correction_round", round=test_time)
         try:
             print(f"****************start running the case {case_name_idx} , test_round = {test_time}****************")
 
-            case_run_info = run_of_case.case_run(config.path_cfg.output_case_path)    # Run OpenFOAM case using subprocess
+            snapshot_id = job.snapshots.take(f"round_{test_time}")
+            case_run_info = run_of_case.case_run(job.output_case_path)    # Run OpenFOAM case using subprocess
+
+            if case_run_info == "case run success." and job.convergence_message:
+                with open(f"{job.output_case_path}/error_history.txt", "a") as f:
+                    f.write(f"=====Test round {test_time}=====\n{job.convergence_message}\n")
+                if config.run_cfg.correct_stagnated_runs:
+                    # Let the correction loop work on the numerics of a run that finished without converging
+                    job.flag_case_success_run = False
+                    case_run_info = job.convergence_message
+
+            progress = job.residual_log.n_rows if job.residual_log is not None else 0
+            job.snapshots.annotate(snapshot_id, success=case_run_info == "case run success.", progress=progress, error=str(case_run_info))
+
+            if last_fix is not None:
+                record_experience(job, *last_fix, snapshot_id, case_run_info)
+                last_fix = None
+
+            if job.pending_reflection_ids:
+                # The reflection of the previous round helped if the run succeeded or now fails differently
+                Reflextion.mark_reflections_solved(job, case_run_info == "case run success." or case_run_info != job.error_history[-1])
             
+            round_span.set(success=case_run_info == "case run success.", time_steps=progress)
             if case_run_info != "case run success.":
                 running_error = case_run_info
+                if config.run_cfg.rollback_on_regression:
+                    running_error = rollback_if_regressed(job, snapshot_id, progress, running_error)
                 # Error history record
-                with open(f"{config.path_cfg.output_case_path}/error_history.txt", "a") as f:
+                with open(f"{job.output_case_path}/error_history.txt", "a") as f:
                     f.write(f"=====Test round {test_time}=====\nRunning error:\n{running_error}\n")
+                if config.run_cfg.experience_store:
+                    # State the corrections of this round start from, after a possible rollback
+                    last_fix = (job.snapshots.take(f"round_{test_time}_fix_base"), running_error)
 
                 need_reflextion = False
-                config.error_history.append(running_error)
-                if len(config.error_history) > 4:
-                    config.error_history = config.error_history[-4:]  # Keep only the latest 4 entries
-                    config.correct_trajectory = config.correct_trajectory[-4:]
+                job.error_history.append(running_error)
+                if len(job.error_history) > 4:
+                    job.error_history = job.error_history[-4:]  # Keep only the latest 4 entries
+                    job.correct_trajectory = job.correct_trajectory[-4:]
 
-                if len(config.error_history) > 1:
-                    last_error = config.error_history[-1]  # Last error
+                if len(job.error_history) > 1:
+                    last_error = job.error_history[-1]  # Last error
                     count = 1  # Same error count, the last error itself counts as 1
-                    for i in range(len(config.error_history) - 2, -1, -1):
-                        if config.error_history[i] == last_error:
+                    for i in range(len(job.error_history) - 2, -1, -1):
+                        if job.error_history[i] == last_error:
                             count += 1
                         else:
                             break  # Stop when encountering different errors
@@ -129,13 +266,13 @@ def main(case_name_idx):
                         reference_files = file_corrector.find_reference_files_by_solver(file_for_revision)  # Find reference files based on file_for_revision
                         print("Rewriting file")
                         file_corrector.rewrite_file(file_for_revision,reference_files)
-                        config.error_history = []  # Reset error history
-                        with open(f"{config.path_cfg.output_case_path}/error_history.txt", "a") as f:
+                        job.error_history = []  # Reset error history
+                        with open(f"{job.output_case_path}/error_history.txt", "a") as f:
                             f.write("Error correction plan:\nRewrite file\n")
                     elif count > 1:
                         # Same error occurred consecutively, start reflection
-                        reflection_result = Reflextion.reflextion(running_error, config.correct_trajectory[-1*count:])
-                        relevant_reflections = Reflextion.constructe_reflection_context(running_error, Reflextion.reflection_history)
+                        reflection_result = Reflextion.reflextion(running_error, job.correct_trajectory[-1*count:])
+                        relevant_reflections = Reflextion.construct_reflection_context(running_error, job.reflection_history)
                         need_reflextion = True
 
                 if need_reflextion == False:
@@ -147,28 +284,34 @@ def main(case_name_idx):
                 if answer_add_new_file_strip.lower() != 'no':
                     print("Adding missing files")
                     file_for_adding = answer_add_new_file_strip
-                    config.correct_trajectory.append({file_for_adding:[file_corrector.add_new_file(file_for_adding)]})
+                    job.correct_trajectory.append({file_for_adding:[file_corrector.add_new_file(file_for_adding)]})
 
-                    with open(f"{config.path_cfg.output_case_path}/error_history.txt", "a") as f:
+                    with open(f"{job.output_case_path}/error_history.txt", "a") as f:
                         f.write(f"Error correction plan:\nAdd file {file_for_adding}\n")
+                    round_span.set(action="add_file", files=file_for_adding)
                 else:
-                    error_files = file_corrector.analyse_error(running_error, config.case_info.file_structure, relevant_reflections)
-                    config.correct_trajectory.append(file_corrector.correct_error(running_error, error_files, config.case_info.file_structure, relevant_reflections))
+                    if config.run_cfg.speculative_candidates > 1:
+                        # Several fixes are smoke-tested in parallel and the best one is kept
+                        job.correct_trajectory.append(speculative_correction.correct_speculatively(running_error, relevant_reflections))
+                    else:
+                        error_files = file_corrector.analyse_error(running_error, job.case_info.file_structure, relevant_reflections)
+                        job.correct_trajectory.append(file_corrector.correct_error(running_error, error_files, job.case_info.file_structure, relevant_reflections))
 
+                    round_span.set(action="modify_files", files=list(job.correct_trajectory[-1] or []))
                     try:
-                        with open(f"{config.path_cfg.output_case_path}/error_history.txt", "a") as f:
-                            f.write(f"Error correction plan:\nModify files {config.correct_trajectory[-1].keys()}\n")
+                        with open(f"{job.output_case_path}/error_history.txt", "a") as f:
+                            f.write(f"Error correction plan:\nModify files {job.correct_trajectory[-1].keys()}\n")
                     except:
                         print("Error correction plan:\nModify files...")
 
-                if not config.set_controlDict_time:
-                    run_of_case.setup_cfl_control(config.path_cfg.output_case_path)
+                if not job.set_controlDict_time:
+                    run_of_case.setup_cfl_control(job.output_case_path)
 
-                if not config.mesh_convert_success:
-                    file_preparation.convert_mesh(config.path_cfg.output_case_path, config.case_grid)
+                if not job.mesh_convert_success:
+                    file_preparation.convert_mesh(job.output_case_path, job.grid_path)
 
             else:
-                with open(f"{config.path_cfg.output_case_path}/cycle_index.txt", "w") as f:
+                with open(f"{job.output_case_path}/cycle_index.txt", "w") as f:
                     f.write(f"Case {case_name_idx} run successfully at test_round {test_time}+1.\n")
 
                 break
@@ -181,7 +324,8 @@ def main(case_name_idx):
 
                 # Catch and handle all exceptions
                 running_error = str(e)
-                with open(f"{config.path_cfg.output_case_path}/error_history.txt", "a") as f:
+                round_span.set(success=False, runtime_error=running_error)
+                with open(f"{job.output_case_path}/error_history.txt", "a") as f:
                     f.write(f"Runtime error occurred: {running_error}\n")
                 print("running_error: ", running_error)
 
@@ -195,7 +339,7 @@ def main(case_name_idx):
                     file_for_revision, early_revision_advice = file_corrector.analyze_running_error_with_all_case_file_content(running_error)
                     reference_files = file_corrector.find_reference_files_by_solver(file_for_revision)
                     # Check if error occurred three times, if so, rewrite the file.
-                    if file_corrector.analyze_error_repetition(config.error_history):
+                    if file_corrector.analyze_error_repetition(job.error_history):
                         file_corrector.rewrite_file(file_for_revision,reference_files)
                     else:
                         advices_for_revision = file_corrector.analyze_running_error_with_reference_files(running_error, file_for_revision,early_revision_advice,reference_files)
@@ -204,19 +348,19 @@ def main(case_name_idx):
                     file_for_adding = answer_add_new_file_strip
                     file_corrector.add_new_file(file_for_adding)
 
-                if not config.set_controlDict_time:
-                    run_of_case.setup_cfl_control(config.path_cfg.output_case_path)
+                if not job.set_controlDict_time:
+                    run_of_case.setup_cfl_control(job.output_case_path)
 
-                if not config.mesh_convert_success:
-                    run_of_case.convert_mesh(config.path_cfg.output_case_path, config.case_grid)
+                if not job.mesh_convert_success:
+                    file_preparation.convert_mesh(job.output_case_path, job.grid_path)
             except Exception as e:
                 print(f"Errors occur during exception handling: {e}")
 
             continue  # Explicitly continue to next loop
+    if round_span is not None:
+        round_span.end()
 
 def run_case():
-    load_OF_data_json()
-
     # Run 10 times
     run_times = config.run_cfg.run_time
 
@@ -0,0 +1,136 @@
+import os
+import json
+import shutil
+import hashlib
+import fcntl
+import contextlib
+
+import config
+
+"""
+Content-addressed cache of converted meshes.
+An input mesh (Fluent .msh file or polyMesh directory) is hashed once, converted once, and the resulting
+polyMesh is materialized into every case directory by reflink or hardlink instead of being converted again.
+"""
+
+_HASH_CHUNK = 1 << 20
+_MANIFEST_NAME = "manifest.json"
+_FICLONE = 0x40049409       # Linux ioctl sharing the data blocks of two files (reflink, copy-on-write)
+
+# Files that the pipeline rewrites in place (patch types are corrected), always copied so the cache is never modified
+_COPIED_FILES = {"boundary"}
+
+_digest_memo = {}           # (path, size, mtime_ns) -> digest, avoids hashing the same mesh for every run
+
+def cache_dir():
+    """Root directory of the mesh cache"""
+    return os.path.join(config.path_cfg.temp_dir, "mesh_cache")
+
+def _mesh_files(grid_path):
+    """Files making up the input mesh, as (relative path, absolute path) sorted by relative path"""
+    if os.path.isfile(grid_path):
+        return [(os.path.basename(grid_path), grid_path)]
+    files = []
+    for root, _, names in os.walk(grid_path):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, grid_path), path))
+    return sorted(files)
+
+def mesh_digest(grid_path, grid_type):
+    """Hash of the input mesh content, the mesh type and the OpenFOAM installation doing the conversion
+    Args:
+        grid_path (str): Fluent .msh file or polyMesh directory
+        grid_type (str): "msh" or "polyMesh"
+    Returns:
+        digest (str): sha256 hex digest
+    """
+    files = _mesh_files(grid_path)
+    stat_key = tuple((rel, os.stat(path).st_size, os.stat(path).st_mtime_ns) for rel, path in files)
+    memo_key = (os.path.abspath(grid_path), grid_type, stat_key)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+
+    digest = hashlib.sha256(f"{grid_type}|{config.dependencies_cfg.OpenFOAM_path}".encode("utf-8"))
+    for rel, path in files:
+        if grid_type == "polyMesh":
+            digest.update(rel.encode("utf-8") + b"\0")
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                digest.update(chunk)
+    _digest_memo[memo_key] = digest.hexdigest()
+    return _digest_memo[memo_key]
+
+def _manifest(polymesh_path):
+    """Size and mtime of every file, used to detect a cache entry modified through a hardlink"""
+    return {rel: [os.stat(path).st_size, os.stat(path).st_mtime_ns] for rel, path in _mesh_files(polymesh_path)}
+
+def lookup(digest):
+    """Return the cached polyMesh directory of digest, or None if it is missing or was modified"""
+    entry = os.path.join(cache_dir(), digest)
+    polymesh_path = os.path.join(entry, "polyMesh")
+    try:
+        with open(os.path.join(entry, _MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if _manifest(polymesh_path) == manifest:
+            return polymesh_path
+    except (OSError, json.JSONDecodeError):
+        return None
+    print(f"Mesh cache entry {digest} was modified, discarding it")
+    shutil.rmtree(entry, ignore_errors=True)
+    return None
+
+def store(digest, polymesh_path):
+    """Copy a converted polyMesh directory into the cache
+    Args:
+        digest (str): Digest of the input mesh, see mesh_digest()
+        polymesh_path (str): Converted constant/polyMesh directory
+    Returns:
+        cached_path (str): Cached polyMesh directory, None if the mesh could not be cached
+    """
+    entry = os.path.join(cache_dir(), digest)
+    tmp_entry = f"{entry}.{os.getpid()}.tmp"
+    try:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        shutil.copytree(polymesh_path, os.path.join(tmp_entry, "polyMesh"))
+        with open(os.path.join(tmp_entry, _MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(_manifest(os.path.join(tmp_entry, "polyMesh")), f)
+        # Renaming the whole entry makes it visible atomically, a worker that lost the race keeps the existing one
+        os.rename(tmp_entry, entry)
+    except OSError as e:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        if not os.path.isdir(entry):
+            print(f"Failed to cache mesh {digest}: {e}")
+            return None
+    return os.path.join(entry, "polyMesh")
+
+def _link_file(src, dst):
+    """Reflink src to dst if the filesystem supports it, otherwise hardlink, otherwise copy"""
+    if os.path.basename(src) in _COPIED_FILES:
+        return shutil.copy2(src, dst)
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return dst
+    except OSError:
+        # dst does not exist when opening one of the files failed
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+def materialize(cached_polymesh, constant_path):
+    """Place a cached polyMesh into constant_path, replacing any existing polyMesh
+    Args:
+        cached_polymesh (str): Cached polyMesh directory, see lookup()
+        constant_path (str): constant directory of the OpenFOAM case
+    """
+    target = os.path.join(constant_path, "polyMesh")
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    os.makedirs(constant_path, exist_ok=True)
+    shutil.copytree(cached_polymesh, target, copy_function=_link_file)
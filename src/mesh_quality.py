@@ -0,0 +1,179 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import polymesh
+
+"""
+Mesh quality checks computed from the polyMesh arrays with NumPy, following the definitions of checkMesh
+(primitiveMeshTools): face areas and centres from a triangle fan around the face average point, cell volumes
+and centres from pyramids on the estimated cell centre, non-orthogonality and skewness per face.
+"""
+
+_VSMALL = 1e-300
+_ROOTVSMALL = 1e-150
+
+@dataclass
+class MeshQuality:
+    """Result of check_mesh"""
+    n_cells: int = field(default=0, metadata={"description": "Number of cells"})
+    n_faces: int = field(default=0, metadata={"description": "Number of faces"})
+    min_volume: float = field(default=0.0, metadata={"description": "Smallest cell volume"})
+    max_volume: float = field(default=0.0, metadata={"description": "Largest cell volume"})
+    n_negative_volumes: int = field(default=0, metadata={"description": "Cells with zero or negative volume"})
+    min_face_area: float = field(default=0.0, metadata={"description": "Smallest face area"})
+    n_zero_area_faces: int = field(default=0, metadata={"description": "Faces with zero area"})
+    max_non_orthogonality: float = field(default=0.0, metadata={"description": "Largest internal face non-orthogonality in degrees"})
+    avg_non_orthogonality: float = field(default=0.0, metadata={"description": "Average internal face non-orthogonality in degrees"})
+    n_severe_non_orthogonal_faces: int = field(default=0, metadata={"description": "Internal faces above the non-orthogonality threshold"})
+    n_wrongly_oriented_faces: int = field(default=0, metadata={"description": "Internal faces whose normal points from neighbour to owner"})
+    max_skewness: float = field(default=0.0, metadata={"description": "Largest face skewness"})
+    n_skew_faces: int = field(default=0, metadata={"description": "Faces above the skewness threshold"})
+    failed_checks: list = field(default_factory=list, metadata={"description": "Human readable descriptions of the failed checks"})
+
+    @property
+    def ok(self):
+        return not self.failed_checks
+
+    def summary(self):
+        """Short text for logs and LLM prompts"""
+        lines = [
+            f"cells: {self.n_cells}, faces: {self.n_faces}",
+            f"cell volume: min {self.min_volume:.6g}, max {self.max_volume:.6g}, non-positive: {self.n_negative_volumes}",
+            f"non-orthogonality: max {self.max_non_orthogonality:.2f} deg, average {self.avg_non_orthogonality:.2f} deg, severe faces: {self.n_severe_non_orthogonal_faces}",
+            f"skewness: max {self.max_skewness:.3f}, highly skew faces: {self.n_skew_faces}",
+        ]
+        if self.failed_checks:
+            lines.append("failed checks: " + "; ".join(self.failed_checks))
+        else:
+            lines.append("all checks passed")
+        return "\n".join(lines)
+
+def face_geometry(points, offsets, point_labels):
+    """Face area vectors and centres
+    Args:
+        points (numpy.ndarray): (nPoints, 3)
+        offsets, point_labels (numpy.ndarray): Faces in compact form, see polymesh.read_faces()
+    Returns:
+        areas (numpy.ndarray): (nFaces, 3) area vectors
+        centres (numpy.ndarray): (nFaces, 3) face centres
+    """
+    sizes = np.diff(offsets)
+    starts = offsets[:-1]
+    face_of_point = np.repeat(np.arange(len(sizes)), sizes)
+
+    face_points = points[point_labels]
+    average = np.add.reduceat(face_points, starts, axis=0) / sizes[:, None]
+
+    # Next point of each face point, the last one wraps around to the first
+    next_index = np.arange(len(point_labels)) + 1
+    next_index[offsets[1:] - 1] = starts
+    next_points = face_points[next_index]
+    centre = average[face_of_point]
+
+    triangle_centres = face_points + next_points + centre
+    triangle_areas = np.cross(next_points - face_points, centre - face_points)
+    triangle_mags = np.linalg.norm(triangle_areas, axis=1)
+
+    areas = 0.5 * np.add.reduceat(triangle_areas, starts, axis=0)
+    weight = np.add.reduceat(triangle_mags, starts)
+    centres = np.add.reduceat(triangle_mags[:, None] * triangle_centres, starts, axis=0) / (3.0 * np.maximum(weight, _VSMALL)[:, None])
+    # Degenerate faces keep the average point as centre
+    degenerate = weight < _VSMALL
+    centres[degenerate] = average[degenerate]
+    return areas, centres
+
+def cell_geometry(areas, face_centres, owner, neighbour, n_cells):
+    """Cell volumes and centres from the pyramid decomposition on the estimated cell centre
+    Returns:
+        volumes (numpy.ndarray): (nCells,)
+        centres (numpy.ndarray): (nCells, 3)
+    """
+    n_internal = len(neighbour)
+    internal_centres = face_centres[:n_internal]
+
+    faces_per_cell = np.bincount(owner, minlength=n_cells) + np.bincount(neighbour, minlength=n_cells)
+    estimate = np.zeros((n_cells, 3))
+    for axis in range(3):
+        estimate[:, axis] = np.bincount(owner, face_centres[:, axis], n_cells) + np.bincount(neighbour, internal_centres[:, axis], n_cells)
+    estimate /= np.maximum(faces_per_cell, 1)[:, None]
+
+    owner_pyramids = np.einsum("ij,ij->i", areas, face_centres - estimate[owner])
+    neighbour_pyramids = np.einsum("ij,ij->i", areas[:n_internal], estimate[neighbour] - internal_centres)
+
+    volumes = np.bincount(owner, owner_pyramids, n_cells) + np.bincount(neighbour, neighbour_pyramids, n_cells)
+    centres = np.zeros((n_cells, 3))
+    for axis in range(3):
+        owner_centroids = 0.75 * face_centres[:, axis] + 0.25 * estimate[owner, axis]
+        neighbour_centroids = 0.75 * internal_centres[:, axis] + 0.25 * estimate[neighbour, axis]
+        centres[:, axis] = np.bincount(owner, owner_pyramids * owner_centroids, n_cells) \
+            + np.bincount(neighbour, neighbour_pyramids * neighbour_centroids, n_cells)
+    safe = np.abs(volumes) > _VSMALL
+    centres[safe] /= volumes[safe, None]
+    centres[~safe] = estimate[~safe]
+    return volumes / 3.0, centres
+
+def check_mesh(polymesh_path, max_non_orthogonality=70.0, max_skewness=4.0):
+    """Compute the checkMesh quality metrics of a polyMesh
+    Args:
+        polymesh_path (str): polyMesh directory
+        max_non_orthogonality (float): Threshold in degrees above which a face is reported, checkMesh uses 70
+        max_skewness (float): Threshold above which a face is reported, checkMesh uses 4
+    Returns:
+        quality (MeshQuality): Metrics and the list of failed checks
+    """
+    points = polymesh.read_points(polymesh_path)
+    offsets, point_labels = polymesh.read_faces(polymesh_path)
+    owner = polymesh.read_labels(polymesh_path, "owner").astype(np.int64)
+    neighbour = polymesh.read_labels(polymesh_path, "neighbour").astype(np.int64)
+    n_cells = int(max(owner.max(initial=-1), neighbour.max(initial=-1))) + 1
+    n_internal = len(neighbour)
+
+    areas, face_centres = face_geometry(points, offsets, point_labels)
+    volumes, cell_centres = cell_geometry(areas, face_centres, owner, neighbour, n_cells)
+    area_mags = np.linalg.norm(areas, axis=1)
+
+    # Non-orthogonality: angle between the owner-neighbour vector and the face normal
+    d = cell_centres[neighbour] - cell_centres[owner[:n_internal]]
+    d_dot_s = np.einsum("ij,ij->i", d, areas[:n_internal])
+    cos_angle = d_dot_s / np.maximum(np.linalg.norm(d, axis=1) * area_mags[:n_internal], _VSMALL)
+    non_orthogonality = np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+    # Skewness: distance between the face centre and where the owner-neighbour line crosses the face, relative to |d|.
+    # Boundary faces use the owner centre mirrored on the face
+    face_d = np.empty_like(face_centres)
+    face_d[:n_internal] = d
+    owner_to_face = face_centres - cell_centres[owner]
+    boundary_normals = areas[n_internal:] / np.maximum(area_mags[n_internal:], _VSMALL)[:, None]
+    face_d[n_internal:] = 2.0 * np.einsum("ij,ij->i", boundary_normals, owner_to_face[n_internal:])[:, None] * boundary_normals
+    ratio = np.einsum("ij,ij->i", areas, owner_to_face) / (np.einsum("ij,ij->i", areas, face_d) + _ROOTVSMALL)
+    skew_vector = owner_to_face - ratio[:, None] * face_d
+    skewness = np.linalg.norm(skew_vector, axis=1) / (np.linalg.norm(face_d, axis=1) + _ROOTVSMALL)
+
+    quality = MeshQuality(
+        n_cells=n_cells,
+        n_faces=len(areas),
+        min_volume=float(volumes.min()) if n_cells else 0.0,
+        max_volume=float(volumes.max()) if n_cells else 0.0,
+        n_negative_volumes=int(np.count_nonzero(volumes <= _VSMALL)),
+        min_face_area=float(area_mags.min()) if len(area_mags) else 0.0,
+        n_zero_area_faces=int(np.count_nonzero(area_mags <= _VSMALL)),
+        max_non_orthogonality=float(non_orthogonality.max(initial=0.0)),
+        avg_non_orthogonality=float(non_orthogonality.mean()) if n_internal else 0.0,
+        n_severe_non_orthogonal_faces=int(np.count_nonzero(non_orthogonality > max_non_orthogonality)),
+        n_wrongly_oriented_faces=int(np.count_nonzero(d_dot_s <= 0)),
+        max_skewness=float(skewness.max(initial=0.0)),
+        n_skew_faces=int(np.count_nonzero(skewness > max_skewness)),
+    )
+
+    if quality.n_negative_volumes:
+        quality.failed_checks.append(f"{quality.n_negative_volumes} cells with zero or negative volume")
+    if quality.n_zero_area_faces:
+        quality.failed_checks.append(f"{quality.n_zero_area_faces} faces with zero area")
+    if quality.n_wrongly_oriented_faces:
+        quality.failed_checks.append(f"{quality.n_wrongly_oriented_faces} internal faces with incorrect orientation")
+    if quality.n_severe_non_orthogonal_faces:
+        quality.failed_checks.append(f"{quality.n_severe_non_orthogonal_faces} faces with non-orthogonality above {max_non_orthogonality} deg (max {quality.max_non_orthogonality:.2f})")
+    if quality.n_skew_faces:
+        quality.failed_checks.append(f"{quality.n_skew_faces} faces with skewness above {max_skewness} (max {quality.max_skewness:.3f})")
+    return quality
@@ -0,0 +1,256 @@
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import llm_replay
+
+"""
+OpenAI-compatible stand-in for the DeepSeek endpoints, answering from recorded calls (llm_replay) so that the pipeline
+and the orchestrator API run without network and without cost.
+Serves POST /chat/completions (also under /v1), streamed or not, with the reasoning content and the usage of the
+recordings, GET /models and GET /stats. Answers are delayed by a configurable latency distribution and errors can be
+injected to exercise the retries and failover of qa_modules.
+Point the pipeline at it with DEEPSEEK_V3_BASE_URL and DEEPSEEK_R1_BASE_URL (or an llm_backends entry) set to
+http://127.0.0.1:<port>, e.g.
+    python src/mock_llm_server.py --store runs/recorded.sqlite --latency lognormal:0.5,0.6 --port 8001
+"""
+
+class LatencyModel:
+    """Seconds an answer takes, from a specification string
+        fixed:S                 S seconds
+        uniform:A,B             uniformly between A and B seconds
+        lognormal:MEDIAN,SIGMA  lognormal with the given median in seconds and sigma of the log
+        recorded[:SCALE]        latency of the recording, times SCALE
+    """
+    def __init__(self, spec="fixed:0", seed=None):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value.strip()]
+        if kind == "fixed":
+            self._sample = lambda recorded: values[0] if values else 0.0
+        elif kind == "uniform":
+            self._sample = lambda recorded: self._rng.uniform(values[0], values[1])
+        elif kind == "lognormal":
+            self._sample = lambda recorded: self._rng.lognormvariate(math.log(values[0]), values[1])
+        elif kind == "recorded":
+            self._sample = lambda recorded: recorded * (values[0] if values else 1.0)
+        else:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, recorded=0.0):
+        with self._lock:
+            return max(self._sample(recorded), 0.0)
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store, latency, on_miss="error", error_rate=0.0, ttft_fraction=0.2, chunk_chars=20,
+                 seed=None):
+        """
+        Args:
+            address (tuple): (host, port) to listen on
+            store (llm_replay.ReplayStore): Recorded answers
+            latency (LatencyModel): Total duration of an answer
+            on_miss (str): Prompt without a recording: "error" (HTTP 404) or "nearest" (recording of the most similar prompt)
+            error_rate (float): Fraction of requests answered with a 503 or a 429
+            ttft_fraction (float): Part of the latency spent before the first chunk of a streamed answer
+            chunk_chars (int): Characters per chunk of a streamed answer
+        """
+        super().__init__(address, MockLLMHandler)
+        self.store = store
+        self.latency = latency
+        self.on_miss = on_miss
+        self.error_rate = error_rate
+        self.ttft_fraction = ttft_fraction
+        self.chunk_chars = chunk_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "hits": 0, "nearest": 0, "misses": 0, "injected_errors": 0}
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def inject_error(self):
+        """Status of an injected error for this request, None for a normal answer"""
+        with self._lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            return self._rng.choice((429, 503))
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": "mock_llm_server", "code": status}}, headers)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path in ("/models", "/v1/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock_llm_server"}]})
+        elif path == "/stats":
+            self._send_json(200, {**self.server.counters, "recordings": len(self.server.store),
+                                  "latency": self.server.latency.spec})
+        else:
+            self._send_error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_error(400, "Request body is not JSON")
+            return
+        if path not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_error(404, f"Unknown path {self.path}")
+            return
+        server = self.server
+        server.count("requests")
+        status = server.inject_error()
+        if status is not None:
+            server.count("injected_errors")
+            self._send_error(status, "Injected error", {"Retry-After": "1"} if status == 429 else None)
+            return
+
+        messages = body.get("messages") or []
+        recording = server.store.lookup(messages)
+        if recording is not None:
+            server.count("hits")
+        elif server.on_miss == "nearest":
+            recording = server.store.nearest(messages)
+            if recording is not None:
+                server.count("nearest")
+        if recording is None:
+            server.count("misses")
+            self._send_error(404, f"No recorded answer for prompt {llm_replay.prompt_key(messages)}")
+            return
+
+        seconds = server.latency.sample(recording["latency"])
+        model = body.get("model") or recording["model"] or "mock"
+        usage = _usage(recording)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._stream(recording, model, usage if include_usage else None, seconds)
+        else:
+            time.sleep(seconds)
+            message = {"role": "assistant", "content": recording["content"]}
+            if recording["reasoning"]:
+                message["reasoning_content"] = recording["reasoning"]
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _stream(self, recording, model, usage, seconds):
+        """Send the recording as server-sent events, reasoning first, spread over seconds"""
+        chunk_chars = self.server.chunk_chars
+        deltas = [{"reasoning_content": recording["reasoning"][i:i + chunk_chars]}
+                  for i in range(0, len(recording["reasoning"]), chunk_chars)]
+        deltas += [{"content": recording["content"][i:i + chunk_chars]}
+                   for i in range(0, len(recording["content"]), chunk_chars)]
+        first_delay = seconds * self.server.ttft_fraction
+        interval = (seconds - first_delay) / max(len(deltas), 1)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def event(choices, extra=None):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": choices, **(extra or {})}
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            time.sleep(first_delay)
+            self.wfile.write(event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))
+            for delta in deltas:
+                self.wfile.write(event([{"index": 0, "delta": delta, "finish_reason": None}]))
+                self.wfile.flush()
+                time.sleep(interval)
+            self.wfile.write(event([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if usage is not None:
+                self.wfile.write(event([], {"usage": usage}))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early, e.g. once the JSON object was complete
+            pass
+
+def _usage(recording):
+    completion_tokens = recording["completion_tokens"] + recording["reasoning_tokens"]
+    return {
+        "prompt_tokens": recording["prompt_tokens"],
+        "completion_tokens": completion_tokens,
+        "total_tokens": recording["prompt_tokens"] + completion_tokens,
+        "completion_tokens_details": {"reasoning_tokens": recording["reasoning_tokens"]},
+        "prompt_cache_hit_tokens": 0,
+    }
+
+def start_server(store_path, host="127.0.0.1", port=0, latency="fixed:0", **kwargs):
+    """Start a mock server in a background thread
+    Args:
+        store_path (str): SQLite file of the recordings (llm_config.llm_record_path of a recorded run)
+        port (int): Port to listen on, 0 for a free port
+        latency (str): LatencyModel specification
+        **kwargs: Other MockLLMServer arguments
+    Returns:
+        server (MockLLMServer): Running server, its base URL is f"http://{host}:{server.server_address[1]}", stop it with shutdown()
+    """
+    server = MockLLMServer((host, port), llm_replay.ReplayStore(store_path), LatencyModel(latency, kwargs.get("seed")), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server replaying recorded answers")
+    parser.add_argument("--store", required=True, help="SQLite file of the recordings")
+    parser.add_argument("--import-logs", nargs="*", default=[], help="qa_logs.jsonl files to add to the store first")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S, uniform:A,B, lognormal:MEDIAN,SIGMA or recorded[:SCALE]")
+    parser.add_argument("--on-miss", choices=("error", "nearest"), default="error", help="Answer to prompts without a recording")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 429 or a 503")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and error sampling")
+    args = parser.parse_args()
+
+    store = llm_replay.ReplayStore(args.store)
+    for log_path in args.import_logs:
+        print(f"Imported {store.import_qa_logs(log_path)} calls from {log_path}")
+    server = MockLLMServer((args.host, args.port), store, LatencyModel(args.latency, args.seed), args.on_miss,
+                           args.error_rate, seed=args.seed)
+    print(f"Mock LLM server on http://{args.host}:{server.server_address[1]} with {len(store)} recordings")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import math
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+
+"""
+Routing of LLM calls between several OpenAI-compatible backends of the same role.
+Each backend keeps a rolling window of its recent calls (latency and success). Calls go to the preferred healthy
+backend unless another healthy one is much faster, and fail over to the next backend when a call fails. A backend with
+a high recent error rate or consecutive failures is skipped until its cooldown has passed.
+Only the standard library is used, so that the module is shared by the ChatCFD pipeline (qa_modules) and the
+orchestrator API (server/app.py).
+"""
+
+CHAT = "chat"
+REASONER = "reasoner"
+
+@dataclass
+class Backend:
+    """An OpenAI-compatible endpoint serving one role"""
+    name: str
+    role: str
+    base_url: str
+    model: str
+    api_key: str = ""
+    path: str = "/chat/completions"
+    force_json: str = "1"
+    supports_response_format: bool = True
+
+    @classmethod
+    def from_dict(cls, data):
+        """Backend from a configuration entry, unknown keys are ignored"""
+        known = {key: value for key, value in data.items() if key in cls.__dataclass_fields__}
+        known.setdefault("name", f"{known.get('role', CHAT)}:{known.get('model', '')}@{known.get('base_url', '')}")
+        return cls(**known)
+
+    def as_dict(self):
+        return asdict(self)
+
+class BackendStats:
+    """Recent calls of a backend, samples older than window_seconds are forgotten"""
+    def __init__(self, window=100, window_seconds=300.0):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=window)    # (time, seconds, ok)
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+    def record(self, seconds, ok):
+        now = time.monotonic()
+        self._samples.append((now, seconds, ok))
+        self.calls += 1
+        if ok:
+            self.consecutive_failures = 0
+        else:
+            self.errors += 1
+            self.consecutive_failures += 1
+            self.last_failure = now
+
+    def _recent(self):
+        limit = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < limit:
+            self._samples.popleft()
+        return self._samples
+
+    def latencies(self):
+        """Sorted latencies of the recent successful calls"""
+        return sorted(seconds for _, seconds, ok in self._recent() if ok)
+
+    def percentile(self, q):
+        """Nearest-rank percentile of the recent successful latencies, None without samples"""
+        latencies = self.latencies()
+        if not latencies:
+            return None
+        return latencies[min(max(math.ceil(q / 100.0 * len(latencies)), 1), len(latencies)) - 1]
+
+    def error_rate(self):
+        samples = self._recent()
+        return sum(1 for _, _, ok in samples if not ok) / len(samples) if samples else 0.0
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "recent_calls": len(self._recent()),
+            "error_rate": round(self.error_rate(), 3),
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+class NoBackendError(RuntimeError):
+    """Raised when a role has no configured backend"""
+
+class ModelRouter:
+    """Backends per role with latency and error tracking, safe to use from several threads"""
+    def __init__(self, backends=(), min_samples=5, max_error_rate=0.5, max_consecutive_failures=3, cooldown=60.0,
+                 slow_factor=2.0, window_seconds=300.0):
+        """
+        Args:
+            backends (list): Backend instances, earlier backends of a role are preferred
+            min_samples (int): Recent calls needed before the latency or error rate of a backend is trusted
+            max_error_rate (float): Recent error rate above which a backend is skipped
+            max_consecutive_failures (int): Failures in a row after which a backend is skipped
+            cooldown (float): Seconds after its last failure before a skipped backend is tried again
+            slow_factor (float): A faster backend is preferred when the preferred one's p50 latency is this many times its own
+            window_seconds (float): Age after which calls no longer count in the statistics
+        """
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        self.slow_factor = slow_factor
+        self.window_seconds = window_seconds
+        self._backends = []
+        self._stats = {}
+        self._lock = threading.Lock()
+        for backend in backends:
+            self.add(backend)
+
+    def add(self, backend):
+        """Add a backend, replacing a backend of the same name"""
+        with self._lock:
+            self._backends = [existing for existing in self._backends if existing.name != backend.name] + [backend]
+            self._stats.setdefault(backend.name, BackendStats(window_seconds=self.window_seconds))
+
+    def backends(self, role):
+        with self._lock:
+            return [backend for backend in self._backends if backend.role == role]
+
+    def _healthy(self, stats):
+        if time.monotonic() - stats.last_failure >= self.cooldown:
+            return True
+        if stats.consecutive_failures >= self.max_consecutive_failures:
+            return False
+        return not (len(stats._recent()) >= self.min_samples and stats.error_rate() > self.max_error_rate)
+
+    def candidates(self, role, preferred=None):
+        """Backends of a role in the order they should be tried
+        Args:
+            role (str): CHAT or REASONER
+            preferred (str): Name of the backend to try first when it is healthy and not much slower than another
+        Returns:
+            backends (list): Healthy backends first, the fastest measured one first if the preferred one is slow, then
+                skipped backends, least recently failed first, as a last resort
+        """
+        backends = self.backends(role)
+        backends.sort(key=lambda backend: backend.name != preferred)
+        with self._lock:
+            healthy = [backend for backend in backends if self._healthy(self._stats[backend.name])]
+            skipped = sorted((backend for backend in backends if backend not in healthy),
+                             key=lambda backend: self._stats[backend.name].last_failure)
+            p50 = {}
+            for backend in healthy:
+                stats = self._stats[backend.name]
+                if len(stats.latencies()) >= self.min_samples:
+                    p50[backend.name] = stats.percentile(50)
+        if healthy and healthy[0].name in p50:
+            fastest = min((backend for backend in healthy if backend.name in p50), key=lambda backend: p50[backend.name])
+            if p50[fastest.name] * self.slow_factor < p50[healthy[0].name]:
+                healthy.remove(fastest)
+                healthy.insert(0, fastest)
+        return healthy + skipped
+
+    def record(self, name, seconds, ok):
+        """Record a call made to a backend"""
+        with self._lock:
+            if name in self._stats:
+                self._stats[name].record(seconds, ok)
+
+    def call(self, role, request, preferred=None, should_fail_over=None):
+        """Call request(backend, fallbacks) on the candidates of a role until one succeeds
+        Args:
+            role (str): CHAT or REASONER
+            request (callable): Makes the call on one backend, fallbacks being the number of backends left after it
+            preferred (str): Name of the backend to try first
+            should_fail_over (callable): Whether an error says the backend is unhealthy; other errors (e.g. a rejected
+                request) are raised at once without counting against the backend. Defaults to every error
+        Returns:
+            backend (Backend): Backend that answered
+            result: Return value of request
+        Raises:
+            NoBackendError: If the role has no backend
+            Exception: Error of the last backend tried, or the first error that does not fail over
+        """
+        candidates = self.candidates(role, preferred)
+        if not candidates:
+            raise NoBackendError(f"No LLM backend configured for role {role}")
+        for index, backend in enumerate(candidates):
+            start = time.monotonic()
+            try:
+                result = request(backend, len(candidates) - index - 1)
+            except Exception as e:
+                if should_fail_over is not None and not should_fail_over(e):
+                    raise
+                self.record(backend.name, time.monotonic() - start, False)
+                if index == len(candidates) - 1:
+                    raise
+                print(f"LLM backend {backend.name} failed ({type(e).__name__}: {e}), failing over to {candidates[index + 1].name}")
+                continue
+            self.record(backend.name, time.monotonic() - start, True)
+            return backend, result
+
+    def stats(self):
+        """Statistics of every backend, {name: {role, model, base_url, calls, error_rate, p50_seconds, ...}}"""
+        with self._lock:
+            return {backend.name: {"role": backend.role, "model": backend.model, "base_url": backend.base_url,
+                                   "healthy": self._healthy(self._stats[backend.name]), **self._stats[backend.name].summary()}
+                    for backend in self._backends}
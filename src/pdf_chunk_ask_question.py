@@ -1,34 +1,45 @@
-import pdfplumber
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from openai import OpenAI
-from pdfplumber.utils import within_bbox
 import re
-import tiktoken
 from datetime import datetime
 import qa_modules, config, os
 
+# torch, faiss, sentence_transformers, langchain and pdfplumber are heavy, they are
+# imported when an extractor is created instead of when the pipeline is imported
+
+_embedders = {}     # model_name -> SentenceTransformer, shared by all extractors of the process
+
+def load_embedder(model_name):
+    """Load a SentenceTransformer once per process"""
+    if model_name not in _embedders:
+        from sentence_transformers import SentenceTransformer
+        import torch
+        # Avoid file watchers (e.g. streamlit) failing on torch.classes.__path__
+        torch.classes.__path__ = [os.path.join(torch.__path__[0], torch.classes.__file__)]
+        _embedders[model_name] = SentenceTransformer(model_name)
+    return _embedders[model_name]
+
 
 class CFDCaseExtractor:
-    def __init__(self, model_name=config.sentence_transformer_path):
-        if not os.path.exists(config.sentence_transformer_path):
+    def __init__(self, model_name=None):
+        if model_name is None:
+            model_name = config.sentence_transformer_path
+        if not os.path.exists(model_name):
             model_name='sentence-transformers/all-mpnet-base-v2'
-        self.embedder = SentenceTransformer(model_name)
-        self.client = OpenAI(
-            api_key=os.environ.get("DEEPSEEK_R1_KEY"), 
-            base_url=os.environ.get("DEEPSEEK_R1_BASE_URL")
-        )
+        self.embedder = load_embedder(model_name)
         self.gpt_model = os.environ.get("DEEPSEEK_R1_MODEL_NAME")
         self.index = None
         self.chunks = []
         self.token_usage = []  # Added Token usage statistics storage
-        self.encoder = tiktoken.encoding_for_model("gpt-4")
+        self.encoder = qa_modules.get_encoding("gpt-4")
 
     def process_pdf(self, file_path):
         """Optimized PDF processing workflow (fixed bbox errors)"""
+        import faiss
+        import numpy as np
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
         if file_path.endswith('.pdf'):
+            import pdfplumber
+
             with pdfplumber.open(file_path) as pdf:
                 text_blocks = []
                 for i, page in enumerate(pdf.pages):
@@ -127,15 +138,16 @@ class CFDCaseExtractor:
         """Use Tiktoken to accurately calculate tokens"""
         return len(self.encoder.encode(text))
 
-    def query_case_setup(self, question, detailed_question = None, top_k=3, context = False):
+    def query_case_setup(self, question, detailed_question = None, top_k=3, context = False, pydantic_object = None):
         """Enhanced query method with Token statistics
         Args:
             question (str): User's question, used for embedding to find relevant chunks
             detailed_question (str): Detailed question for LLM to answer (usually includes question)
             top_k (int): Number of relevant chunks to return
             context (bool): Whether to use context
+            pydantic_object (type): Pydantic model of a JSON answer, validated while it is streamed
         Return:
-            R1_response (str): LLM's response
+            R1_response (str or BaseModel): LLM's response, the validated object when pydantic_object is given
         """
         if detailed_question == None:
             detailed_question = question
@@ -180,6 +192,9 @@ class CFDCaseExtractor:
             else:
                 qa = qa_modules.QA_NoContext_deepseek_R1()
 
+            if pydantic_object is not None:
+                return qa_modules.ask_json(qa, prompt, pydantic_object)
+
             R1_response = qa.ask(prompt)
 
             return R1_response
@@ -0,0 +1,262 @@
+import os
+import re
+import gzip
+import mmap
+from dataclasses import dataclass, field
+
+import numpy as np
+
+"""
+Reader for OpenFOAM polyMesh directories (boundary, points, faces, owner, neighbour), ASCII and binary,
+without PyFoam. Lists are memory mapped and decoded by NumPy.
+"""
+
+_HEADER = re.compile(rb'FoamFile\s*\{(.*?)\}', re.DOTALL)
+_HEADER_ENTRY = re.compile(rb'(\w+)\s+("[^"]*"|[^;]*);')
+_COMMENT = re.compile(rb'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_LIST_START = re.compile(rb'(\d+)\s*\(')
+_TOKEN = re.compile(r'"[^"]*"|[{}();]|[^\s{}();]+')
+_PARENTHESES_TO_SPACE = bytes.maketrans(b"()", b"  ")
+
+class _MeshFile:
+    """A polyMesh file, memory mapped (or decompressed for .gz), with its FoamFile header parsed"""
+    def __init__(self, path):
+        if not os.path.exists(path) and os.path.exists(path + ".gz"):
+            path = path + ".gz"
+        self.path = path
+        self._file = None
+        self._mm = None
+        if path.endswith(".gz"):
+            with gzip.open(path, 'rb') as f:
+                self.data = f.read()
+        else:
+            self._file = open(path, 'rb')
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self.data = b""
+            else:
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.data = self._mm
+
+        match = _HEADER.search(self.data[:4096])
+        self.header = {}
+        self.body_start = 0
+        if match:
+            self.body_start = match.end()
+            for key, value in _HEADER_ENTRY.findall(match.group(1)):
+                self.header[key.decode()] = value.strip(b'"').decode()
+
+        self.binary = self.header.get("format", "ascii") == "binary"
+        arch = self.header.get("arch", "")
+        label_bits = re.search(r'label=(\d+)', arch)
+        scalar_bits = re.search(r'scalar=(\d+)', arch)
+        self.label_dtype = np.dtype(np.int64 if label_bits and label_bits.group(1) == "64" else np.int32)
+        self.scalar_dtype = np.dtype(np.float32 if scalar_bits and scalar_bits.group(1) == "32" else np.float64)
+        if "MSB" in arch:
+            self.label_dtype = self.label_dtype.newbyteorder(">")
+            self.scalar_dtype = self.scalar_dtype.newbyteorder(">")
+
+    def close(self):
+        # Arrays returned for binary lists are copied, so the map can be released
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_list(self, pos, dtype, width=1):
+        """Read the list starting at pos, e.g. `8 (...)`
+        Args:
+            pos (int): Offset to search the list from
+            dtype (numpy.dtype): Element type, label_dtype or scalar_dtype
+            width (int): Number of components per element (3 for vectors)
+        Returns:
+            values (numpy.ndarray): Shape (n,) or (n, width)
+            end (int): Offset after the closing parenthesis
+        """
+        # Skip comments between the header and the list size
+        while True:
+            match = _LIST_START.search(self.data, pos)
+            if match is None:
+                raise ValueError(f"No list found in {self.path}")
+            comment = _COMMENT.search(self.data, pos, match.start())
+            if comment is None:
+                break
+            pos = comment.end()
+        count = int(match.group(1))
+        start = match.end()
+
+        if self.binary:
+            nbytes = count * width * dtype.itemsize
+            values = np.frombuffer(self.data, dtype=dtype, count=count * width, offset=start).astype(dtype.newbyteorder("="))
+            end = start + nbytes + 1
+        else:
+            # A label list has no inner parentheses, a vector list is the only list of its file and ends at the last one
+            end = self.data.find(b")", start) if width == 1 else self.data.rfind(b")")
+            if end < start:
+                raise ValueError(f"Unterminated list in {self.path}")
+            # Vectors are written as (x y z), blanking the inner parentheses leaves the numbers in order
+            text = self.data[start:end].translate(_PARENTHESES_TO_SPACE)
+            values = _parse_numbers(text, dtype.newbyteorder("="))
+            end += 1
+            if len(values) != count * width:
+                raise ValueError(f"Expected {count * width} values in {self.path}, found {len(values)}")
+        if width > 1:
+            values = values.reshape(count, width)
+        return values, end
+
+def _parse_numbers(text, dtype):
+    """Numbers of a whitespace separated ASCII payload; np.fromstring of blank text would return one value"""
+    if not text.strip():
+        return np.zeros(0, dtype=dtype)
+    return np.fromstring(text, dtype=dtype, sep=" ")
+
+def read_boundary(polymesh_path):
+    """Read the patches of polyMesh/boundary
+    Args:
+        polymesh_path (str): polyMesh directory
+    Returns:
+        patches (dict): key is patch name, value is the patch dictionary (type, nFaces, startFace, ...), in file order
+    """
+    with _MeshFile(os.path.join(polymesh_path, "boundary")) as mesh_file:
+        body = _COMMENT.sub(b" ", bytes(mesh_file.data[mesh_file.body_start:])).decode("utf-8", errors="replace")
+
+    tokens = _TOKEN.findall(body)
+    start = tokens.index("(") + 1
+    patches, _ = _parse_entries(tokens, start, ")")
+    for patch in patches.values():
+        for key in ("nFaces", "startFace"):
+            if key in patch:
+                patch[key] = int(patch[key])
+    return patches
+
+def _parse_entries(tokens, pos, closing):
+    """Parse `key value;` and `key { ... }` entries until the closing token"""
+    entries = {}
+    while pos < len(tokens) and tokens[pos] != closing:
+        key = tokens[pos]
+        pos += 1
+        if tokens[pos] == "{":
+            entries[key], pos = _parse_entries(tokens, pos + 1, "}")
+            pos += 1
+        else:
+            value = []
+            depth = 0
+            while depth > 0 or tokens[pos] != ";":
+                depth += {"(": 1, ")": -1}.get(tokens[pos], 0)
+                value.append(tokens[pos])
+                pos += 1
+            entries[key] = " ".join(value).strip('"')
+            pos += 1
+    return entries, pos
+
+def read_points(polymesh_path):
+    """Read polyMesh/points as an (nPoints, 3) float array"""
+    with _MeshFile(os.path.join(polymesh_path, "points")) as mesh_file:
+        points, _ = mesh_file.read_list(mesh_file.body_start, mesh_file.scalar_dtype, width=3)
+    return points
+
+def read_labels(polymesh_path, name):
+    """Read a labelList such as polyMesh/owner or polyMesh/neighbour as an int array"""
+    with _MeshFile(os.path.join(polymesh_path, name)) as mesh_file:
+        labels, _ = mesh_file.read_list(mesh_file.body_start, mesh_file.label_dtype)
+    return labels
+
+def read_faces(polymesh_path):
+    """Read polyMesh/faces in compact form
+    Returns:
+        offsets (numpy.ndarray): nFaces + 1 offsets into point_labels, face i is point_labels[offsets[i]:offsets[i + 1]]
+        point_labels (numpy.ndarray): Point labels of all faces
+    """
+    with _MeshFile(os.path.join(polymesh_path, "faces")) as mesh_file:
+        if mesh_file.header.get("class") == "faceCompactList":
+            offsets, end = mesh_file.read_list(mesh_file.body_start, mesh_file.label_dtype)
+            point_labels, _ = mesh_file.read_list(end, mesh_file.label_dtype)
+            return offsets, point_labels
+
+        # faceList, only written in ASCII: n( k(p0 ... pk-1) ... )
+        return _read_ascii_face_list(mesh_file)
+
+def _read_ascii_face_list(mesh_file):
+    """Decode an ASCII faceList into compact form"""
+    match = _LIST_START.search(mesh_file.data, mesh_file.body_start)
+    count = int(match.group(1))
+    end = mesh_file.data.rfind(b")")
+    numbers = _parse_numbers(mesh_file.data[match.end():end].translate(_PARENTHESES_TO_SPACE), np.dtype(np.int64))
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    sizes = np.zeros(count, dtype=np.int64)
+    pos = 0
+    for i in range(count):
+        sizes[i] = numbers[pos]
+        pos += sizes[i] + 1
+    offsets[1:] = np.cumsum(sizes)
+    keep = np.ones(len(numbers), dtype=bool)
+    keep[offsets[:-1] + np.arange(count)] = False
+    return offsets, numbers[keep]
+
+def _header_note(polymesh_path):
+    """Sizes written by OpenFOAM in the note of owner, e.g. "nPoints:8 nCells:1 nFaces:6 nInternalFaces:0" """
+    with _MeshFile(os.path.join(polymesh_path, "owner")) as mesh_file:
+        note = mesh_file.header.get("note", "")
+    return {key: int(value) for key, value in re.findall(r'(\w+):\s*(\d+)', note)}
+
+@dataclass
+class MeshStats:
+    """Size summary of a polyMesh"""
+    n_points: int = field(default=0, metadata={"description": "Number of points"})
+    n_faces: int = field(default=0, metadata={"description": "Number of faces"})
+    n_internal_faces: int = field(default=0, metadata={"description": "Number of internal faces"})
+    n_cells: int = field(default=0, metadata={"description": "Number of cells"})
+    bounding_box: tuple = field(default=((0.0, 0.0, 0.0), (0.0, 0.0, 0.0)), metadata={"description": "(min, max) corners of the mesh"})
+    patch_sizes: dict = field(default_factory=dict, metadata={"description": "key is patch name, value is number of faces"})
+    patch_types: dict = field(default_factory=dict, metadata={"description": "key is patch name, value is patch type"})
+
+    @property
+    def mean_cell_size(self):
+        """Rough cell length scale for deltaT estimates: bounding box volume per cell to the power 1/3, or for a 2D mesh
+        (with empty patches) the area per cell of its two largest extents to the power 1/2"""
+        (x0, y0, z0), (x1, y1, z1) = self.bounding_box
+        extents = sorted((x1 - x0, y1 - y0, z1 - z0))
+        if self.n_cells == 0 or extents[0] <= 0:
+            return 0.0
+        if "empty" in self.patch_types.values():
+            # 2D mesh: one cell across its thinnest direction, the length scale is the area per cell to the power 1/2
+            return float((extents[1] * extents[2] / self.n_cells) ** 0.5)
+        return float((np.prod(extents) / self.n_cells) ** (1.0 / 3.0))
+
+def read_mesh_stats(polymesh_path):
+    """Read the size summary of a polyMesh without running checkMesh
+    Args:
+        polymesh_path (str): polyMesh directory
+    Returns:
+        stats (MeshStats): Point/face/cell counts, bounding box and patch sizes
+    """
+    patches = read_boundary(polymesh_path)
+    points = read_points(polymesh_path)
+    note = _header_note(polymesh_path)
+
+    if "nCells" in note and "nFaces" in note and "nInternalFaces" in note:
+        n_cells, n_faces, n_internal_faces = note["nCells"], note["nFaces"], note["nInternalFaces"]
+    else:
+        owner = read_labels(polymesh_path, "owner")
+        neighbour = read_labels(polymesh_path, "neighbour")
+        n_faces, n_internal_faces = len(owner), len(neighbour)
+        n_cells = int(max(owner.max(initial=-1), neighbour.max(initial=-1))) + 1
+
+    bounding_box = ((0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+    if len(points):
+        bounding_box = (tuple(points.min(axis=0).tolist()), tuple(points.max(axis=0).tolist()))
+
+    return MeshStats(
+        n_points=len(points),
+        n_faces=n_faces,
+        n_internal_faces=n_internal_faces,
+        n_cells=n_cells,
+        bounding_box=bounding_box,
+        patch_sizes={name: patch.get("nFaces", 0) for name, patch in patches.items()},
+        patch_types={name: patch.get("type", "") for name, patch in patches.items()},
+    )
@@ -0,0 +1,138 @@
+import re
+import os
+import json
+import difflib
+
+import config
+import qa_modules
+import foam_payload
+
+"""
+Compact case file context for LLM prompts.
+Case files are shortened before they are put in a prompt (banner and comments removed, FoamFile header reduced to
+class and object, large nonuniform List payloads replaced by their size and range), ranked by relevance to the
+error, and added to the prompt until the token budget of the call is used.
+"""
+
+_BANNER_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+_LINE_COMMENT = re.compile(r'(?m)(^|[ \t])//.*$')
+_FOAMFILE_HEADER = re.compile(r'FoamFile\s*\{[^{}]*\}')
+_HEADER_ENTRY = re.compile(r'\b(class|object)\s+([^;]+);')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_TRAILING_SPACES = re.compile(r'[ \t]+\n')
+# Summaries of elided list payloads, from foam_payload.compact_text() or read_compact(), kept when comments are removed
+_PAYLOAD_COMMENT = re.compile(r'\(/\* ([^*]*) \*/\)')
+_WORD = re.compile(r'[A-Za-z_][\w.]*')
+
+def compact_foam_file(content, max_values=20):
+    """Shorten an OpenFOAM dictionary or field file for a prompt without changing its entries
+    Args:
+        content (str): File content
+        max_values (int): nonuniform Lists longer than this are elided
+    Returns:
+        compact (str): Content without banner, comments and long list payloads
+    """
+    content = foam_payload.compact_text(content, max_values)
+    # Comments are removed after the lists, the payload summaries are put back below
+    content = _PAYLOAD_COMMENT.sub(r"(<<\1>>)", content)
+    content = _BANNER_COMMENT.sub("", content)
+    content = _LINE_COMMENT.sub(r"\1", content)
+    header = _FOAMFILE_HEADER.search(content)
+    if header is not None:
+        entries = " ".join(f"{key} {value.strip()};" for key, value in _HEADER_ENTRY.findall(header.group()))
+        content = content[:header.start()] + f"FoamFile {{ {entries} }}" + content[header.end():]
+    content = content.replace("(<<", "(/* ").replace(">>)", " */)")
+    content = _TRAILING_SPACES.sub("\n", content)
+    return _BLANK_LINES.sub("\n", content).strip() + "\n"
+
+def count_tokens(text):
+    return qa_modules.estimate_tokens(text, "gpt-4")
+
+def rank_files(files, query):
+    """Order case files by relevance to an error message or file name
+    Args:
+        files (dict): key is relative path, value is content
+        query (str): Error message, or name of the file the prompt is about
+    Returns:
+        names (list): Relative paths, most relevant first
+    """
+    query_words = set(_WORD.findall(query))
+    def score(rel_path):
+        name = os.path.basename(rel_path)
+        value = 0.0
+        if rel_path in query:
+            value += 100.0
+        elif name in query_words:
+            value += 50.0
+        # Dictionaries named in the error, e.g. 'in dictionary "system/fvSolution/solvers"'
+        value += 5.0 * sum(1 for word in query_words if word.startswith(rel_path + "/"))
+        file_words = set(_WORD.findall(files[rel_path]))
+        value += len(query_words & file_words) / (1.0 + len(query_words)) * 10.0
+        return value
+    return sorted(files, key=lambda rel_path: (-score(rel_path), rel_path))
+
+def build_case_context(files, query, budget_tokens=None, max_values=20):
+    """JSON string of compacted case files, most relevant first, within a token budget
+    Args:
+        files (dict): key is relative path, value is content
+        query (str): Error message or file name used to rank the files
+        budget_tokens (int): Tokens available for the files, defaults to run_config.prompt_token_budget
+        max_values (int): nonuniform Lists longer than this are elided
+    Returns:
+        context (str): JSON object of relative path -> compacted content; files left out for lack of budget are listed
+            under "omitted_files"
+    """
+    if budget_tokens is None:
+        budget_tokens = config.run_cfg.prompt_token_budget
+    selected = {}
+    omitted = []
+    used = 0
+    for rel_path in rank_files(files, query):
+        compact = compact_foam_file(files[rel_path], max_values)
+        tokens = count_tokens(compact) + 8
+        if used + tokens > budget_tokens:
+            remaining = budget_tokens - used
+            if not selected and remaining > 200:
+                # The most relevant file is always given, cut to the budget
+                selected[rel_path] = truncate_to_tokens(compact, remaining - 20)
+                used = budget_tokens
+            else:
+                omitted.append(rel_path)
+            continue
+        selected[rel_path] = compact
+        used += tokens
+    if omitted:
+        selected["omitted_files"] = omitted
+    return json.dumps(selected, ensure_ascii=False, indent=2)
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to at most max_tokens tokens"""
+    encoding = qa_modules.get_encoding("gpt-4")
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]) + "\n... (truncated)"
+
+def case_context(case_path, query, budget_tokens=None):
+    """build_case_context() of the 0/, constant/ and system/ files of a case"""
+    files = {}
+    for dir_name in ["0", "constant", "system"]:
+        dir_path = os.path.join(case_path, dir_name)
+        if not os.path.isdir(dir_path):
+            continue
+        for entry in sorted(os.listdir(dir_path)):
+            path = os.path.join(dir_path, entry)
+            if os.path.isfile(path):
+                try:
+                    # Streamed, so that fields written on large meshes are never fully loaded
+                    files[f"{dir_name}/{entry}"] = foam_payload.read_compact(path)[0]
+                except Exception as e:
+                    print(f"Unable to read file {path}: {str(e)}")
+    return build_case_context(files, query, budget_tokens)
+
+def file_change_context(file_name, original, modified, context_lines=3):
+    """Compact unified diff of a file change, used instead of the full original and modified contents"""
+    diff = difflib.unified_diff(compact_foam_file(original).splitlines(keepends=True),
+                                compact_foam_file(modified).splitlines(keepends=True),
+                                fromfile=f"original/{file_name}", tofile=f"modified/{file_name}", n=context_lines)
+    return "".join(diff) or "(no change)\n"
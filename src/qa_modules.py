@@ -1,18 +1,407 @@
-from openai import OpenAI
 import os
+import sys
+import time
+import random
 import config
 from datetime import datetime
-import tiktoken
 import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
 
-def estimate_tokens(text: str, model_name: str) -> int:
-    """Estimate token count using tiktoken"""
+import log_writer
+import model_router
+import stream_json
+import tracing
+
+# openai and tiktoken are imported on first use to keep the pipeline import fast
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str):
+    """Return the tiktoken encoding of a model, cached per process"""
+    import tiktoken
     try:
-        encoding = tiktoken.encoding_for_model(model_name)
+        return tiktoken.encoding_for_model(model_name)
     except KeyError:
         # If model is not recognized, default to cl100k_base (GPT-4 encoding)
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(text))
+        return tiktoken.get_encoding("cl100k_base")
+
+def estimate_tokens(text: str, model_name: str) -> int:
+    """Estimate token count using tiktoken"""
+    return len(get_encoding(model_name).encode(text))
+
+def usage_from_response(usage, prompt_text="", completion_text="", reasoning_text="", model_name="cl100k_base"):
+    """Token counts of a call, from the usage reported by the provider when present, estimated otherwise
+    Args:
+        usage (object): `usage` of the OpenAI-compatible response (last chunk of a stream with include_usage), or None
+        prompt_text, completion_text, reasoning_text (str): Used only when usage is None
+        model_name (str): Model whose encoding is used for the estimate
+    Returns:
+        tokens (dict): prompt_tokens, completion_tokens (answer only), reasoning_tokens, cache_hit_tokens, usage_source
+    """
+    if usage is None:
+        return {
+            "prompt_tokens": estimate_tokens(prompt_text, model_name),
+            "completion_tokens": estimate_tokens(completion_text, model_name),
+            "reasoning_tokens": estimate_tokens(reasoning_text, model_name) if reasoning_text else 0,
+            "cache_hit_tokens": 0,
+            "usage_source": "estimate",
+        }
+    details = getattr(usage, "completion_tokens_details", None)
+    reasoning_tokens = (getattr(details, "reasoning_tokens", None) or 0) if details is not None else 0
+    # DeepSeek reports prompt cache hits outside of the OpenAI schema
+    extra = getattr(usage, "model_extra", None) or {}
+    cache_hit_tokens = extra.get("prompt_cache_hit_tokens")
+    if cache_hit_tokens is None:
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        cache_hit_tokens = getattr(prompt_details, "cached_tokens", 0) if prompt_details is not None else 0
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        # Reasoning tokens are part of the reported completion tokens
+        "completion_tokens": usage.completion_tokens - reasoning_tokens,
+        "reasoning_tokens": reasoning_tokens,
+        "cache_hit_tokens": cache_hit_tokens or 0,
+        "usage_source": "provider",
+    }
+
+_llm_stage = contextvars.ContextVar("chatcfd_llm_stage", default=None)
+
+@contextmanager
+def llm_stage(name):
+    """Name the LLM calls made inside the block for the usage statistics, e.g. `with qa_modules.llm_stage("reflection"):`"""
+    token = _llm_stage.set(name)
+    try:
+        yield
+    finally:
+        _llm_stage.reset(token)
+
+def _current_stage():
+    """Explicit stage if set, otherwise the function that called ask()"""
+    stage = _llm_stage.get()
+    if stage:
+        return stage
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else ""
+
+def _price(model_type):
+    """USD per million input, cache hit and output tokens of a model type"""
+    if model_type == "deepseek-r1":
+        return config.llm_cfg.R1_input_price, config.llm_cfg.R1_cache_hit_price, config.llm_cfg.R1_output_price
+    return config.llm_cfg.V3_input_price, config.llm_cfg.V3_cache_hit_price, config.llm_cfg.V3_output_price
+
+class LLMUnavailableError(RuntimeError):
+    """Raised without calling the provider while its circuit breaker is open"""
+
+class TokenBucket:
+    """Rate limiter of the calls to one provider, slowed down when the provider answers 429 and sped up again on success"""
+    def __init__(self, requests_per_minute, burst):
+        """
+        Args:
+            requests_per_minute (float): Sustained rate, 0 for no limit
+            burst (int): Calls that can be made at once after an idle period
+        """
+        self.max_rate = requests_per_minute / 60.0
+        self.rate = self.max_rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call may be made"""
+        if self.max_rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_rate_limited(self):
+        """Halve the rate after a 429, down to one call per minute"""
+        with self._lock:
+            self.rate = max(self.rate / 2.0, min(self.max_rate, 1.0 / 60.0))
+            self.tokens = 0.0
+
+    def on_success(self):
+        """Recover 5% of the configured rate per successful call"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.05 * self.max_rate)
+
+class CircuitBreaker:
+    """Stops calling a provider after consecutive failures, then lets one trial call through after a cooldown"""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold, cooldown):
+        """
+        Args:
+            failure_threshold (int): Consecutive failed attempts that open the circuit, 0 to never open it
+            cooldown (float): Seconds the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self, provider):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.OPEN or (self.state == self.HALF_OPEN and self._trial_running):
+                remaining = max(self.cooldown - (time.monotonic() - self._opened_at), 0.0)
+                raise LLMUnavailableError(f"{provider} failed {self.failures} times in a row, "
+                                          f"circuit open for another {remaining:.0f} s")
+            if self.state == self.HALF_OPEN:
+                self._trial_running = True
+
+    def on_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def release(self):
+        """End a call that says nothing about the health of the provider, leaving the state unchanged"""
+        with self._lock:
+            self._trial_running = False
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or (self.failure_threshold and self.failures >= self.failure_threshold):
+                if self.state != self.OPEN:
+                    print(f"Opening LLM circuit after {self.failures} consecutive failures, cooldown {self.cooldown:.0f} s")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+# Per provider limiters and breakers and the process wide call semaphore, shared by all jobs
+_providers = {}
+_providers_lock = threading.Lock()
+_call_slots = None
+
+def _provider_guards(provider):
+    """TokenBucket and CircuitBreaker of a provider (its base URL), created on first use"""
+    global _call_slots
+    with _providers_lock:
+        if _call_slots is None:
+            _call_slots = threading.BoundedSemaphore(max(config.llm_cfg.llm_max_concurrent_calls, 1))
+        if provider not in _providers:
+            _providers[provider] = (TokenBucket(config.llm_cfg.llm_requests_per_minute, config.llm_cfg.llm_burst),
+                                    CircuitBreaker(config.llm_cfg.llm_circuit_failure_threshold, config.llm_cfg.llm_circuit_cooldown))
+        return _providers[provider]
+
+# Exceptions of the openai package that are worth retrying, matched by name so that openai is not imported here
+_TRANSIENT_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError", "Timeout"}
+
+def _classify_error(error):
+    """Whether a failed call is retried
+    Returns:
+        transient (bool): 429, 5xx, timeouts and connection errors
+        rate_limited (bool): 429
+        retry_after (float): Delay requested by the provider in seconds, or None
+    """
+    status = getattr(error, "status_code", None)
+    rate_limited = status == 429 or type(error).__name__ == "RateLimitError"
+    transient = (rate_limited or (status is not None and status >= 500)
+                 or type(error).__name__ in _TRANSIENT_ERRORS or isinstance(error, (TimeoutError, ConnectionError)))
+    retry_after = None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return transient, rate_limited, retry_after
+
+def is_rejected_request(error):
+    """Whether the provider rejected the request itself (401, 400 context length, ...), which fails the same way when repeated"""
+    return getattr(error, "status_code", None) is not None and not _classify_error(error)[0]
+
+def call_with_resilience(provider, request, *args, max_retries=None, **kwargs):
+    """Call request(*args, **kwargs) under the rate limit, concurrency limit and circuit breaker of a provider, retrying
+    429, 5xx, timeouts and connection errors with exponential backoff and full jitter
+    Args:
+        provider (str): Key of the limits, the base URL of the endpoint
+        request (callable): Makes one complete LLM call
+        max_retries (int): Retries of transient errors, defaults to llm_config.llm_max_retries
+    Returns:
+        result: Return value of request
+    Raises:
+        LLMUnavailableError: If the circuit of the provider is open
+        Exception: Error of the last attempt, or the first non transient error
+    """
+    bucket, breaker = _provider_guards(provider)
+    max_retries = max(config.llm_cfg.llm_max_retries if max_retries is None else max_retries, 0)
+    for attempt in range(max_retries + 1):
+        breaker.before_call(provider)
+        bucket.acquire()
+        try:
+            with _call_slots:
+                result = request(*args, **kwargs)
+        except Exception as e:
+            transient, rate_limited, retry_after = _classify_error(e)
+            if not transient:
+                # Bad requests say nothing about the health of the provider
+                breaker.release()
+                raise
+            if rate_limited:
+                # The provider is up but throttled, a half-open circuit lets the next call through as its trial
+                bucket.on_rate_limited()
+                breaker.release()
+            else:
+                breaker.on_failure()
+            if attempt == max_retries:
+                raise
+            backoff = min(config.llm_cfg.llm_backoff_max, config.llm_cfg.llm_backoff_base * 2 ** attempt)
+            delay = max(retry_after or 0.0, random.uniform(0.0, backoff))
+            print(f"LLM call to {provider} failed ({type(e).__name__}: {e}), retry {attempt + 1}/{max_retries} in {delay:.1f} s")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            breaker.release()
+            raise
+        breaker.on_success()
+        bucket.on_success()
+        return result
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """Router of the chat (V3) and reasoner (R1) backends: the configured DeepSeek endpoints first, then llm_config.llm_backends"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            backends = [
+                model_router.Backend("deepseek-v3", model_router.CHAT, os.environ.get("DEEPSEEK_V3_BASE_URL"),
+                                     os.environ.get("DEEPSEEK_V3_MODEL_NAME"), os.environ.get("DEEPSEEK_V3_KEY")),
+                model_router.Backend("deepseek-r1", model_router.REASONER, os.environ.get("DEEPSEEK_R1_BASE_URL"),
+                                     os.environ.get("DEEPSEEK_R1_MODEL_NAME"), os.environ.get("DEEPSEEK_R1_KEY")),
+            ]
+            backends += [model_router.Backend.from_dict(entry) for entry in config.llm_cfg.llm_backends]
+            _router = model_router.ModelRouter(backends, max_error_rate=config.llm_cfg.llm_router_max_error_rate,
+                                               cooldown=config.llm_cfg.llm_router_cooldown,
+                                               slow_factor=config.llm_cfg.llm_router_slow_factor)
+        return _router
+
+def _should_fail_over(error):
+    """Open circuits and transient errors left after the retries mark a backend unhealthy, rejected requests do not"""
+    return isinstance(error, LLMUnavailableError) or _classify_error(error)[0]
+
+def routed_call(role, request, messages, watcher=None):
+    """Call request(backend, messages, watcher) on the backends of a role, retrying transient errors and failing over to
+    the next backend when one keeps failing
+    Returns:
+        result (dict): Return value of request, with the name of the backend that answered under "backend"
+    """
+    def attempt(backend, fallbacks):
+        # Fail over after fewer retries while other backends are left
+        max_retries = min(config.llm_cfg.llm_max_retries, config.llm_cfg.llm_failover_retries) if fallbacks else None
+        return call_with_resilience(backend.base_url, request, backend, messages, watcher, max_retries=max_retries)
+    start = time.monotonic()
+    with tracing.span("llm_call", role=role, stage=_current_stage() if tracing.enabled() else "", streamed=watcher is not None) as span:
+        backend, result = get_router().call(role, attempt, should_fail_over=_should_fail_over)
+        span.set(backend=backend.name, prompt_tokens=result["prompt_tokens"], completion_tokens=result["completion_tokens"],
+                 reasoning_tokens=result.get("reasoning_tokens", 0), usage_source=result["usage_source"])
+    result["backend"] = backend.name
+    if config.llm_cfg.llm_record_path:
+        _record_call(role, backend, messages, result, time.monotonic() - start)
+    return result
+
+_replay_stores = {}
+_replay_stores_lock = threading.Lock()
+
+def _record_call(role, backend, messages, result, seconds):
+    """Store an answered call in the replay store of llm_config.llm_record_path, a failed write is only reported"""
+    import llm_replay
+    path = config.llm_cfg.llm_record_path
+    try:
+        with _replay_stores_lock:
+            if path not in _replay_stores:
+                _replay_stores[path] = llm_replay.ReplayStore(path)
+            store = _replay_stores[path]
+        store.record(messages, result.get("content", result.get("answer")), result.get("reasoning_content", ""), role,
+                     backend.model, result["prompt_tokens"], result["completion_tokens"], result.get("reasoning_tokens", 0),
+                     seconds)
+    except Exception as e:
+        print(f"Recording of the LLM call failed: {e}")
+
+def _read_stream(stream, watcher=None):
+    """Read a chat completion stream
+    Args:
+        stream: Stream returned by client.chat.completions.create(stream=True)
+        watcher (stream_json.StreamingJSONValidator): Fed the answer as it arrives, the stream is closed at its first
+            format error; after a valid object the rest is read only for the usage chunk
+    Returns:
+        content (str): Answer, up to the end of the object when a watcher is given
+        reasoning (str): Reasoning content, empty for chat models
+        usage (object): Usage of the last chunk, None when the stream was closed early or the provider did not send it
+    """
+    if watcher is not None:
+        watcher.reset()
+    full_content = []
+    reasoning_contents = []
+    usage = None
+    for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            if delta.content and not (watcher is not None and watcher.done):
+                full_content.append(delta.content)
+                if watcher is not None and watcher.feed(delta.content) and watcher.error is not None:
+                    # The answer cannot become valid, the question is asked again
+                    stream.close()
+                    break
+            if hasattr(delta, 'model_extra') and 'reasoning_content' in delta.model_extra:
+                reasoning_contents.append(str(delta.model_extra['reasoning_content']))
+    return "".join(full_content), "".join(reasoning_contents), usage
+
+def ask_json(qa, question, pydantic_object, max_attempts=3):
+    """Ask for a JSON object of a Pydantic model, validating the answer while it is streamed
+    The stream is closed at the first error that the rest of the answer cannot fix (no object, array instead of object,
+    mismatched brackets, invalid field value) and the question is asked again; once the object is closed the few
+    remaining chunks are only read for the token usage.
+    Args:
+        qa (object): QA interface whose ask() accepts a watcher
+        question (str): Prompt, including the format instructions of the model
+        pydantic_object (type): Pydantic model of the answer
+        max_attempts (int): Questions asked before giving up
+    Returns:
+        result (BaseModel): Validated answer
+    Raises:
+        stream_json.StructuredOutputError: If no attempt gave a valid object
+    """
+    watcher = stream_json.StreamingJSONValidator(pydantic_object)
+    for attempt in range(max_attempts):
+        # A failed attempt is removed from the history of a context QA, so that the next one does not resend the
+        # question and the broken answer
+        history = list(getattr(qa, "conversation_history", []))
+        try:
+            qa.ask(question, watcher=watcher)
+            return watcher.finish()
+        except BaseException as e:
+            if hasattr(qa, "conversation_history"):
+                qa.conversation_history = history
+            if not isinstance(e, stream_json.StructuredOutputError):
+                raise
+            print(f"Invalid structured answer (attempt {attempt + 1}/{max_attempts}): {e}")
+    raise stream_json.StructuredOutputError(f"No valid {pydantic_object.__name__} after {max_attempts} attempts: {watcher.error}")
 
 class GlobalLogManager:
     _instance = None
@@ -21,31 +410,64 @@ class GlobalLogManager:
         "deepseek-r1": {"calls": 0, "prompt_tokens": 0, "response_tokens": 0, "reasoning_tokens": 0}
     }
     
+    # (case_name, stage, model_type) -> calls, tokens and cost, stage being the pipeline function that called the LLM
+    usage_by_stage = {}
+
+    _lock = threading.Lock()    # Statistics are shared by all jobs of the process
+    
     @classmethod
     def add_log(cls, log_entry):
         # Only update statistics, do not save complete logs in memory
         model_type = log_entry["model_type"]
-        if model_type in cls.current_session_stats:
-            stats = cls.current_session_stats[model_type]
-            stats["calls"] += 1
-            stats["prompt_tokens"] += log_entry.get("prompt_tokens", 0)
-            stats["response_tokens"] += log_entry.get("response_tokens", 0)
-            if model_type == "deepseek-r1":
-                stats["reasoning_tokens"] += log_entry.get("reasoning_tokens", 0)
+        job = config.current_job()
+        log_entry.setdefault("stage", _current_stage())
+        log_entry.setdefault("case_name", job.case_name)
+        input_price, cache_hit_price, output_price = _price(model_type)
+        cache_hit_tokens = log_entry.get("cache_hit_tokens", 0)
+        log_entry["cost"] = ((log_entry.get("prompt_tokens", 0) - cache_hit_tokens) * input_price + cache_hit_tokens * cache_hit_price
+                             + (log_entry.get("response_tokens", 0) + log_entry.get("reasoning_tokens", 0)) * output_price) / 1e6
+        with cls._lock:
+            if model_type in cls.current_session_stats:
+                stats = cls.current_session_stats[model_type]
+                stats["calls"] += 1
+                stats["prompt_tokens"] += log_entry.get("prompt_tokens", 0)
+                stats["response_tokens"] += log_entry.get("response_tokens", 0)
+                if model_type == "deepseek-r1":
+                    stats["reasoning_tokens"] += log_entry.get("reasoning_tokens", 0)
+            key = (log_entry["case_name"], log_entry["stage"], model_type)
+            usage = cls.usage_by_stage.setdefault(key, {"calls": 0, "prompt_tokens": 0, "cache_hit_tokens": 0, "response_tokens": 0,
+                                                        "reasoning_tokens": 0, "estimated_calls": 0, "cost": 0.0})
+            usage["calls"] += 1
+            usage["estimated_calls"] += log_entry.get("usage_source") == "estimate"
+            for name in ("prompt_tokens", "cache_hit_tokens", "response_tokens", "reasoning_tokens", "cost"):
+                usage[name] += log_entry.get(name, 0)
         
-        # Write directly to file, do not save in memory
-        if config.case_log_write:
-            cls._append_log_to_file(log_entry)
+        # Write directly to file of the current job, do not save in memory
+        if job.case_log_write:
+            cls._append_log_to_file(log_entry, job.output_case_path)
     
     @classmethod
-    def _append_log_to_file(cls, log_entry):
-        """Append log to file, avoid memory accumulation"""
-        config.ensure_directory_exists(config.OUTPUT_PATH)
-        log_file_path = f'{config.OUTPUT_PATH}/qa_logs.jsonl'  # Use JSONL format
-        
-        with open(log_file_path, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False, indent=2) + '\n')
+    def _append_log_to_file(cls, log_entry, output_case_path):
+        """Queue the log for the background writer, one record per line in qa_logs.jsonl"""
+        log_writer.default_writer().write(f'{output_case_path}/qa_logs.jsonl', log_entry)
+
+    @classmethod
+    def flush(cls):
+        """Wait until all queued logs are written"""
+        log_writer.default_writer().flush()
     
+    @classmethod
+    def usage_summary(cls, case_name=None):
+        """Usage per stage and model, of one case or of all cases
+        Returns:
+            summary (list): Elements as {case_name, stage, model_type, calls, prompt_tokens, cache_hit_tokens,
+                response_tokens, reasoning_tokens, estimated_calls, cost}, most expensive first
+        """
+        with cls._lock:
+            rows = [{"case_name": key[0], "stage": key[1], "model_type": key[2], **usage}
+                    for key, usage in cls.usage_by_stage.items() if case_name is None or key[0] == case_name]
+        return sorted(rows, key=lambda row: (-row["cost"], -row["prompt_tokens"]))
+
     @classmethod
     def get_session_stats(cls):
         """Get current session statistics"""
@@ -57,6 +479,8 @@ class GlobalLogManager:
         for model_stats in cls.current_session_stats.values():
             for key in model_stats:
                 model_stats[key] = 0
+        with cls._lock:
+            cls.usage_by_stage.clear()
 
 class BaseQA_deepseek_V3:
     def __init__(self):
@@ -64,28 +488,47 @@ class BaseQA_deepseek_V3:
         self._initialized = True
 
     def _setup_qa_interface(self):
-        def get_deepseekV3_response(messages):
+        def get_deepseekV3_response(messages, watcher=None):
+            return routed_call(model_router.CHAT, request, messages, watcher)
+
+        def request(backend, messages, watcher=None):
+            from openai import OpenAI
+            # Retries are made by call_with_resilience, not by the client
             client = OpenAI(
-                api_key=os.environ.get("DEEPSEEK_V3_KEY"), 
-                base_url=os.environ.get("DEEPSEEK_V3_BASE_URL")
+                api_key=backend.api_key, 
+                base_url=backend.base_url,
+                timeout=config.llm_cfg.llm_timeout,
+                max_retries=0
             )
 
-            chat_completion = client.chat.completions.create(
-                messages=messages,
-                model=os.environ.get("DEEPSEEK_V3_MODEL_NAME"),
-                temperature=config.V3_temperature,
-                stream=False
-            )
+            temperature = min(max(config.V3_temperature + config.current_job().llm_temperature_offset, 0.0), 2.0)
+            if watcher is not None:
+                # Structured answers are streamed so that they can be validated and cut as they arrive
+                stream = client.chat.completions.create(messages=messages, model=backend.model, temperature=temperature,
+                                                        stream=True, stream_options={"include_usage": True})
+                content, _, usage = _read_stream(stream, watcher)
+            else:
+                chat_completion = client.chat.completions.create(
+                    messages=messages,
+                    model=backend.model,
+                    temperature=temperature,
+                    stream=False
+                )
+                content, usage = chat_completion.choices[0].message.content, chat_completion.usage
+            tokens = usage_from_response(usage, json.dumps(messages, ensure_ascii=False) if usage is None else "",
+                                         content or "")
             
             return {
-                "content": chat_completion.choices[0].message.content,
-                "prompt_tokens": chat_completion.usage.prompt_tokens,
-                "completion_tokens": chat_completion.usage.completion_tokens
+                "content": content,
+                "prompt_tokens": tokens["prompt_tokens"],
+                "completion_tokens": tokens["completion_tokens"],
+                "cache_hit_tokens": tokens["cache_hit_tokens"],
+                "usage_source": tokens["usage_source"],
             }
 
         return get_deepseekV3_response
 
-    def ask(self, question: str):
+    def ask(self, question: str, watcher=None):
         raise NotImplementedError
 
     def close(self):
@@ -96,9 +539,9 @@ class QA_Context_deepseek_V3(BaseQA_deepseek_V3):
         super().__init__()
         self.conversation_history: list[dict[str, str]] = []
 
-    def ask(self, question: str):
+    def ask(self, question: str, watcher=None):
         self.conversation_history.append({"role": "user", "content": question})
-        result = self.qa_interface(self.conversation_history.copy())
+        result = self.qa_interface(self.conversation_history.copy(), watcher)
         
         self.conversation_history.append({"role": "assistant", "content": result["content"]})
         
@@ -108,15 +551,18 @@ class QA_Context_deepseek_V3(BaseQA_deepseek_V3):
             "assistant_response": result["content"],
             "prompt_tokens": result["prompt_tokens"],
             "response_tokens": result["completion_tokens"],
+            "cache_hit_tokens": result["cache_hit_tokens"],
+            "usage_source": result["usage_source"],
+            "backend": result["backend"],
             "timestamp": datetime.now().isoformat()
         })
         
         return result["content"]
 
 class QA_NoContext_deepseek_V3(BaseQA_deepseek_V3):
-    def ask(self, question: str):
+    def ask(self, question: str, watcher=None):
         messages = [{"role": "user", "content": question}]
-        result = self.qa_interface(messages)
+        result = self.qa_interface(messages, watcher)
         
         GlobalLogManager.add_log({
             "model_type": "deepseek-v3",
@@ -124,6 +570,9 @@ class QA_NoContext_deepseek_V3(BaseQA_deepseek_V3):
             "assistant_response": result["content"],
             "prompt_tokens": result["prompt_tokens"],
             "response_tokens": result["completion_tokens"],
+            "cache_hit_tokens": result["cache_hit_tokens"],
+            "usage_source": result["usage_source"],
+            "backend": result["backend"],
             "timestamp": datetime.now().isoformat()
         })
         
@@ -133,59 +582,50 @@ class BaseQA_deepseek_R1:
     def __init__(self):
         self.qa_interface = self._setup_qa_interface()
         self._initialized = True
-        self.encoding = tiktoken.get_encoding("cl100k_base")
 
     def _setup_qa_interface(self):
 
-        def get_response(messages):
+        def get_response(messages, watcher=None):
+            return routed_call(model_router.REASONER, request, messages, watcher)
+
+        def request(backend, messages, watcher=None):
             # R1 应该使用 R1 的 KEY 和 BASE_URL
+            from openai import OpenAI
+            # The stream is read completely inside the call, so that a failed stream is retried as a whole
             client = OpenAI(
-                api_key=os.environ.get("DEEPSEEK_R1_KEY"),
-                base_url=os.environ.get("DEEPSEEK_R1_BASE_URL")
+                api_key=backend.api_key,
+                base_url=backend.base_url,
+                timeout=config.llm_cfg.llm_timeout,
+                max_retries=0
             )
 
             # Get model name for token estimation
-            model_name = os.environ.get("DEEPSEEK_R1_MODEL_NAME")
+            model_name = backend.model
             
-            # ===== Stream request to get content =====
+            # ===== Stream request to get content, the last chunk carries the token usage =====
             stream = client.chat.completions.create(
                 messages=messages,
                 model=model_name,
-                temperature=config.R1_temperature,
-                stream=True
+                temperature=min(max(config.R1_temperature + config.current_job().llm_temperature_offset, 0.0), 2.0),
+                stream=True,
+                stream_options={"include_usage": True}
             )
 
-            full_content = []
-            reasoning_contents = []
-            
-            for chunk in stream:
-                if chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        full_content.append(delta.content)
-                    if hasattr(delta, 'model_extra') and 'reasoning_content' in delta.model_extra:
-                        reasoning_contents.append(str(delta.model_extra['reasoning_content']))
-
-            # ===== Estimate token usage =====
-            # Estimate prompt tokens (serialize messages to string)
-            prompt_str = json.dumps(messages, ensure_ascii=False)
-            prompt_tokens = estimate_tokens(prompt_str, model_name)
-            
-            # Estimate completion tokens (actual returned content)
-            completion_str = "".join(full_content)
-            completion_tokens = estimate_tokens(completion_str, model_name)
+            completion_str, reasoning_str, usage = _read_stream(stream, watcher)
+            # Prompts are only serialized and encoded when the provider did not report the usage
+            tokens = usage_from_response(usage, json.dumps(messages, ensure_ascii=False) if usage is None else "",
+                                         completion_str, reasoning_str, model_name)
 
             return {
-                "reasoning_content": "".join(reasoning_contents),
+                "reasoning_content": reasoning_str,
                 "answer": completion_str,
-                "prompt_tokens": prompt_tokens,
-                "completion_tokens": completion_tokens
+                **tokens,
             }
 
 
         return get_response
 
-    def ask(self, question: str):
+    def ask(self, question: str, watcher=None):
         raise NotImplementedError
 
     def close(self):
@@ -199,14 +639,12 @@ class QA_Context_deepseek_R1(BaseQA_deepseek_R1):
         else:
             self.conversation_history: list[dict[str, str]] = []
 
-    def ask(self, question: str):
+    def ask(self, question: str, watcher=None):
         self.conversation_history.append({"role": "user", "content": question})
-        result = self.qa_interface(self.conversation_history.copy())
+        result = self.qa_interface(self.conversation_history.copy(), watcher)
         
         self.conversation_history.append({"role": "assistant", "content": result["answer"]})
         
-        reasoning_tokens = len(self.encoding.encode(result["reasoning_content"]))
-        
         GlobalLogManager.add_log({
             "model_type": "deepseek-r1",
             "user_prompt": question,
@@ -214,18 +652,19 @@ class QA_Context_deepseek_R1(BaseQA_deepseek_R1):
             "reasoning_content": result["reasoning_content"],
             "prompt_tokens": result["prompt_tokens"],
             "response_tokens": result["completion_tokens"],
-            "reasoning_tokens": reasoning_tokens,
+            "reasoning_tokens": result["reasoning_tokens"],
+            "cache_hit_tokens": result["cache_hit_tokens"],
+            "usage_source": result["usage_source"],
+            "backend": result["backend"],
             "timestamp": datetime.now().isoformat()
         })
         
         return result["answer"]
 
 class QA_NoContext_deepseek_R1(BaseQA_deepseek_R1):
-    def ask(self, question: str):
+    def ask(self, question: str, watcher=None):
         messages = [{"role": "user", "content": question}]
-        result = self.qa_interface(messages)
-        
-        reasoning_tokens = len(self.encoding.encode(result["reasoning_content"]))
+        result = self.qa_interface(messages, watcher)
         
         GlobalLogManager.add_log({
             "model_type": "deepseek-r1",
@@ -234,7 +673,10 @@ class QA_NoContext_deepseek_R1(BaseQA_deepseek_R1):
             "reasoning_content": result["reasoning_content"],
             "prompt_tokens": result["prompt_tokens"],
             "response_tokens": result["completion_tokens"],
-            "reasoning_tokens": reasoning_tokens,
+            "reasoning_tokens": result["reasoning_tokens"],
+            "cache_hit_tokens": result["cache_hit_tokens"],
+            "usage_source": result["usage_source"],
+            "backend": result["backend"],
             "timestamp": datetime.now().isoformat()
         })
         
@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+import config
+
+"""
+Persistent reflection memory shared by all jobs and runs.
+Reflections are stored in SQLite with the signature of the error they were written for (the error text without
+numbers, paths and line numbers), the solver, the files involved and an embedding of the error. A reflection that
+was followed by a different error or a successful run is marked as solved, and is reused for the same error
+signature instead of asking the reasoning model again.
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reflections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    signature TEXT NOT NULL,
+    solver TEXT NOT NULL DEFAULT '',
+    files TEXT NOT NULL DEFAULT '[]',
+    case_name TEXT NOT NULL DEFAULT '',
+    running_error TEXT NOT NULL,
+    reflection TEXT NOT NULL,
+    embedder TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    solved INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reflections_signature ON reflections (signature, solver, solved);
+CREATE INDEX IF NOT EXISTS reflections_solver ON reflections (solver, embedder);
+CREATE INDEX IF NOT EXISTS reflections_eviction ON reflections (solved, last_used);
+"""
+
+_HASHING_DIM = 512
+
+# Parts of an OpenFOAM error that change between runs of the same problem
+_VOLATILE = [
+    (re.compile(r'(?m)^\s*(From|in file|at line)\b.*$'), ''),
+    (re.compile(r'(/[\w.\-]+)+'), ' PATH '),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), ' ADDR '),
+    (re.compile(r'[-+]?\d+(\.\d*)?([eE][-+]?\d+)?'), ' N '),
+    (re.compile(r'\s+'), ' '),
+]
+
+def normalize_error(running_error):
+    """Error text without the values that differ between occurrences of the same error"""
+    text = str(running_error)
+    for pattern, replacement in _VOLATILE:
+        text = pattern.sub(replacement, text)
+    return text.strip().lower()
+
+def error_signature(running_error):
+    """Short stable identifier of an error, equal for errors that only differ in numbers, paths or line numbers"""
+    return hashlib.sha1(normalize_error(running_error).encode('utf-8')).hexdigest()[:16]
+
+def _hashing_embedding(texts):
+    """Character trigram counts hashed into a fixed size vector, no model required"""
+    vectors = np.zeros((len(texts), _HASHING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        padded = f"  {normalize_error(text)} "
+        for i in range(len(padded) - 2):
+            h = zlib.crc32(padded[i:i + 3].encode('utf-8'))
+            vectors[row, h % _HASHING_DIM] += 1.0 if h & 0x80000000 else -1.0
+    return vectors
+
+def embed(texts, embedder=None):
+    """Embed error texts
+    Args:
+        texts (list): Error texts
+        embedder (str): "hashing" or "sentence_transformer", defaults to run_config.reflection_embedder
+    Returns:
+        embedder_name (str): Name stored with the vectors, only vectors of the same embedder are compared
+        vectors (numpy.ndarray): (len(texts), dim) float32, L2 normalized
+    """
+    embedder = embedder or config.run_cfg.reflection_embedder
+    if embedder == "sentence_transformer":
+        # Same model as the case description retrieval, loaded once per process
+        import pdf_chunk_ask_question
+        model_name = config.sentence_transformer_path
+        if not os.path.exists(model_name):
+            model_name = 'sentence-transformers/all-mpnet-base-v2'
+        model = pdf_chunk_ask_question.load_embedder(model_name)
+        vectors = np.asarray(model.encode([normalize_error(text) for text in texts]), dtype=np.float32)
+        embedder_name = f"sentence_transformer:{os.path.basename(model_name.rstrip('/'))}"
+    else:
+        vectors = _hashing_embedding(texts)
+        embedder_name = f"hashing:{_HASHING_DIM}"
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return embedder_name, vectors / np.maximum(norms, 1e-12)
+
+@contextmanager
+def connect(path):
+    """SQLite connection committed and closed on exit, one per operation so that a store can be used from any thread"""
+    connection = sqlite3.connect(path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+class ReflectionStore:
+    """SQLite store of reflections, safe to use from several threads and processes"""
+    def __init__(self, path, max_entries=5000):
+        """
+        Args:
+            path (str): SQLite database file
+            max_entries (int): Number of reflections kept, the least recently used unsolved ones are evicted first
+        """
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        return connect(self.path)
+
+    @staticmethod
+    def _record(row, similarity=None):
+        record = {
+            "id": row["id"],
+            "running_error": row["running_error"],
+            "reflection_result": row["reflection"],
+            "solver": row["solver"],
+            "files": json.loads(row["files"]),
+            "case_name": row["case_name"],
+            "solved": bool(row["solved"]),
+            "hits": row["hits"],
+        }
+        if similarity is not None:
+            record["similarity"] = similarity
+        return record
+
+    def add(self, running_error, reflection, solver="", files=(), case_name=""):
+        """Store a reflection
+        Args:
+            running_error (str): Error the reflection was written for
+            reflection (str): Reflection text
+            solver (str): Case solver
+            files (list): Case files involved in the failed corrections
+            case_name (str): Case the reflection comes from
+        Returns:
+            reflection_id (int): Identifier for mark_solved()
+        """
+        embedder_name, vectors = embed([running_error])
+        now = time.time()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "INSERT INTO reflections (signature, solver, files, case_name, running_error, reflection, embedder, embedding, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (error_signature(running_error), solver or "", json.dumps(sorted(files)), case_name, running_error, reflection,
+                 embedder_name, vectors[0].tobytes(), now, now))
+            reflection_id = cursor.lastrowid
+            self._evict(connection)
+        return reflection_id
+
+    def _evict(self, connection):
+        count = connection.execute("SELECT COUNT(*) FROM reflections").fetchone()[0]
+        if count > self.max_entries:
+            connection.execute(
+                "DELETE FROM reflections WHERE id IN (SELECT id FROM reflections ORDER BY solved ASC, last_used ASC LIMIT ?)",
+                (count - self.max_entries,))
+
+    def mark_solved(self, reflection_ids):
+        """Record that the error changed or the case ran after these reflections were used"""
+        reflection_ids = list(reflection_ids)
+        if not reflection_ids:
+            return
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE reflections SET solved = 1, hits = hits + 1, last_used = ? WHERE id = ?",
+                [(time.time(), reflection_id) for reflection_id in reflection_ids])
+
+    def find_solved(self, running_error, solver=""):
+        """Most used solved reflection with the same error signature and solver, or None"""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM reflections WHERE signature = ? AND solver = ? AND solved = 1 ORDER BY hits DESC, last_used DESC LIMIT 1",
+                (error_signature(running_error), solver or "")).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE reflections SET last_used = ? WHERE id = ?", (time.time(), row["id"]))
+        return self._record(row)
+
+    def query(self, running_error, solver=None, k=3, min_similarity=0.0, exclude_ids=()):
+        """Nearest reflections to an error
+        Args:
+            running_error (str): Error to find reflections for
+            solver (str): Only reflections of this solver, None for all
+            k (int): Maximum number of reflections
+            min_similarity (float): Cosine similarity below which reflections are ignored
+            exclude_ids (list): Reflections already in the context
+        Returns:
+            records (list): Most similar first, elements as {id, running_error, reflection_result, similarity, ...}
+        """
+        embedder_name, vectors = embed([running_error])
+        sql, params = "SELECT * FROM reflections WHERE embedder = ?", [embedder_name]
+        if solver is not None:
+            sql += " AND solver = ?"
+            params.append(solver)
+        with self._connect() as connection:
+            rows = [row for row in connection.execute(sql, params) if row["id"] not in set(exclude_ids)]
+        if not rows:
+            return []
+        matrix = np.frombuffer(b"".join(row["embedding"] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        similarities = matrix @ vectors[0]
+        # Solved reflections first among equally similar ones
+        order = sorted(range(len(rows)), key=lambda i: (-round(float(similarities[i]), 3), -rows[i]["solved"]))
+        return [self._record(rows[i], float(similarities[i])) for i in order[:k] if similarities[i] >= min_similarity]
+
+    def __len__(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM reflections").fetchone()[0]
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def default_store():
+    """Store of the ChatCFD database directory, shared by all jobs of the process; None when disabled"""
+    if not config.run_cfg.reflection_store:
+        return None
+    path = os.path.join(config.path_cfg.database_dir, "reflections.sqlite")
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ReflectionStore(path, config.run_cfg.reflection_store_max_entries)
+        return _stores[path]
@@ -2,6 +2,9 @@ import subprocess
 from PyFoam.RunDictionary.ParsedParameterFile import ParsedParameterFile
 
 import config
+import foam_log
+import tracing
+import convergence_monitor
 
 """
 May be removed later
@@ -16,9 +19,10 @@ def convert_mesh(case_path, grid_path):
             case_path,
             grid_path
         ]
-        subprocess.run(command, check=True)
+        with tracing.span("subprocess", command="fluentMeshToFoam", mesh=grid_path):
+            subprocess.run(command, check=True, env=config.openfoam_env())
         print("Mesh conversion completed successfully")
-        config.mesh_convert_success = True
+        config.current_job().mesh_convert_success = True
         return True
     except subprocess.CalledProcessError as e:
         print(f"Mesh conversion failed: {e}")
@@ -65,7 +69,7 @@ def setup_cfl_control(case_path, max_co=0.6):
         
         # Save modifications
         control_dict.writeFile()
-        config.set_controlDict_time = True
+        config.current_job().set_controlDict_time = True
         print("Successfully configured CFL control parameters")
         return True
     except Exception as e:
@@ -94,7 +98,14 @@ def setup_cfl_control_2(case_path, max_co=0.6):
         print(f"Failed to modify controlDict: {e}")
         return False
 
-def case_run(case_path):
+def case_run(case_path, monitor=None):
+    """Run the solver of a case
+    Args:
+        case_path (str): OpenFOAM case directory
+        monitor: Stops the run early (see convergence_monitor), defaults to the convergence monitor for steady solvers
+    Returns:
+        "case run success." or the solver error output
+    """
     solver = ""
     try:
         control_dict_path = f'{case_path}/system/controlDict'
@@ -115,26 +126,66 @@ def case_run(case_path):
         return False
 
     running_log = f'{case_path}/case_run.log'
+    job = config.current_job()
+
+    # Steady runs are stopped once converged or stagnated instead of always going to endTime
+    original_control_dict = None
+    if monitor is None and config.run_cfg.early_stopping and solver in config.steady_solvers:
+        monitor = convergence_monitor.ConvergenceMonitor(
+            residual_tolerance=config.run_cfg.residual_tolerance,
+            min_iterations=config.run_cfg.convergence_min_iterations,
+            plateau_window=config.run_cfg.plateau_window,
+            plateau_decades=config.run_cfg.plateau_decades,
+        )
+    if monitor is not None:
+        original_control_dict = convergence_monitor.set_control_dict_entry(control_dict_path, "runTimeModifiable", "true")
 
     command = f'{solver} -case {case_path} > {running_log}'
     # command = f'ls'
-    output = subprocess.run(
+    process = subprocess.Popen(
         command,
         shell=True,
         executable="/usr/bin/bash",
         text=True,
-        capture_output=True  # get stdout and stderr
+        stdout=subprocess.PIPE,  # get stdout and stderr
+        stderr=subprocess.PIPE,
+        env=config.openfoam_env(),
+        start_new_session=True  # Lets a timed out solver be killed with its shell
         )
-    
-    run_case_error = output.stderr
-    run_case_output = output.stdout
-    
-    if output.returncode != 0: # Check if command execution resulted in an error
-        print("Program error! Error message:", output.stderr)
-        return output.stderr
+    span = tracing.start_span("subprocess", command=solver, case_path=case_path, monitor=type(monitor).__name__ if monitor else "")
+    residual_log = foam_log.ResidualLog(running_log)
+    try:
+        run_case_output, run_case_error = convergence_monitor.communicate_with_monitor(
+            process, residual_log, monitor, control_dict_path, poll_interval=config.run_cfg.convergence_poll_interval,
+            timeout=config.run_cfg.solver_timeout or None)
+    finally:
+        span.set(returncode=process.returncode, time_steps=residual_log.n_rows,
+                 convergence_status=monitor.status if monitor is not None else "")
+        span.end()
+        if original_control_dict is not None:
+            # Undo runTimeModifiable and stopAt writeNow, a later rerun must go to endTime again
+            with open(control_dict_path, 'w') as f:
+                f.write(original_control_dict)
+
+    # Residual history of this run, saved next to the log so later analysis does not parse it again
+    job.residual_log = residual_log
+    job.convergence_status = monitor.status if monitor is not None else ""
+    try:
+        residual_log.save(f'{case_path}/case_run.residuals.npz')
+    except OSError as e:
+        print(f"Failed to save residual history: {e}")
+    last_residuals = {name: value for name, value in residual_log.last().items() if name.endswith("_initial")}
+    print(f"Solver log: {residual_log.n_rows} time steps, last initial residuals {last_residuals}")
+    job.convergence_message = ""
+    if job.convergence_status == convergence_monitor.STAGNATED:
+        job.convergence_message = f"The steady solver {solver} ran without error but did not converge, {monitor.reason}"
+
+    if process.returncode != 0: # Check if command execution resulted in an error
+        print("Program error! Error message:", run_case_error)
+        return run_case_error
     else:
-        print("Program ran successfully, output:", output.stdout)
-        config.flag_case_success_run = True
+        print("Program ran successfully, output:", run_case_output)
+        job.flag_case_success_run = True
         return "case run success."
 
 
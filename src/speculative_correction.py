@@ -0,0 +1,114 @@
+import os
+import shutil
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import file_corrector
+import run_of_case
+import convergence_monitor
+import case_snapshot
+import tracing
+
+"""
+Speculative correction: instead of committing to one LLM fix per round, several alternative fixes are generated
+concurrently, each in its own copy of the case (checked out from the round snapshot), smoke-tested in parallel, and
+the best candidate is copied back into the case.
+"""
+
+CANDIDATES_DIR = ".candidates"
+
+@dataclasses.dataclass
+class CandidateResult:
+    """Outcome of one speculative correction"""
+    index: int = dataclasses.field(default=0, metadata={"description": "Candidate number"})
+    strategy: str = dataclasses.field(default="", metadata={"description": "How the candidate was generated"})
+    case_path: str = dataclasses.field(default="", metadata={"description": "Case directory of the candidate"})
+    files_corrected: dict = dataclasses.field(default_factory=dict, metadata={"description": "Return value of file_corrector.correct_error"})
+    success: bool = dataclasses.field(default=False, metadata={"description": "Whether the smoke test ran without error"})
+    progress: int = dataclasses.field(default=0, metadata={"description": "Time steps completed by the smoke test"})
+    error: str = dataclasses.field(default="", metadata={"description": "Solver error of the smoke test"})
+
+def candidate_plans(error_files, n_candidates, temperature_step):
+    """Alternative ways to correct the error: all suspicious files, each suspicious file alone, then higher temperatures
+    Args:
+        error_files (dict): Suspicious files and reasons, from file_corrector.analyse_error
+        n_candidates (int): Number of plans to return
+        temperature_step (float): Temperature added for each further plan on all files
+    Returns:
+        plans (list): Elements as (strategy description, error files, temperature offset)
+    """
+    plans = [("all suspicious files", error_files, 0.0)]
+    if len(error_files) > 1:
+        for name, reason in error_files.items():
+            plans.append((f"only {name}", {name: reason}, 0.0))
+    step = 1
+    while len(plans) < n_candidates:
+        plans.append((f"all suspicious files, temperature +{step * temperature_step:g}", error_files, step * temperature_step))
+        step += 1
+    return plans[:n_candidates]
+
+def _run_candidate(job, base_snapshot, index, plan, running_error, relevant_reflections, parent_span=None):
+    strategy, error_files, temperature_offset = plan
+    case_path = os.path.join(job.output_case_path, CANDIDATES_DIR, f"candidate_{index}")
+    shutil.rmtree(case_path, ignore_errors=True)
+    job.snapshots.checkout(base_snapshot, case_path)
+
+    candidate_job = dataclasses.replace(
+        job,
+        output_case_path=case_path,
+        error_history=list(job.error_history),
+        correct_trajectory=list(job.correct_trajectory),
+        llm_temperature_offset=temperature_offset,
+        snapshots=None,
+        residual_log=None,
+        flag_case_success_run=False,
+    )
+    result = CandidateResult(index=index, strategy=strategy, case_path=case_path)
+    # Worker threads do not inherit the caller's context, the candidate job and span are activated explicitly
+    with config.use_job(candidate_job), tracing.span("speculative_candidate", parent=parent_span, index=index, strategy=strategy) as span:
+        try:
+            result.files_corrected = file_corrector.correct_error(running_error, error_files, job.case_info.file_structure, relevant_reflections) or {}
+            run_info = run_of_case.case_run(case_path, monitor=convergence_monitor.SmokeTestMonitor(config.run_cfg.smoke_test_steps))
+        except Exception as e:
+            run_info = f"Candidate failed: {e}"
+        span.set(success=run_info == "case run success.")
+    result.success = run_info == "case run success."
+    result.error = "" if result.success else str(run_info)
+    result.progress = candidate_job.residual_log.n_rows if candidate_job.residual_log is not None else 0
+    print(f"Candidate {index} ({strategy}): {'passed' if result.success else 'failed'} after {result.progress} time steps")
+    return result
+
+def correct_speculatively(running_error, relevant_reflections="", n_candidates=None):
+    """Generate, smoke-test and pick among several corrections of running_error
+    Args:
+        running_error (str): OpenFOAM error to correct
+        relevant_reflections (str): Reflection context for the prompts
+        n_candidates (int): Number of candidates, defaults to run_config.speculative_candidates
+    Returns:
+        files_corrected (dict): Corrections of the chosen candidate, same format as file_corrector.correct_error
+    """
+    job = config.current_job()
+    if n_candidates is None:
+        n_candidates = config.run_cfg.speculative_candidates
+
+    # The suspicious files are identified once, the candidates differ in how they are corrected
+    error_files = file_corrector.analyse_error(running_error, job.case_info.file_structure, relevant_reflections)
+    plans = candidate_plans(error_files, n_candidates, config.run_cfg.speculative_temperature_step)
+    base_snapshot = job.snapshots.take("speculative_base")
+
+    with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+        futures = [executor.submit(_run_candidate, job, base_snapshot, index, plan, running_error, relevant_reflections,
+                                   tracing.current_span())
+                   for index, plan in enumerate(plans)]
+        results = [future.result() for future in futures]
+
+    # Passing candidates first, then the one that ran furthest, then the plan order
+    best = max(results, key=lambda result: (result.success, result.progress, -result.index))
+    changed = case_snapshot.sync_case_files(best.case_path, job.output_case_path)
+    print(f"Adopted candidate {best.index} ({best.strategy}), changed files {changed}")
+    with open(f"{job.output_case_path}/error_history.txt", "a") as f:
+        summary = ", ".join(f"{result.index}: {'passed' if result.success else 'failed'}/{result.progress} steps" for result in results)
+        f.write(f"Speculative correction, candidates [{summary}], adopted candidate {best.index} ({best.strategy})\n")
+    # Candidate directories are kept for inspection until the next speculative round replaces them
+    return best.files_corrected
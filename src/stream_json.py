@@ -0,0 +1,185 @@
+import re
+import json
+
+import llm_extract
+
+"""
+Incremental validation of JSON answers streamed by the LLM.
+A StreamingJSONValidator is fed the answer chunk by chunk. It finds the JSON object in the answer (after optional
+prose or a ```json fence), tracks strings and brackets, validates every top-level field against the Pydantic model as
+soon as its value is complete, and reports when the object is closed or when the answer can no longer become a valid
+object, so that the stream can be closed without waiting for the rest of the answer.
+"""
+
+_FENCE_CHARS = set(" \t\r\n`")
+_CLOSERS = {"{": "}", "[": "]"}
+_QUOTES = "\"'"
+_BARE_KEY = re.compile(r'[A-Za-z_$][\w$\-]*')
+
+def _loads(text):
+    """json.loads, retried on the repaired text for the usual LLM defects (trailing commas, single quotes, ...)"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(llm_extract.repair_json(text))
+
+class StructuredOutputError(ValueError):
+    """Raised when no valid JSON object of the expected model could be obtained"""
+
+class StreamingJSONValidator:
+    """Validator of one streamed answer, reset() before each attempt"""
+    def __init__(self, pydantic_object, max_preamble=2000):
+        """
+        Args:
+            pydantic_object (type): Pydantic model the JSON object must validate against
+            max_preamble (int): Characters of prose allowed before the object starts
+        """
+        self.pydantic_object = pydantic_object
+        self.max_preamble = max_preamble
+        self._field_adapters = {}
+        self.reset()
+
+    def reset(self):
+        """Forget the answer fed so far"""
+        self._chunks = []
+        self._length = 0
+        self._start = -1            # Position of the opening brace of the object
+        self._stack = []            # Expected closing brackets
+        self._in_string = False
+        self._quote = None          # Quote that opened the current string, single quotes being repaired later
+        self._escape = False
+        self._preamble = 0
+        self._string_start = -1
+        self._expect_key = False    # At depth 1, the next string is a key
+        self._key = None
+        self._key_start = -1        # Start of the current key, for unquoted keys
+        self._value_start = -1
+        self.done = False
+        self.error = None
+        self.result = None
+
+    def _text(self, start, end):
+        return "".join(self._chunks)[start:end]
+
+    def _fail(self, message):
+        self.error = message
+        self.done = True
+        return True
+
+    def feed(self, chunk):
+        """Add a chunk of the answer
+        Returns:
+            done (bool): True once the object is closed (result is set) or the answer is known to be invalid (error is set)
+        """
+        if self.done or not chunk:
+            return self.done
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        for index, char in enumerate(chunk):
+            position = offset + index
+            if self._start < 0:
+                if char == "{":
+                    self._start = position
+                    self._stack.append("}")
+                    self._expect_key = True
+                    self._key_start = position + 1
+                elif char == "[" and self._text(0, position).strip(" \t\r\n`") in ("", "json"):
+                    # Only an answer that starts with the array, a bracket in the prose is part of the preamble
+                    return self._fail("The answer is a JSON array, a JSON object is expected")
+                elif char not in _FENCE_CHARS:
+                    self._preamble += 1
+                    if self._preamble > self.max_preamble:
+                        return self._fail(f"No JSON object in the first {self.max_preamble} characters of the answer")
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == self._quote:
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._expect_key:
+                        try:
+                            self._key = _loads(self._text(self._string_start, position + 1))
+                        except ValueError as e:
+                            return self._fail(f"Invalid key in the JSON object: {e}")
+                        self._expect_key = False
+                continue
+
+            if char in _QUOTES:
+                self._in_string = True
+                self._quote = char
+                self._string_start = position
+            elif char in _CLOSERS:
+                self._stack.append(_CLOSERS[char])
+            elif char in "}]":
+                if not self._stack or self._stack[-1] != char:
+                    return self._fail(f"Mismatched '{char}' at character {position - self._start} of the JSON object")
+                if len(self._stack) == 1:
+                    if self._value_start >= 0 and self._complete_field(position):
+                        return True
+                    self._stack.pop()
+                    return self._complete_object(position + 1)
+                self._stack.pop()
+            elif len(self._stack) == 1:
+                if char == ":":
+                    if self._key is None:
+                        bare_key = self._text(self._key_start, position).strip()
+                        if not _BARE_KEY.fullmatch(bare_key):
+                            return self._fail("Value without a key in the JSON object")
+                        self._key = bare_key
+                        self._expect_key = False
+                    self._value_start = position + 1
+                elif char == ",":
+                    if self._value_start >= 0 and self._complete_field(position):
+                        return True
+                    self._expect_key = True
+                    self._key = None
+                    self._key_start = position + 1
+                    self._value_start = -1
+        return False
+
+    def _field_adapter(self, name):
+        if name not in self._field_adapters:
+            from pydantic import TypeAdapter
+            field = self.pydantic_object.model_fields.get(name)
+            self._field_adapters[name] = TypeAdapter(field.annotation) if field is not None else None
+        return self._field_adapters[name]
+
+    def _complete_field(self, end):
+        """Validate the top-level value that ends at end, True if it is invalid"""
+        key, raw = self._key, self._text(self._value_start, end).strip()
+        adapter = self._field_adapter(key)
+        if adapter is None:
+            if self.pydantic_object.model_config.get("extra") == "forbid":
+                return self._fail(f"Unexpected field {key!r} in the JSON object")
+            return False
+        try:
+            adapter.validate_python(_loads(raw))
+        except Exception as e:
+            return self._fail(f"Invalid value of field {key!r}: {e}")
+        return False
+
+    def _complete_object(self, end):
+        text = self._text(self._start, end)
+        try:
+            self.result = self.pydantic_object.model_validate(_loads(text))
+        except Exception as e:
+            return self._fail(f"Invalid JSON object: {e}")
+        self.done = True
+        return True
+
+    def finish(self):
+        """Result once the stream has ended
+        Returns:
+            result (BaseModel): Validated object
+        Raises:
+            StructuredOutputError: If the answer had no complete valid object
+        """
+        if self.result is not None:
+            return self.result
+        if self.error is None:
+            self.error = "The answer ended before the JSON object was closed" if self._start >= 0 else "No JSON object in the answer"
+        raise StructuredOutputError(self.error)
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+import config
+
+"""
+Lightweight tracing of the pipeline stages.
+Spans are opened with `with tracing.span("name", key=value) as span:` (or start_span()/end() when a block cannot be
+indented), nest through a context variable, and carry attributes such as the file name, the solver or the tokens of an
+LLM call. A trace is the tree under a root span (one per case, see main_run_chatcfd.main); when the root span ends the
+trace is exported as Chrome trace JSON (open in chrome://tracing or https://ui.perfetto.dev) and/or sent as OTLP/HTTP
+JSON to a collector, following run_config.tracing. Spans cost nothing when tracing is disabled.
+"""
+
+_current_span = contextvars.ContextVar("chatcfd_span", default=None)
+_traces = {}                # trace_id -> finished spans of the traces whose root span is open
+_traces_lock = threading.Lock()
+
+def enabled():
+    return bool(config.run_cfg.tracing)
+
+class Span:
+    """A timed operation, with its parent and attributes"""
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.thread_id = threading.get_ident()
+        self.thread_name = threading.current_thread().name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self.trace_path = None      # Chrome trace file of a root span
+        self._token = None
+
+    def set(self, **attributes):
+        """Add attributes to the span"""
+        self.attributes.update(attributes)
+        return self
+
+    def end(self):
+        """End the span and make its parent current again; a root span exports its trace"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended in another context than the one it was started in
+                pass
+            self._token = None
+        with _traces_lock:
+            spans = _traces.get(self.trace_id)
+            if spans is not None:
+                spans.append(self)
+            if self.parent is None:
+                spans = _traces.pop(self.trace_id, [])
+        if self.parent is None:
+            export(spans, self.trace_path)
+
+    @property
+    def duration(self):
+        """Seconds between start and end (or now while the span is open)"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+class _NoopSpan:
+    """Returned when tracing is disabled"""
+    trace_id = span_id = None
+    attributes = {}
+
+    def set(self, **attributes):
+        return self
+
+    def end(self):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+def current_span():
+    """Innermost open span of the current context, None if there is none"""
+    return _current_span.get()
+
+def start_span(name, parent=None, root=False, **attributes):
+    """Start a span and make it current until its end()
+    Args:
+        name (str): Operation, e.g. "correction_round"
+        parent (Span): Parent span, defaults to the current span; needed in worker threads, which do not inherit it
+        root (bool): Start a new trace even inside an open span
+        **attributes: Attributes of the span
+    Returns:
+        span (Span): Open span, a no-op span when tracing is disabled
+    """
+    if not enabled():
+        return _NOOP_SPAN
+    if root:
+        parent = None
+    elif parent is None:
+        parent = _current_span.get()
+    span = Span(name, parent if isinstance(parent, Span) else None, attributes)
+    if span.parent is None:
+        with _traces_lock:
+            _traces[span.trace_id] = []
+    span._token = _current_span.set(span)
+    return span
+
+@contextmanager
+def span(name, parent=None, root=False, **attributes):
+    """Span around a block, e.g. `with tracing.span("solver", solver=solver) as span: ...`, errors are recorded on it"""
+    opened = start_span(name, parent, root, **attributes)
+    try:
+        yield opened
+    except BaseException as e:
+        if opened is not _NOOP_SPAN:
+            opened.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        opened.end()
+
+@contextmanager
+def trace(name, trace_path=None, **attributes):
+    """Root span of a new trace, whose Chrome trace is written to trace_path when it ends"""
+    with span(name, root=True, **attributes) as root:
+        if root is not _NOOP_SPAN:
+            root.trace_path = trace_path
+        yield root
+
+def traced(name=None):
+    """Decorator opening a span around each call of a function"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return function(*args, **kwargs)
+            with span(name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _attribute_value(value):
+    return value if isinstance(value, (bool, int, float, str)) or value is None else str(value)
+
+def chrome_trace(spans):
+    """Chrome trace event format of finished spans
+    Returns:
+        trace (dict): {"traceEvents": [...]}, one complete event per span and the names of the threads
+    """
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for span in sorted(spans, key=lambda span: span.start_ns):
+        threads.setdefault(span.thread_id, span.thread_name)
+        args = {key: _attribute_value(value) for key, value in span.attributes.items()}
+        args.update(span_id=span.span_id, parent_id=span.parent.span_id if span.parent is not None else None)
+        if span.error:
+            args["error"] = span.error
+        events.append({"name": span.name, "cat": "chatcfd", "ph": "X", "pid": pid, "tid": span.thread_id,
+                       "ts": span.start_ns / 1e3, "dur": (span.end_ns - span.start_ns) / 1e3, "args": args})
+    for thread_id, thread_name in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": "" if value is None else str(value)}
+
+def otlp_payload(spans, service_name="chatcfd"):
+    """OTLP/HTTP JSON request body (ExportTraceServiceRequest) of finished spans"""
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent is not None:
+            otlp_span["parentSpanId"] = span.parent.span_id
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "chatcfd.tracing"}, "spans": otlp_spans}],
+    }]}
+
+def export(spans, trace_path=None):
+    """Export the spans of a trace to the exporters of run_config.tracing ("chrome", "otlp" or "chrome,otlp"), failures are only reported"""
+    if not spans:
+        return
+    exporters = {name.strip() for name in config.run_cfg.tracing.split(",")}
+    if "chrome" in exporters and trace_path:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            with open(trace_path, 'w', encoding='utf-8') as f:
+                json.dump(chrome_trace(spans), f)
+            print(f"Trace of {len(spans)} spans written to {trace_path}")
+        except OSError as e:
+            print(f"Failed to write the trace: {e}")
+    if "otlp" in exporters:
+        import urllib.request
+        request = urllib.request.Request(config.run_cfg.tracing_otlp_endpoint, data=json.dumps(otlp_payload(spans)).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        except Exception as e:
+            print(f"Failed to send the trace to {config.run_cfg.tracing_otlp_endpoint}: {e}")
@@ -0,0 +1,181 @@
+import os
+import re
+import sys
+import json
+import time
+import glob
+import random
+import argparse
+
+# Benchmark of the JSON extraction of LLM answers: llm_extract.parse_json against the previous
+# extract_content_from_response, on recorded answers (qa_logs.jsonl of case runs) or on a synthetic corpus.
+# Both parsers are run on every answer for their success counts, the timings are taken on the answers both handle
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+import llm_extract
+
+def legacy_clean_json_string(json_str):
+    json_str = json_str.strip()
+    replacements = [
+        (r'\\(?!["\\/bfnrtu])', r'\\\\'),
+        (r'\\"', r'"'),
+        (r'\\n', r'\n'),
+        (r'\\t', r'\t'),
+        (r'\\r', r'\r'),
+    ]
+    for old, new in replacements:
+        json_str = re.sub(old, new, json_str)
+    return json_str
+
+def legacy_extract_json(llm_response):
+    """extract_content_from_response(llm_response, 'json') before llm_extract"""
+    llm_response = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', llm_response)
+    llm_response = json.dumps(llm_response)
+    for pattern in [r'```json\s*(.*?)\s*```', r'```\s*(.*?)\s*```', r'\[.*?\]']:
+        match = re.search(pattern, llm_response, re.DOTALL)
+        if match:
+            json_str = legacy_clean_json_string(match.group(1) if '```' in pattern else match.group(0))
+            try:
+                return json.loads(json_str)
+            except json.JSONDecodeError:
+                continue
+    try:
+        content = json.loads(llm_response.strip())
+    except:
+        start = llm_response.find('{')
+        start_ = llm_response.find('[')
+        if start < start_:
+            pos = start + 1
+            depth = 1
+            while pos < len(llm_response) and depth > 0:
+                if llm_response[pos] == '{':
+                    depth += 1
+                elif llm_response[pos] == '}':
+                    depth -= 1
+                pos += 1
+        else:
+            pos = start_ + 1
+            depth = 1
+            while pos < len(llm_response) and depth > 0:
+                if llm_response[pos] == '[':
+                    depth += 1
+                elif llm_response[pos] == ']':
+                    depth -= 1
+                pos += 1
+        content = json.loads(llm_response[start:pos])
+    return content
+
+def synthetic_corpus(count, seed=0):
+    """Answers in the shapes seen in the logs: fenced, with prose, Python dicts, trailing commas, truncated, and the
+    boundary type dicts and file lists that the legacy parser also handles"""
+    rng = random.Random(seed)
+    field = "FoamFile\n{\n    version 2.0;\n    class volScalarField;\n}\ndimensions [0 2 -2 0 0 0 0];\ninternalField uniform 0;\nboundaryField\n{\n    inlet { type fixedValue; value uniform 1; }\n}\n"
+    corpus = []
+    for index in range(count):
+        files = {f"0/f{i}": field * rng.randint(1, 20) for i in range(rng.randint(1, 8))}
+        body = json.dumps({"files_content": files}, indent=rng.choice([None, 2]))
+        shape = index % 8
+        if shape == 0:
+            answer = body
+        elif shape == 1:
+            answer = f"```json\n{body}\n```"
+        elif shape == 2:
+            answer = f"Here are the files you asked for.\n{body}\nLet me know if anything is missing."
+        elif shape == 3:
+            answer = "```json\n" + body[:-1].rstrip() + ",\n}\n```"
+        elif shape == 4:
+            answer = repr({"files": {name: "fixedValue" for name in files}})
+        elif shape == 5:
+            answer = body[:int(len(body) * 0.9)]
+        elif shape == 6:
+            patches = {f"patch{i}": rng.choice(["wall", "velocity-inlet", "pressure-outlet", "symmetry"])
+                       for i in range(rng.randint(5, 200))}
+            answer = "```json\n" + json.dumps({"boundary_types": patches}, indent=rng.choice([None, 2])) + "\n```"
+        else:
+            answer = f"The files to modify are {json.dumps(sorted(files) + [f'system/dict{i}' for i in range(rng.randint(1, 50))])}."
+        corpus.append(answer)
+    return corpus
+
+def recorded_corpus(paths):
+    """assistant_response of the qa_logs.jsonl files under paths that contain a JSON value"""
+    corpus = []
+    for path in paths:
+        files = glob.glob(os.path.join(path, "**", "qa_logs*.jsonl*"), recursive=True) if os.path.isdir(path) else [path]
+        for file_path in files:
+            if file_path.endswith(".zst"):
+                import zstandard
+                with open(file_path, 'rb') as f:
+                    lines = zstandard.ZstdDecompressor().stream_reader(f).read().decode('utf-8').splitlines()
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+            for line in lines:
+                try:
+                    response = json.loads(line).get("assistant_response") or ""
+                except ValueError:
+                    continue
+                if "{" in response or "[" in response:
+                    corpus.append(response)
+    return corpus
+
+def extract_all(extract, corpus):
+    """Value extracted from each answer, None when the extraction fails or does not give a dict or a list"""
+    values = []
+    for answer in corpus:
+        try:
+            value = extract(answer)
+        except Exception:
+            value = None
+        values.append(value if isinstance(value, (dict, list)) else None)
+    return values
+
+def run(extract, corpus, repeat):
+    times = []
+    for answer in corpus:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                extract(answer)
+            except Exception:
+                pass
+        times.append((time.perf_counter() - start) / repeat)
+    times.sort()
+    return {
+        "answers": len(corpus),
+        "total_ms": round(sum(times) * 1e3, 3),
+        "mean_ms": round(sum(times) / max(len(times), 1) * 1e3, 4),
+        "p95_ms": round(times[int(0.95 * (len(times) - 1))] * 1e3, 4) if times else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the JSON extraction of LLM answers")
+    parser.add_argument("paths", nargs="*", help="qa_logs.jsonl files or directories of case runs, synthetic corpus if empty")
+    parser.add_argument("--count", type=int, default=600, help="Answers of the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=5, help="Extractions per answer")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    corpus = recorded_corpus(args.paths) if args.paths else synthetic_corpus(args.count)
+    legacy_values = extract_all(legacy_extract_json, corpus)
+    values = extract_all(llm_extract.parse_json, corpus)
+    # Timings only compare the answers both parsers extract to the same value, a fast failure is not a speedup
+    common = [answer for answer, legacy_value, value in zip(corpus, legacy_values, values)
+              if legacy_value is not None and legacy_value == value]
+    results = {
+        "corpus": "recorded" if args.paths else "synthetic",
+        "answers": len(corpus),
+        "parsed": {"legacy": sum(value is not None for value in legacy_values),
+                   "llm_extract": sum(value is not None for value in values)},
+        "common_answers": len(common),
+        "legacy": run(legacy_extract_json, common, args.repeat),
+        "llm_extract": run(llm_extract.parse_json, common, args.repeat),
+    }
+    results["speedup"] = round(results["legacy"]["total_ms"] / results["llm_extract"]["total_ms"], 2) if common else None
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
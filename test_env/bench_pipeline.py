@@ -0,0 +1,425 @@
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import resource
+import argparse
+import functools
+import threading
+import contextlib
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+# End-to-end benchmark of main_run_chatcfd.main over a corpus of cases, against the real LLM and OpenFOAM or against
+# the stand-ins (mock_llm_server replaying recorded answers, fake_openfoam scenarios). Records the wall time of each
+# pipeline stage and correction round, LLM calls and tokens, peak RSS and the success rate, writes them as JSON and
+# compares them with a baseline result.
+#
+# Corpus file (paths relative to it), tutorial_cases optionally replacing processed_merged_OF_cases.json:
+#     {"tutorial_cases": "tutorial_cases.json",
+#      "cases": [{"name": "cavity", "description": "cavity.txt", "mesh": "cavity.msh", "grid_type": "msh",
+#                 "solver": "icoFoam", "turbulence_model": null, "case_description": "Lid-driven cavity at Re 10",
+#                 "runs": 1}]}
+# Every benchmark starts from a copy of the database directory with empty reflection and experience stores, so that
+# its runs do not depend on the fixes learned by earlier runs.
+#
+# The committed corpus test_env/bench_corpus holds two lid-driven cavities on a 10 x 10 Fluent mesh, one passing at the
+# first run and one whose first run fails on a missing div(phi,U) scheme, fixed by one correction round. Its recorded
+# answers replay on the fake OpenFOAM with the latencies measured when they were recorded on a local endpoint, so the
+# timings are those of the pipeline itself; pass --latency (e.g. lognormal:8,0.5) to add provider-like LLM latencies.
+#     python test_env/bench_pipeline.py test_env/bench_corpus/corpus.json \
+#         --mock-llm test_env/bench_corpus/recordings.jsonl --fake-openfoam test_env/bench_corpus/scenarios.json \
+#         --hashing-embedder --baseline test_env/bench_corpus/baseline.json
+# baseline.json is the output of this command. Prompts quoting the case path (solver errors) only match their recording
+# in a checkout at the same path, elsewhere the mock server answers them with the nearest recording ("mock_llm" of the
+# results counts both).
+# --mock-llm and --record take a replay store (llm_replay), or a .jsonl export of one. --hashing-embedder replaces the
+# SentenceTransformer of the case description retrieval with the model-free embedding of reflection_store, for
+# machines without the model; a .txt description is a single chunk, so the prompts do not change.
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+import config
+import qa_modules
+import run_of_case
+import file_preparation
+import main_run_chatcfd
+import pdf_chunk_ask_question
+import speculative_correction
+
+# (owner, attribute, stage) of the functions timed by the benchmark, stages may be nested (embedding is part of
+# initial_generation, llm_call of every stage that asks the LLM)
+TIMED_STAGES = [
+    (main_run_chatcfd, "process_pdf_pdfplumber", "pdf_ingest"),
+    (pdf_chunk_ask_question, "load_embedder", "embedding_model_load"),
+    (pdf_chunk_ask_question.CFDCaseExtractor, "process_pdf", "embedding"),
+    (file_preparation, "convert_mesh", "mesh_conversion"),
+    (file_preparation, "generate_initial_files", "initial_generation"),
+    (file_preparation, "check_file_format", "format_check"),
+    (qa_modules, "routed_call", "llm_call"),
+]
+
+# Metrics where a lower value is better, compared with the baseline
+LOWER_IS_BETTER = ["wall_seconds", "median_case_seconds", "p95_case_seconds", "mean_rounds", "llm_calls",
+                   "prompt_tokens", "completion_tokens", "cost", "peak_rss_mb"]
+
+class StageTimer:
+    """Wall time of the timed functions, per case (the case_name of the job active when the function is called)"""
+    def __init__(self):
+        self.events = {}    # case_name -> [(stage, start, end, info)]
+        self._patches = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, end, info=None):
+        case_name = config.current_job().case_name
+        with self._lock:
+            self.events.setdefault(case_name, []).append((stage, start, end, info or {}))
+
+    def wrap(self, owner, attribute, stage):
+        original = getattr(owner, attribute)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(stage, start, time.perf_counter())
+        setattr(owner, attribute, timed)
+        self._patches.append((owner, attribute, original))
+
+    def wrap_case_run(self):
+        """Time solver runs, keeping their result; runs of speculative candidates are smoke tests"""
+        original = run_of_case.case_run
+
+        @functools.wraps(original)
+        def timed(case_path, *args, **kwargs):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = original(case_path, *args, **kwargs)
+                return result
+            finally:
+                stage = "smoke_test" if speculative_correction.CANDIDATES_DIR in case_path else "solver"
+                self.add(stage, start, time.perf_counter(), {"success": result == "case run success."})
+        run_of_case.case_run = timed
+        self._patches.append((run_of_case, "case_run", original))
+
+    def install(self):
+        for owner, attribute, stage in TIMED_STAGES:
+            self.wrap(owner, attribute, stage)
+        self.wrap_case_run()
+
+    def restore(self):
+        for owner, attribute, original in reversed(self._patches):
+            setattr(owner, attribute, original)
+        self._patches = []
+
+    def case_stages(self, case_name, case_end):
+        """Stage totals and correction rounds of a case
+        Returns:
+            stages (dict): stage -> {"calls", "seconds"}
+            rounds (list): One element per solver run, {"round", "solver_seconds", "correction_seconds", "success"},
+                correction_seconds being the time from the end of a failed run to the next run (or the end of the case)
+        """
+        with self._lock:
+            events = sorted(self.events.get(case_name, []), key=lambda event: event[1])
+        stages = {}
+        for stage, start, end, _ in events:
+            totals = stages.setdefault(stage, {"calls": 0, "seconds": 0.0})
+            totals["calls"] += 1
+            totals["seconds"] += end - start
+        runs = [event for event in events if event[0] == "solver"]
+        rounds = []
+        for index, (_, start, end, info) in enumerate(runs):
+            following = runs[index + 1][1] if index + 1 < len(runs) else case_end
+            rounds.append({
+                "round": index,
+                "solver_seconds": round(end - start, 4),
+                "correction_seconds": round(following - end, 4) if not info["success"] else 0.0,
+                "success": info["success"],
+            })
+        if any(not entry["success"] for entry in rounds):
+            stages["correction"] = {"calls": sum(not entry["success"] for entry in rounds),
+                                    "seconds": sum(entry["correction_seconds"] for entry in rounds)}
+        for totals in stages.values():
+            totals["seconds"] = round(totals["seconds"], 4)
+        return stages, rounds
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest finished child (the solvers), in MB"""
+    scale = 1.0 / 1024 if sys.platform != "darwin" else 1.0 / (1024 * 1024)
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1))
+
+def load_corpus(corpus_path):
+    """Read a corpus file
+    Returns:
+        cases (list): Case entries with absolute paths and defaults filled in
+        tutorial_cases (str): Absolute path of the tutorial case database of the corpus, None to use the configured one
+    """
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    base = os.path.dirname(os.path.abspath(corpus_path))
+    tutorial_cases = os.path.join(base, corpus["tutorial_cases"]) if corpus.get("tutorial_cases") else None
+    cases = []
+    for entry in corpus["cases"]:
+        entry = dict(entry)
+        for key in ("description", "mesh"):
+            entry[key] = os.path.join(base, entry[key])
+        entry.setdefault("grid_type", "polyMesh" if os.path.isdir(entry["mesh"]) else "msh")
+        entry.setdefault("turbulence_model", None)
+        entry.setdefault("runs", 1)
+        cases.append(entry)
+    return cases, tutorial_cases
+
+def setup_database(tutorial_cases=None):
+    """Point the pipeline at a fresh copy of the JSON files of the database directory
+    Args:
+        tutorial_cases (str): Used as processed_merged_OF_cases.json when given
+    """
+    database_dir = os.path.join(config.path_cfg.temp_dir, "bench_database")
+    shutil.rmtree(database_dir, ignore_errors=True)
+    os.makedirs(database_dir)
+    for path in glob.glob(os.path.join(config.path_cfg.database_dir, "*.json")):
+        shutil.copy(path, database_dir)
+    if tutorial_cases:
+        shutil.copy(tutorial_cases, os.path.join(database_dir, "processed_merged_OF_cases.json"))
+    config.path_cfg.database_dir = database_dir
+    config.OF_data_path = os.path.join(database_dir, "processed_merged_OF_cases.json")
+
+def replay_store_path(path, name):
+    """SQLite replay store for --mock-llm or --record: path itself, or a fresh store in the temporary directory for a
+    .jsonl export, filled with its recordings when the file exists"""
+    if not path.endswith(".jsonl"):
+        return path
+    import llm_replay
+    store_path = os.path.join(config.path_cfg.temp_dir, f"bench_{name}.sqlite")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(store_path + suffix):
+            os.remove(store_path + suffix)
+    if name == "replay" and os.path.exists(path):
+        llm_replay.ReplayStore(store_path).import_jsonl(path)
+    return store_path
+
+def run_case(entry, run_index, timer, output_root):
+    """Run one case through main_run_chatcfd.main and collect its metrics"""
+    case_name = f"bench_{entry['name']}_{run_index}"
+    output_case_path = os.path.join(output_root, case_name)
+    job = config.new_job(case_name, output_case_path)
+    job.pdf_path = entry["description"]
+    job.grid_path = entry["mesh"]
+    job.grid_type = entry["grid_type"]
+    job.case_info.case_name = entry["name"]
+    job.case_info.case_solver = entry["solver"]
+    job.case_info.turbulence_model = entry["turbulence_model"]
+    job.case_info.other_physical_model = entry.get("other_physical_model", "")
+    job.case_info.case_description = entry.get("case_description", "")
+
+    error = ""
+    start = time.perf_counter()
+    try:
+        main_run_chatcfd.main(case_name, job)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    end = time.perf_counter()
+
+    stages, rounds = timer.case_stages(case_name, end)
+    usage = qa_modules.GlobalLogManager.usage_summary(case_name)
+    calls_by_stage = {}
+    for row in usage:
+        calls_by_stage[row["stage"]] = calls_by_stage.get(row["stage"], 0) + row["calls"]
+    return {
+        "case": entry["name"],
+        "run": run_index,
+        "success": bool(job.flag_case_success_run),
+        "error": error,
+        "wall_seconds": round(end - start, 4),
+        "rounds": rounds,
+        "stages": stages,
+        "llm": {
+            "calls": sum(row["calls"] for row in usage),
+            "prompt_tokens": sum(row["prompt_tokens"] for row in usage),
+            "completion_tokens": sum(row["response_tokens"] + row["reasoning_tokens"] for row in usage),
+            "cost": round(sum(row["cost"] for row in usage), 6),
+            "calls_by_stage": calls_by_stage,
+        },
+        # High-water mark of the process when the case ended, shared by the cases run at the same time
+        "peak_rss_mb": peak_rss_mb()[0],
+    }
+
+def summarize(results, wall_seconds):
+    case_seconds = sorted(result["wall_seconds"] for result in results)
+    stages = {}
+    for result in results:
+        for stage, totals in result["stages"].items():
+            summary = stages.setdefault(stage, {"calls": 0, "seconds": 0.0})
+            summary["calls"] += totals["calls"]
+            summary["seconds"] = round(summary["seconds"] + totals["seconds"], 4)
+    peak_self, peak_children = peak_rss_mb()
+    return {
+        "cases": len(results),
+        "success_rate": round(sum(result["success"] for result in results) / max(len(results), 1), 4),
+        "wall_seconds": round(wall_seconds, 4),
+        "median_case_seconds": round(statistics.median(case_seconds), 4) if case_seconds else 0.0,
+        "p95_case_seconds": case_seconds[min(int(0.95 * len(case_seconds)), len(case_seconds) - 1)] if case_seconds else 0.0,
+        "mean_rounds": round(statistics.mean(len(result["rounds"]) for result in results), 3) if results else 0.0,
+        "llm_calls": sum(result["llm"]["calls"] for result in results),
+        "prompt_tokens": sum(result["llm"]["prompt_tokens"] for result in results),
+        "completion_tokens": sum(result["llm"]["completion_tokens"] for result in results),
+        "cost": round(sum(result["llm"]["cost"] for result in results), 6),
+        "peak_rss_mb": peak_self,
+        "peak_child_rss_mb": peak_children,
+        "stages": stages,
+    }
+
+def compare(summary, baseline, tolerance, min_seconds=0.0):
+    """Relative change of each metric against the baseline summary
+    Args:
+        tolerance (float): Relative change above which a metric is a regression
+        min_seconds (float): Smallest slowdown of a time metric reported as a regression, the jitter of short stages
+            is often larger than tolerance
+    Returns:
+        changes (dict): metric -> {"baseline", "current", "change"}
+        regressions (list): Metrics worse than the baseline by more than tolerance
+    """
+    changes = {}
+    regressions = []
+    metrics = [(name, summary.get(name), baseline.get(name)) for name in LOWER_IS_BETTER]
+    metrics += [(f"stage.{stage}.seconds", summary["stages"][stage]["seconds"], baseline["stages"][stage]["seconds"])
+                for stage in summary["stages"] if stage in baseline.get("stages", {})]
+    for name, current, previous in metrics:
+        if current is None or previous is None:
+            continue
+        change = (current - previous) / previous if previous else (0.0 if current == previous else float("inf"))
+        changes[name] = {"baseline": previous, "current": current, "change": round(change, 4)}
+        if change > tolerance and not (name.endswith("seconds") and current - previous < min_seconds):
+            regressions.append(name)
+    drop = baseline.get("success_rate", 0.0) - summary["success_rate"]
+    changes["success_rate"] = {"baseline": baseline.get("success_rate"), "current": summary["success_rate"], "change": round(-drop, 4)}
+    if drop > 0:
+        regressions.append("success_rate")
+    return changes, regressions
+
+class HashingEmbedder:
+    """Model-free stand-in for the SentenceTransformer of pdf_chunk_ask_question"""
+    def encode(self, texts, **kwargs):
+        import reflection_store
+        return reflection_store.embed(list(texts), "hashing")[1]
+
+def setup_stand_ins(args):
+    """Point the pipeline at the mock LLM server and the fake OpenFOAM installation
+    Returns:
+        server (MockLLMServer): Running mock server, None when the real LLM is used
+    """
+    server = None
+    if args.mock_llm:
+        import mock_llm_server
+        store_path = replay_store_path(os.path.abspath(args.mock_llm), "replay")
+        server = mock_llm_server.start_server(store_path, latency=args.latency, on_miss=args.on_miss, seed=args.seed)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        for role in ("V3", "R1"):
+            os.environ[f"DEEPSEEK_{role}_BASE_URL"] = base_url
+            os.environ[f"DEEPSEEK_{role}_KEY"] = "mock"
+        # Rebuilt from the environment on the next call
+        qa_modules._router = None
+    if args.record:
+        config.llm_cfg.llm_record_path = replay_store_path(os.path.abspath(args.record), "record")
+    if args.fake_openfoam:
+        import fake_openfoam
+        with open(args.fake_openfoam, 'r', encoding='utf-8') as f:
+            scenarios = json.load(f)
+        root = fake_openfoam.create_installation(os.path.join(config.path_cfg.temp_dir, "fake_openfoam"), scenarios)
+        config.dependencies_cfg.OpenFOAM_path = root
+        config.dependencies_cfg.OpenFOAM_tutorials_path = os.path.join(root, "tutorials")
+        config.of_path = root
+        config.config_manager.openfoam_env_snapshot = None
+    if args.hashing_embedder:
+        # Loaded once per process by load_embedder, whichever model name CFDCaseExtractor asks for
+        for model_name in (config.sentence_transformer_path, 'sentence-transformers/all-mpnet-base-v2'):
+            pdf_chunk_ask_question._embedders[model_name] = HashingEmbedder()
+    if args.max_rounds is not None:
+        config.max_running_test_round = config.run_cfg.max_running_test_round = args.max_rounds
+    if args.solver_timeout is not None:
+        config.run_cfg.solver_timeout = args.solver_timeout
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the ChatCFD pipeline")
+    parser.add_argument("corpus", help="JSON file of the cases to run")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.25, help="Smallest slowdown of a time metric reported as a regression")
+    parser.add_argument("--workers", type=int, default=1, help="Cases run at the same time")
+    parser.add_argument("--mock-llm", help="Replay store (llm_replay) served by a mock LLM server instead of the real LLM")
+    parser.add_argument("--latency", default="recorded", help="Latency distribution of the mock LLM server")
+    parser.add_argument("--on-miss", choices=("error", "nearest"), default="nearest", help="Mock answer to unrecorded prompts")
+    parser.add_argument("--record", help="Record the LLM calls of this run into a replay store")
+    parser.add_argument("--fake-openfoam", help="Scenarios JSON of a fake OpenFOAM installation used instead of OpenFOAM_path")
+    parser.add_argument("--hashing-embedder", action="store_true", help="Embed the case descriptions without the SentenceTransformer model")
+    parser.add_argument("--max-rounds", type=int, help="Correction rounds per case, defaults to max_running_test_round")
+    parser.add_argument("--solver-timeout", type=float, help="Seconds before a solver run is killed")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the mock latencies")
+    parser.add_argument("--log", help="Write the pipeline output to this file instead of the console")
+    args = parser.parse_args()
+
+    cases, tutorial_cases = load_corpus(args.corpus)
+    setup_database(tutorial_cases)
+    server = setup_stand_ins(args)
+    output_root = os.path.join(config.path_cfg.output_dir, "benchmark")
+    timer = StageTimer()
+    timer.install()
+    runs = [(entry, run_index) for entry in cases for run_index in range(entry["runs"])]
+
+    log_file = open(args.log, 'w', encoding='utf-8') if args.log else None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log_file) if log_file else contextlib.nullcontext():
+            with ThreadPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+                results = list(executor.map(lambda run: run_case(run[0], run[1], timer, output_root), runs))
+    finally:
+        wall_seconds = time.perf_counter() - start
+        timer.restore()
+        if log_file:
+            log_file.close()
+        if server is not None:
+            server.shutdown()
+        if args.record and args.record.endswith(".jsonl"):
+            import llm_replay
+            llm_replay.ReplayStore(config.llm_cfg.llm_record_path).export_jsonl(args.record)
+
+    report = {
+        "corpus": os.path.abspath(args.corpus),
+        "stand_ins": {"mock_llm": bool(args.mock_llm), "fake_openfoam": bool(args.fake_openfoam),
+                      "hashing_embedder": args.hashing_embedder},
+        # Prompts answered by their own recording (hits) or by the nearest one
+        "mock_llm": dict(server.counters) if server is not None else None,
+        "workers": args.workers,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "summary": summarize(results, wall_seconds),
+        "cases": results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report["comparison"], regressions = compare(report["summary"], baseline["summary"], args.tolerance, args.min_seconds)
+        report["regressions"] = regressions
+
+    print(json.dumps({key: report[key] for key in ("summary", "comparison", "regressions") if key in report}, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if regressions:
+        print(f"Regressions against {args.baseline}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    if os.environ.get("PYTHONHASHSEED") != "0":
+        # The prompts list sets of file names, a fixed hash seed keeps their order, and so the replay keys, run to run
+        os.environ["PYTHONHASHSEED"] = "0"
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# Round trip of the list payloads elided by foam_payload: read_compact(), an edit of the text, write_with_payloads()
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+import foam_payload
+
+def field_file(n_cells=5000, n_faces=300):
+    vectors = "\n".join(f"({i * 1e-3:.6g} {-i * 2e-3:.6g} {i % 7})" for i in range(n_cells))
+    scalars = "\n".join(f"{i * 0.5:.6g}" for i in range(n_faces))
+    return f"""FoamFile
+{{
+    version     2.0;
+    format      ascii;
+    class       volVectorField;
+    object      U;
+}}
+dimensions      [0 1 -1 0 0 0 0];
+internalField   nonuniform List<vector> {n_cells}
+(
+{vectors}
+)
+;
+boundaryField
+{{
+    inlet
+    {{
+        type            fixedValue;
+        value           nonuniform List<scalar> 3 (1 2 3);
+    }}
+    outlet
+    {{
+        type            zeroGradient;
+        value           nonuniform List<scalar> {n_faces}
+(
+{scalars}
+)
+;
+    }}
+}}
+"""
+
+def test_round_trip():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "U")
+        original = field_file()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(original)
+
+        # Small chunks so that the payloads span several reads
+        text, payloads = foam_payload.read_compact(path, chunk_size=4096)
+        assert len(payloads["ranges"]) == 2, payloads["ranges"]
+        assert "(1 2 3)" in text and len(text) < 2000, "Short lists are kept, long ones are elided"
+        for start, end in payloads["ranges"]:
+            assert original[start] == "(" and original[end - 1] == ")"
+
+        edited = text.replace("zeroGradient", "inletOutlet")
+        expected = original.replace("zeroGradient", "inletOutlet")
+        foam_payload.write_with_payloads(os.path.join(directory, "U.copy"), edited, payloads, chunk_size=4096)
+        with open(os.path.join(directory, "U.copy"), 'r', encoding='utf-8') as f:
+            assert f.read() == expected, "Payload bytes changed in the copy"
+
+        # In place, the payloads are read from the file being replaced
+        foam_payload.write_with_payloads(path, edited, payloads, chunk_size=4096)
+        with open(path, 'r', encoding='utf-8') as f:
+            assert f.read() == expected, "Payload bytes changed in place"
+        print("Payloads restored byte for byte")
+
+        # The source changed since it was read: nothing is written
+        _, stale_payloads = foam_payload.read_compact(path)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("// changed\n")
+        stale_text = edited.replace("payload 1:", "payload 0:")
+        _expect_refused(path, stale_text, stale_payloads)
+
+        # A placeholder without payload would leave an empty list in the field
+        text, payloads = foam_payload.read_compact(path)
+        _expect_refused(path, text.replace("payload 1:", "payload 7:"), payloads)
+        _expect_refused(path, text, None)
+        # Failure while copying: the partly written temporary file is removed
+        payloads["ranges"][1] = (payloads["ranges"][1][0], payloads["size"] + 100)
+        _expect_refused(path, text, payloads)
+        print("Invalid placeholders refused, file and directory untouched")
+    finally:
+        shutil.rmtree(directory)
+
+def _expect_refused(path, text, payloads):
+    with open(path, 'rb') as f:
+        before = f.read()
+    try:
+        foam_payload.write_with_payloads(path, text, payloads)
+    except ValueError as e:
+        print(f"Refused: {e}")
+    else:
+        raise AssertionError("write_with_payloads accepted an invalid text")
+    with open(path, 'rb') as f:
+        assert f.read() == before, "The file was modified"
+    leftovers = [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")]
+    assert not leftovers, f"Temporary files left: {leftovers}"
+
+if __name__ == "__main__":
+    test_round_trip()
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+# Importing the pipeline must not pull in the ML stacks, they are loaded when a case is processed
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+IMPORT_BUDGET_S = float(os.environ.get("CHATCFD_IMPORT_BUDGET", "1.5"))
+HEAVY_MODULES = ["torch", "faiss", "sentence_transformers", "langchain", "pdfplumber", "openai", "tiktoken"]
+
+CHECK_CODE = f"""
+import sys, time
+t0 = time.perf_counter()
+import main_run_chatcfd
+print(time.perf_counter() - t0)
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+def test_import_time():
+    # Fresh interpreter so that nothing is already cached in sys.modules
+    output = subprocess.run([sys.executable, "-c", CHECK_CODE], cwd=SRC_DIR, check=True, text=True, capture_output=True)
+    lines = output.stdout.splitlines()
+    elapsed, loaded = float(lines[-2]), lines[-1]
+
+    print(f"Import time of main_run_chatcfd: {elapsed:.3f} s (budget {IMPORT_BUDGET_S} s)")
+    print(f"Heavy modules loaded at import: {loaded or 'none'}")
+    assert not loaded, f"Heavy modules imported at import time: {loaded}"
+    assert elapsed < IMPORT_BUDGET_S, f"Import took {elapsed:.3f} s, budget is {IMPORT_BUDGET_S} s"
+
+if __name__ == "__main__":
+    test_import_time()